@@ -0,0 +1,133 @@
+'''
+Async-native (ASGI) versions of the hot API endpoints.
+
+Reads use Django's async ORM, so a request waiting on Postgres does not
+hold a worker thread. Django transactions are not async-aware yet, so
+the fare write path (quota reservation + INSERT in one transaction)
+runs in a worker thread via sync_to_async.
+
+These views are routed instead of the DRF ones when API_ASYNC_VIEWS is
+enabled; see api/urls.py. Request and response bodies are the same.
+'''
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views import View
+from rest_framework import status
+
+from fare.models import Journey
+from fare.quota import ajourneys_on
+
+from .renderers import FastJSONRenderer
+from .serializers import JourneyCalculationSerializer
+from .idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER
+from .services import (
+    HISTORY_CACHE,
+    calculate_fares_once,
+    history_body,
+    history_cache_slot,
+    pin_recent_writer,
+    prepare_history_page,
+    wants_count,
+)
+
+_renderer = FastJSONRenderer()
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    # Same renderer, so the same bytes, as the DRF views
+    return HttpResponse(_renderer.render(data), content_type='application/json', status=status_code)
+
+
+def _error(message, status_code=status.HTTP_400_BAD_REQUEST):
+    return _json({'success': False, 'error': message}, status_code)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncCalculateFareView(View):
+    '''
+    POST /api/calculate-fare/ - see CalculateFareAPIView.
+    '''
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'null')
+        except ValueError:
+            return _error('Request body must be JSON')
+
+        serializer = JourneyCalculationSerializer(data=data)
+        if not serializer.is_valid():
+            return _json({'success': False, 'errors': serializer.errors}, status.HTTP_400_BAD_REQUEST)
+
+        status_code, body, replayed = await sync_to_async(calculate_fares_once)(
+            request.headers.get(IDEMPOTENCY_HEADER),
+            serializer.validated_data['user_id'],
+            serializer.validated_data['journeys'],
+        )
+        response = _json(body, status_code)
+        if replayed:
+            response[REPLAYED_HEADER] = 'true'
+        return response
+
+
+async def _journey_history_page(request, journeys, **extra):
+    '''Async counterpart of api.views.journey_history_page.'''
+    params = request.GET
+
+    slot = await sync_to_async(history_cache_slot)(extra['user_id'], params) if 'user_id' in extra else None
+    if slot:
+        key, generation = slot
+        data = await sync_to_async(HISTORY_CACHE.get)(key, version=generation)
+        if data is not None:
+            return _json(data)
+
+    try:
+        journeys, paginator, page_size = prepare_history_page(journeys, params)
+        rows, next_cursor = await paginator.apaginate(journeys, page_size, params.get('cursor'))
+    except ValueError as e:
+        return _error(str(e))
+
+    data = history_body(rows, next_cursor, page_size, **extra)
+    if wants_count(params):
+        data['count'] = await journeys.acount()
+    if slot:
+        await sync_to_async(HISTORY_CACHE.set)(key, data, version=generation)
+    return _json(data)
+
+
+class AsyncJourneyHistoryView(View):
+    '''
+    GET /api/journeys/ - see JourneyHistoryAPIView.
+    '''
+
+    async def get(self, request):
+        return await _journey_history_page(request, Journey.objects.all())
+
+
+class AsyncUserJourneyHistoryView(View):
+    '''
+    GET /api/users/{user_id}/journeys/ - see UserJourneyHistoryAPIView.
+    '''
+
+    async def get(self, request, user_id=None):
+        user_id = user_id or request.GET.get('user_id')
+        if not user_id:
+            return _error('user_id is required')
+        journeys = Journey.objects.filter(user_id=user_id)
+        return await _journey_history_page(request, journeys, user_id=user_id)
+
+
+class AsyncUserJourneyCountView(View):
+    '''
+    GET /api/users/{user_id}/journeys/count - see UserJourneyHistoryCountAPIView.
+    '''
+
+    async def get(self, request, user_id=None):
+        user_id = user_id or request.GET.get('user_id')
+        if not user_id:
+            return _error('user_id is required')
+        await sync_to_async(pin_recent_writer)(user_id)
+        return _json({'count': await ajourneys_on(user_id)})
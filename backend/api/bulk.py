@@ -0,0 +1,261 @@
+"""
+Bulk journey ingestion for gate controllers.
+
+A controller uploads many users' taps in one request, as columns rather
+than one object per record:
+
+    {
+        "user_id":   ["u1", "u2", "u1"],
+        "from_zone": ["1", "2", "1"],
+        "to_zone":   ["2", "2", "3"],
+        "timestamp": ["2025-03-01T08:15:00+00:00", ...]    (optional)
+    }
+
+The whole upload is priced with one vectorized pass over the fare
+matrix, daily quotas are reserved for every (user, travel day) at once
+(fare.quota.reserve_available), and accepted journeys are written with
+multi-row INSERTs in the same transaction. Records are accepted or
+rejected individually; the response lists a status code and fare per
+record, in upload order.
+"""
+import datetime
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from fare.models import Journey, travel_date_of
+from fare.quota import reserve_available
+from fare.rollups import record_journeys
+from fare.rules import get_rule_snapshot
+
+from .idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyConflict, fingerprint, run_once, validate_key
+from .services import HISTORY_CACHE
+
+COLUMNS = ('user_id', 'from_zone', 'to_zone')
+
+# Per-record status codes; a code is its index in this tuple
+STATUS_CODES = ('accepted', 'invalid_record', 'invalid_zone', 'quota_exceeded')
+ACCEPTED, INVALID_RECORD, INVALID_ZONE, QUOTA_EXCEEDED = range(len(STATUS_CODES))
+
+# Gate clocks may run slightly ahead of ours
+MAX_CLOCK_SKEW = datetime.timedelta(minutes=5)
+
+USER_ID_MAX_LENGTH = Journey._meta.get_field('user_id').max_length
+
+
+def parse_columns(data) -> Tuple[List, List, List, List]:
+    """
+    Validate the shape of an upload and return its columns.
+
+    Individual values are checked later, per record.
+
+    Raises:
+        ValueError: If the upload as a whole is malformed
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object of columns')
+    columns = []
+    for name in COLUMNS + ('timestamp',):
+        column = data.get(name)
+        if column is None and name == 'timestamp':
+            column = [None] * len(columns[0])
+        if not isinstance(column, list):
+            raise ValueError(f'{name} must be a list')
+        columns.append(column)
+
+    sizes = {len(column) for column in columns}
+    if len(sizes) != 1:
+        raise ValueError(f'{", ".join(COLUMNS)} and timestamp must have the same length')
+    size = sizes.pop()
+    if not size:
+        raise ValueError('No records')
+    if size > settings.JOURNEY_BULK_MAX_RECORDS:
+        raise ValueError(f'At most {settings.JOURNEY_BULK_MAX_RECORDS} records per request')
+    return tuple(columns)
+
+
+def _zone(value):
+    # Same coercion as the CharField on POST /api/calculate-fare/
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+def _timestamp(value, now, latest):
+    if value is None:
+        return now
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None or parsed > latest:
+        return None
+    return parsed
+
+
+def insert_journeys(journeys: List[Journey]) -> None:
+    """
+    Write journeys with multi-row INSERTs of settings.JOURNEY_BULK_BATCH_SIZE
+    rows, skipping bulk_create()'s per-field work. travel_date must already
+    be set; ids are not read back.
+    """
+    ops = connection.ops
+    table = ops.quote_name(Journey._meta.db_table)
+    batch_size = settings.JOURNEY_BULK_BATCH_SIZE
+    with connection.cursor() as cursor:
+        for start in range(0, len(journeys), batch_size):
+            batch = journeys[start:start + batch_size]
+            params = []
+            for journey in batch:
+                params += [
+                    journey.user_id, journey.from_zone, journey.to_zone, journey.fare,
+                    ops.adapt_datetimefield_value(journey.timestamp), ops.adapt_datefield_value(journey.travel_date),
+                ]
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, from_zone, to_zone, fare, timestamp, travel_date) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))}',
+                params,
+            )
+
+
+def ingest_journeys(data) -> Tuple[int, Dict]:
+    """
+    Price, quota-check and store an upload.
+
+    Returns:
+        (status_code, response body)
+    """
+    try:
+        user_ids, from_zones, to_zones, timestamps = parse_columns(data)
+    except ValueError as e:
+        return status.HTTP_400_BAD_REQUEST, {'success': False, 'error': str(e)}
+
+    size = len(user_ids)
+    codes = np.zeros(size, dtype=np.int8)
+    now = timezone.now()
+    latest = now + MAX_CLOCK_SKEW
+
+    froms, tos, times = [], [], []
+    for index, (user_id, from_zone, to_zone, timestamp) in enumerate(zip(user_ids, from_zones, to_zones, timestamps)):
+        from_zone, to_zone, timestamp = _zone(from_zone), _zone(to_zone), _timestamp(timestamp, now, latest)
+        if (
+            not isinstance(user_id, str) or not user_id or len(user_id) > USER_ID_MAX_LENGTH
+            or from_zone is None or to_zone is None or timestamp is None
+        ):
+            codes[index] = INVALID_RECORD
+            from_zone = to_zone = ''
+        froms.append(from_zone)
+        tos.append(to_zone)
+        times.append(timestamp)
+
+    fares, errors = get_rule_snapshot().matrix.price_arrays(froms, tos)
+    codes[(codes == ACCEPTED) & errors] = INVALID_ZONE
+
+    candidates = np.flatnonzero(codes == ACCEPTED).tolist()
+    days = {index: travel_date_of(times[index]) for index in candidates}
+
+    with transaction.atomic():
+        # Earlier records in the upload get a user's remaining quota first
+        remaining = reserve_available(Counter((user_ids[index], days[index]) for index in candidates))
+        accepted = []
+        for index in candidates:
+            key = (user_ids[index], days[index])
+            if remaining[key]:
+                remaining[key] -= 1
+                accepted.append(index)
+            else:
+                codes[index] = QUOTA_EXCEEDED
+
+        fare_values = fares.tolist()
+        created = [
+            Journey(
+                user_id=user_ids[index],
+                from_zone=froms[index],
+                to_zone=tos[index],
+                fare=fare_values[index],
+                timestamp=times[index],
+                travel_date=days[index],
+            )
+            for index in accepted
+        ]
+        insert_journeys(created)
+        record_journeys(created)
+        users = {user_ids[index] for index in accepted}
+        transaction.on_commit(lambda: HISTORY_CACHE.bump_generations(users))
+
+    fares[codes != ACCEPTED] = 0
+    return status.HTTP_200_OK, {
+        'success': True,
+        'data': {
+            'received': size,
+            'accepted': len(accepted),
+            'total_fare': int(fares.sum()),
+            'status_codes': list(STATUS_CODES),
+            'status': codes.tolist(),
+            'fare': fares.tolist(),
+        }
+    }
+
+
+class BulkJourneyAPIView(APIView):
+    '''
+    Record many users' journeys in one request.
+
+    POST /api/journeys/bulk/
+
+    Request: columns user_id, from_zone, to_zone and optionally timestamp
+    (ISO 8601 with a UTC offset; defaults to now), all the same length,
+    up to settings.JOURNEY_BULK_MAX_RECORDS records.
+
+    Response:
+        {
+            'success': true,
+            'data': {
+                'received': 3,
+                'accepted': 2,
+                'total_fare': 90,
+                'status_codes': ['accepted', 'invalid_record', 'invalid_zone', 'quota_exceeded'],
+                'status': [0, 0, 3],
+                'fare': [55, 35, 0],
+            }
+        }
+
+    Journeys count against the daily quota of their own travel day. An
+    Idempotency-Key header makes retries safe, as for calculate-fare.
+    '''
+
+    def post(self, request):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            status_code, body = ingest_journeys(request.data)
+            return Response(body, status=status_code)
+
+        try:
+            status_code, body, replayed = run_once(
+                validate_key(idempotency_key),
+                fingerprint(request.data),
+                lambda: ingest_journeys(request.data),
+            )
+        except ValueError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IdempotencyConflict:
+            return Response(
+                {'success': False, 'error': 'Idempotency-Key was already used with a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+
+        response = Response(body, status=status_code)
+        if replayed:
+            response[REPLAYED_HEADER] = 'true'
+        return response
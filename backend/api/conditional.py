@@ -0,0 +1,78 @@
+"""
+Pre-rendered, conditionally served reference data (zones, fare rules).
+
+The JSON body of each reference endpoint is rendered once per fare rule
+snapshot and kept as bytes with a strong ETag derived from the content.
+Requests carrying a matching If-None-Match get a 304 straight from the
+in-memory snapshot: no query, no serializer, no rendering. Every worker
+renders identical bytes for the same rules, so ETags agree across
+workers.
+"""
+import hashlib
+from dataclasses import dataclass
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from fare.rules import FareRuleSnapshot, get_rule_snapshot
+
+from .renderers import FastJSONRenderer
+from .serializers import FareRuleSerializer, ZoneSerializer
+
+
+@dataclass(frozen=True)
+class RenderedBody:
+    content: bytes
+    etag: str
+
+
+def render_body(data) -> RenderedBody:
+    """Render `data` as the API's JSON renderer would, plus its ETag."""
+    content = FastJSONRenderer().render(data)
+    return RenderedBody(content, '"%s"' % hashlib.sha256(content).hexdigest()[:32])
+
+
+def not_modified(request, etag: str) -> bool:
+    """
+    If-None-Match check (RFC 9110 13.1.2). Weak comparison, so W/ tags
+    from intermediaries still match.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or any(tag.removeprefix('W/') == etag for tag in etags)
+
+
+def reference_response(request, name: str, build) -> HttpResponse:
+    """
+    Serve the body `build(snapshot)` for the current fare rule snapshot,
+    or a 304 if the client already holds it.
+    """
+    snapshot: FareRuleSnapshot = get_rule_snapshot()
+    body: RenderedBody = snapshot.derived(name, lambda snap: render_body(build(snap)))
+
+    if not_modified(request, body.etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body.content, content_type='application/json')
+    response['ETag'] = body.etag
+    # Clients may keep the body but must revalidate before reusing it
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def zones_body(snapshot: FareRuleSnapshot) -> dict:
+    return {
+        'success': True,
+        'zones': ZoneSerializer(snapshot.zones, many=True).data,
+        'count': len(snapshot.zones)
+    }
+
+
+def fare_rules_body(snapshot: FareRuleSnapshot) -> dict:
+    return {
+        'success': True,
+        'fare_rules': FareRuleSerializer(snapshot.rules, many=True).data,
+        'count': len(snapshot.rules)
+    }
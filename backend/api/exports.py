@@ -0,0 +1,130 @@
+"""
+Streaming journey history exports (NDJSON and CSV).
+
+Rows are read through a chunked server-side cursor and written out as
+they arrive, so memory stays flat no matter how many rows are exported.
+
+Under ASGI the body is an async iterator that reads each chunk in a
+worker thread: Django reads a sync streaming body to the end before
+sending any of it to an ASGI server.
+"""
+import csv
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views import View
+
+from fare.models import Journey
+
+from .filters import parse_journey_filters
+from .projections import HISTORY_FIELDS, isoformat
+
+EXPORT_FIELDS = HISTORY_FIELDS
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _ndjson_lines(rows):
+    for journey_id, user_id, from_zone, to_zone, fare, timestamp in rows:
+        yield json.dumps({
+            'id': journey_id,
+            'user_id': user_id,
+            'from_zone': from_zone,
+            'to_zone': to_zone,
+            'fare': fare,
+            'timestamp': isoformat(timestamp),
+        }, separators=(',', ':')) + '\n'
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for journey_id, user_id, from_zone, to_zone, fare, timestamp in rows:
+        yield writer.writerow((journey_id, user_id, from_zone, to_zone, fare, isoformat(timestamp)))
+
+
+def _buffered(lines, batch_size):
+    """Group lines so each chunk sent to the client carries many rows."""
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= batch_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def _in_thread(chunks):
+    """
+    Async iterator over a sync one, advanced in Django's sync thread so
+    its server-side cursor stays on one connection.
+    """
+    advance = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await advance(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Closes the cursor if the client went away mid-stream
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+class JourneyExportView(View):
+    '''
+    Stream journey history as NDJSON or CSV.
+
+    GET /api/journeys/export.ndjson
+    GET /api/journeys/export.csv?date_from=2025-01-01&date_to=2025-01-31
+    GET /api/users/{user_id}/journeys/export.csv?fare=>30&from_zone=1
+
+    Takes the history filters (see api.filters.parse_journey_filters).
+    Rows are ordered by (timestamp, id).
+    '''
+
+    def get(self, request, export_format, user_id=None):
+        if export_format not in CONTENT_TYPES:
+            raise Http404(f'Unsupported export format: {export_format}')
+
+        try:
+            filters = parse_journey_filters(request.GET)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        if user_id:
+            filters['user_id'] = user_id
+
+        chunk_size = settings.JOURNEY_EXPORT_CHUNK_SIZE
+        # Pick the database now: rows are read while the response
+        # streams, after the request's replica routing has ended
+        rows = (
+            Journey.objects.using(router.db_for_read(Journey)).filter(**filters)
+            .order_by('timestamp', 'id')
+            .values_list(*EXPORT_FIELDS)
+            .iterator(chunk_size=chunk_size)
+        )
+        lines = _ndjson_lines(rows) if export_format == 'ndjson' else _csv_lines(rows)
+
+        chunks = _buffered(lines, chunk_size)
+        response = StreamingHttpResponse(
+            _in_thread(chunks) if isinstance(request, ASGIRequest) else chunks,
+            content_type=CONTENT_TYPES[export_format],
+        )
+        name = f'journeys-{user_id}' if user_id else 'journeys'
+        response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+        return response
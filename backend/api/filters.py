@@ -0,0 +1,90 @@
+"""
+Query-string filtering and ordering for journey history.
+
+All filtering happens in SQL; see fare.models.Journey.Meta.indexes for
+the indexes behind each access pattern.
+"""
+import datetime
+import re
+
+from .pagination import KeysetPaginator
+
+# Allowed values of ?ordering=, each mapped to a unique keyset ordering.
+# Each pair is exactly reversed column for column, so one index (see
+# Journey.Meta.indexes) serves both directions.
+ORDERINGS = {
+    '-timestamp': ('-timestamp', 'id'),
+    'timestamp': ('timestamp', '-id'),
+    'fare': ('fare', '-timestamp', 'id'),
+    '-fare': ('-fare', 'timestamp', '-id'),
+    'from_zone': ('from_zone', '-timestamp', 'id'),
+    '-from_zone': ('-from_zone', 'timestamp', '-id'),
+    'to_zone': ('to_zone', '-timestamp', 'id'),
+    '-to_zone': ('-to_zone', 'timestamp', '-id'),
+}
+PAGINATORS = {name: KeysetPaginator(ordering) for name, ordering in ORDERINGS.items()}
+
+# '>30', '>=30', '<60', '<=60', '=50' or plain '50', as in the results table
+FARE_EXPRESSION = re.compile(r'^\s*(>=|<=|>|<|=)?\s*(\d+)\s*$')
+FARE_LOOKUPS = {'>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte', '=': 'exact', None: 'exact'}
+
+
+def parse_date_range(params, field='travel_date'):
+    """
+    Turn date_from / date_to (YYYY-MM-DD, inclusive) into filters on the
+    date column `field`.
+
+    Raises:
+        ValueError: If a date is malformed
+    """
+    filters = {}
+    for param, lookup in (('date_from', f'{field}__gte'), ('date_to', f'{field}__lte')):
+        value = params.get(param)
+        if not value:
+            continue
+        try:
+            filters[lookup] = datetime.date.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f'{param} must be a date in YYYY-MM-DD format')
+    return filters
+
+
+def parse_journey_filters(params):
+    """
+    Build ORM filters from query parameters.
+
+    Supported parameters:
+        fare: '>30', '>=30', '<60', '<=60', '=50' or '50' (repeatable)
+        from_zone, to_zone: exact zone match
+        date_from, date_to: inclusive YYYY-MM-DD range
+
+    Raises:
+        ValueError: If a parameter is malformed
+    """
+    filters = parse_date_range(params)
+
+    for expression in params.getlist('fare'):
+        match = FARE_EXPRESSION.match(expression)
+        if not match:
+            raise ValueError("fare must look like '>30', '<60' or '=50'")
+        operator, amount = match.groups()
+        filters[f'fare__{FARE_LOOKUPS[operator]}'] = int(amount)
+
+    for zone_param in ('from_zone', 'to_zone'):
+        if params.get(zone_param):
+            filters[zone_param] = params[zone_param]
+
+    return filters
+
+
+def get_paginator(params) -> KeysetPaginator:
+    """
+    Paginator for the requested ?ordering= (default newest first).
+
+    Raises:
+        ValueError: If the ordering is not supported
+    """
+    ordering = params.get('ordering') or '-timestamp'
+    if ordering not in PAGINATORS:
+        raise ValueError(f"ordering must be one of: {', '.join(ORDERINGS)}")
+    return PAGINATORS[ordering]
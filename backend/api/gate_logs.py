@@ -0,0 +1,276 @@
+"""
+Import of historical gate tap logs, e.g. when migrating from a legacy
+fare system.
+
+A log is a CSV file with a header row, or an NDJSON file, optionally
+gzipped, one tap per line with the fields:
+
+    user_id, from_zone, to_zone, timestamp (ISO 8601, with a UTC offset)
+
+import_gate_log() reads it in chunks of lines. Each chunk is validated,
+priced with one vectorized pass over the current fare rules (as for
+POST /api/journeys/bulk/) and stored with fare.loading.load_journeys,
+which uses COPY on PostgreSQL. Original timestamps are kept. Daily
+quotas are not enforced: the journeys already happened.
+
+Progress is kept in a GateLogImport row, updated in the transaction that
+stores each chunk, so an interrupted import resumes after its last
+stored chunk and never stores one twice. Rejected lines are appended to
+a rejects file as NDJSON ({"line": ..., "reason": ..., "record": ...});
+on resume it is cut back to the length recorded with the last stored
+chunk, so no line is reported twice either. Journeys are not tagged with
+their import, so one that stored any cannot be restarted from scratch.
+"""
+import csv
+import datetime
+import gzip
+import os
+import zoneinfo
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from fare.loading import load_journeys
+from fare.models import Journey, travel_date_of
+from fare.rules import get_rule_snapshot
+
+from .bulk import MAX_CLOCK_SKEW
+from .models import GateLogImport
+from .services import HISTORY_CACHE
+
+try:
+    import orjson
+    _loads, _dumps = orjson.loads, orjson.dumps
+except ImportError:  # pragma: no cover
+    import json
+    _loads = json.loads
+
+    def _dumps(value):
+        return json.dumps(value, separators=(',', ':')).encode()
+
+FIELDS = ('user_id', 'from_zone', 'to_zone', 'timestamp')
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+USER_ID_MAX_LENGTH = Journey._meta.get_field('user_id').max_length
+
+# Travel days are looked up per quarter hour of UTC time: every time zone
+# in use today is offset from UTC by a whole number of quarter hours
+DAY_BUCKET_SECONDS = 15 * 60
+
+
+class GateLogError(ValueError):
+    """The file as a whole cannot be imported."""
+
+
+def log_format(path: str) -> str:
+    """'csv' or 'ndjson', from the file name (ignoring a .gz suffix)."""
+    name = path[:-3] if path.endswith('.gz') else path
+    try:
+        return FORMATS[os.path.splitext(name)[1].lower()]
+    except KeyError:
+        raise GateLogError(f'Cannot tell the format of {path}; name it .csv, .ndjson or .jsonl (optionally .gz)')
+
+
+def _open(path: str):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+class _ChunkParser:
+    """Turns a chunk of raw lines into journey columns and rejects."""
+
+    def __init__(self, format: str, columns: Optional[Dict[str, int]], assume_time_zone: Optional[datetime.tzinfo]):
+        self.format = format
+        self.columns = columns
+        self.assume_time_zone = assume_time_zone
+        self.days = {}
+
+    def fields(self, text: str) -> Tuple:
+        if self.format == 'ndjson':
+            record = _loads(text)
+            return tuple(record.get(name) for name in FIELDS)
+        values = text.rstrip('\r\n').split(',') if '"' not in text else next(csv.reader([text]))
+        return tuple(values[self.columns[name]] for name in FIELDS)
+
+    def travel_date(self, timestamp: datetime.datetime) -> datetime.date:
+        bucket = int(timestamp.timestamp()) // DAY_BUCKET_SECONDS
+        day = self.days.get(bucket)
+        if day is None:
+            day = self.days[bucket] = travel_date_of(timestamp)
+        return day
+
+    def parse(self, lines: List[bytes], first_line: int) -> Tuple[Tuple[List, ...], List[Tuple[int, str, bytes]]]:
+        """
+        Returns:
+            (user_ids, from_zones, to_zones, fares, timestamps, travel_dates),
+            [(line number, reason, raw line), ...]
+        """
+        latest = timezone.now() + MAX_CLOCK_SKEW
+        users, froms, tos, stamps, days, numbers, rejects = [], [], [], [], [], [], []
+        for number, line in enumerate(lines, first_line):
+            if not line.strip():
+                continue
+            try:
+                user_id, from_zone, to_zone, stamp = self.fields(line.decode())
+            except (ValueError, IndexError, AttributeError):
+                # Undecodable, malformed JSON or CSV, or not an object
+                rejects.append((number, 'malformed record', line))
+                continue
+
+            if not isinstance(user_id, str) or not user_id or len(user_id) > USER_ID_MAX_LENGTH:
+                rejects.append((number, 'invalid user_id', line))
+                continue
+            # NDJSON zones may be numbers, as in the API
+            if isinstance(from_zone, int) and not isinstance(from_zone, bool):
+                from_zone = str(from_zone)
+            if isinstance(to_zone, int) and not isinstance(to_zone, bool):
+                to_zone = str(to_zone)
+            if not isinstance(from_zone, str) or not isinstance(to_zone, str):
+                rejects.append((number, 'invalid zone', line))
+                continue
+            try:
+                stamp = datetime.datetime.fromisoformat(stamp)
+            except (TypeError, ValueError):
+                rejects.append((number, 'invalid timestamp', line))
+                continue
+            if stamp.tzinfo is None:
+                if self.assume_time_zone is None:
+                    rejects.append((number, 'timestamp without UTC offset', line))
+                    continue
+                stamp = stamp.replace(tzinfo=self.assume_time_zone)
+            if stamp > latest:
+                rejects.append((number, 'timestamp in the future', line))
+                continue
+
+            users.append(user_id)
+            froms.append(from_zone)
+            tos.append(to_zone)
+            stamps.append(stamp)
+            days.append(self.travel_date(stamp))
+            numbers.append(number)
+
+        fares, errors = get_rule_snapshot().matrix.price_arrays(froms, tos)
+        fares = fares.tolist()
+        if errors.any():
+            for index in np.flatnonzero(errors).tolist():
+                rejects.append((numbers[index], 'no fare between these zones', lines[numbers[index] - first_line]))
+            keep = np.flatnonzero(~errors).tolist()
+            users, froms, tos, fares, stamps, days = (
+                [column[index] for index in keep] for column in (users, froms, tos, fares, stamps, days)
+            )
+            rejects.sort()
+        return (users, froms, tos, fares, stamps, days), rejects
+
+
+def import_gate_log(
+    path: str,
+    rejects_path: Optional[str] = None,
+    format: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    assume_time_zone: Optional[str] = None,
+    restart: bool = False,
+    progress: Optional[Callable[[GateLogImport, int], None]] = None,
+) -> GateLogImport:
+    """
+    Import (or resume importing) one log file; returns its GateLogImport.
+
+    Args:
+        rejects_path: where rejected lines go (default: <path>.rejects.ndjson)
+        format: 'csv' or 'ndjson' (default: from the file name)
+        chunk_size: lines per transaction (default settings.JOURNEY_IMPORT_CHUNK_SIZE)
+        assume_time_zone: time zone for timestamps without a UTC offset,
+            which are rejected otherwise
+        restart: import from the start even if the file was imported or
+            partly imported before, provided no journeys were stored
+        progress: called after each stored chunk, with the progress row
+            and the number of lines in the chunk
+
+    Raises:
+        GateLogError: If the file cannot be imported as a whole
+    """
+    format = format or log_format(path)
+    rejects_path = rejects_path or f'{path}.rejects.ndjson'
+    chunk_size = chunk_size or settings.JOURNEY_IMPORT_CHUNK_SIZE
+    try:
+        tz = zoneinfo.ZoneInfo(assume_time_zone) if assume_time_zone else None
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise GateLogError(f'Unknown time zone {assume_time_zone!r}')
+
+    size = os.path.getsize(path)
+    state, created = GateLogImport.objects.get_or_create(source=os.path.abspath(path), defaults={'size': size})
+    if restart and not created:
+        # Stored journeys are not traceable to their import, so one that
+        # stored any cannot be started over without storing them twice
+        if state.journeys_loaded:
+            raise GateLogError(
+                f'{path} cannot be restarted: its earlier import already stored {state.journeys_loaded} journeys, '
+                f'which would be stored again'
+            )
+        GateLogImport.objects.filter(pk=state.pk).delete()
+        state = GateLogImport.objects.create(source=os.path.abspath(path), size=size)
+    elif state.completed_at is not None:
+        raise GateLogError(
+            f'{path} was already imported on {state.completed_at:%Y-%m-%d %H:%M}'
+            + ('' if state.journeys_loaded else '; restart to import it again')
+        )
+    elif state.size != size:
+        raise GateLogError(
+            f'{path} changed since its import was interrupted, so it cannot be resumed'
+            + (
+                f'; {state.journeys_loaded} journeys from its first {state.rows_read} lines are stored, '
+                f'import the lines after those from a new file'
+                if state.journeys_loaded else '; restart to import it from the start'
+            )
+        )
+
+    with _open(path) as source, open(rejects_path, 'ab') as rejects:
+        rejects.truncate(state.rejects_size)
+        rejects.seek(state.rejects_size)
+
+        columns, line_number = None, 1
+        if format == 'csv':
+            header = source.readline()
+            names = [name.strip() for name in next(csv.reader([header.decode('utf-8-sig')]), [])]
+            missing = [name for name in FIELDS if name not in names]
+            if missing:
+                raise GateLogError(f'{path} has no {", ".join(missing)} column')
+            columns = {name: names.index(name) for name in FIELDS}
+            line_number = 2
+            if not state.offset:
+                state.offset = len(header)
+        if state.offset:
+            source.seek(state.offset)
+        parser = _ChunkParser(format, columns, tz)
+
+        while True:
+            lines = list(islice(source, chunk_size))
+            if not lines:
+                break
+            journeys, rejected = parser.parse(lines, line_number + state.rows_read)
+
+            for number, reason, line in rejected:
+                record = line.decode(errors='replace').rstrip('\r\n')
+                rejects.write(_dumps({'line': number, 'reason': reason, 'record': record}) + b'\n')
+            # On disk before the chunk commits; a resume cuts back to
+            # the size recorded with the last stored chunk
+            rejects.flush()
+            os.fsync(rejects.fileno())
+
+            with transaction.atomic():
+                loaded = load_journeys(*journeys)
+                state.offset += sum(len(line) for line in lines)
+                state.rows_read += len(lines)
+                state.journeys_loaded += loaded
+                state.rows_rejected += len(rejected)
+                state.rejects_size = rejects.tell()
+                state.save()
+                transaction.on_commit(lambda users=set(journeys[0]): HISTORY_CACHE.bump_generations(users))
+            if progress is not None:
+                progress(state, len(lines))
+
+    state.completed_at = timezone.now()
+    state.save(update_fields=['completed_at', 'updated_at'])
+    return state
@@ -0,0 +1,89 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request with a given key runs inside a transaction that also
+inserts the key row, and its response is stored on that row. Repeats
+replay the stored response without running anything. A concurrent
+duplicate blocks on the key's unique index until the first request
+commits (then replays its response) or rolls back (then runs itself),
+so a retry storm writes at most once.
+"""
+import datetime
+import hashlib
+import json
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body."""
+
+
+def validate_key(key: str) -> str:
+    """Check an Idempotency-Key header value."""
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+        raise ValueError(f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} printable characters')
+    return key
+
+
+def fingerprint(data) -> str:
+    """Stable hash of a validated request body."""
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def run_once(key: str, request_fingerprint: str, handler: Callable[[], Tuple[int, Dict]]) -> Tuple[int, Dict, bool]:
+    """
+    Run `handler` once per key and return (status_code, body, replayed).
+
+    Raises:
+        IdempotencyConflict: the key was used with a different body
+    """
+    now = timezone.now()
+    stored = IdempotencyKey.objects.filter(key=key, expires_at__gt=now).first()
+
+    if stored is None:
+        with transaction.atomic():
+            # An expired key may be reused
+            IdempotencyKey.objects.filter(key=key, expires_at__lte=now).delete()
+            # Inserting first holds the key's unique index entry for the
+            # rest of the transaction, so duplicates wait here
+            stored, created = IdempotencyKey.objects.get_or_create(
+                key=key,
+                defaults={
+                    'fingerprint': request_fingerprint,
+                    'status_code': 0,
+                    'response': {},
+                    'expires_at': now + datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                },
+            )
+            if created:
+                status_code, body = handler()
+                if status_code >= 500:
+                    # Not remembered: a retry with the key runs again
+                    transaction.set_rollback(True)
+                    return status_code, body, False
+                stored.status_code, stored.response = status_code, body
+                stored.save(update_fields=['status_code', 'response'])
+                return status_code, body, False
+
+    if stored.fingerprint != request_fingerprint:
+        raise IdempotencyConflict(key)
+    return stored.status_code, stored.response, True
+
+
+def purge_expired_keys() -> int:
+    """Delete expired keys; returns how many were removed."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.gate_logs import GateLogError, import_gate_log
+
+
+class Command(BaseCommand):
+    help = (
+        'Import historical gate tap logs (CSV with a header row, or NDJSON; optionally '
+        'gzipped) as journeys, keeping their timestamps. Run it again to resume an '
+        'interrupted import. Rejected lines go to a rejects file with the reason.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='log files')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='default: from the file name')
+        parser.add_argument('--rejects', help='rejects file (default: <path>.rejects.ndjson); only with one path')
+        parser.add_argument('--chunk-size', type=int, help='lines per transaction')
+        parser.add_argument(
+            '--assume-time-zone',
+            help='time zone of timestamps without a UTC offset, e.g. Europe/London (default: reject them)',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='import from the start, even if imported before (only if that stored no journeys)',
+        )
+
+    def handle(self, *args, paths, format, rejects, chunk_size, assume_time_zone, restart, **options):
+        if rejects and len(paths) > 1:
+            raise CommandError('--rejects takes one log file')
+        if chunk_size is not None and chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        for path in paths:
+            started = time.perf_counter()
+            # Lines read by this run, which may resume an earlier one
+            read = [0]
+
+            def progress(state, lines):
+                read[0] += lines
+                self.stdout.write(
+                    f'{path}: {state.rows_read} lines, {state.journeys_loaded} journeys, '
+                    f'{state.rows_rejected} rejected ({read[0] / (time.perf_counter() - started):,.0f} lines/s)'
+                )
+
+            try:
+                state = import_gate_log(
+                    path,
+                    rejects_path=rejects,
+                    format=format,
+                    chunk_size=chunk_size,
+                    assume_time_zone=assume_time_zone,
+                    restart=restart,
+                    progress=progress,
+                )
+            except (GateLogError, OSError) as exc:
+                raise CommandError(str(exc))
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Imported {path}: {state.journeys_loaded} journeys from {state.rows_read} lines, '
+                f'{state.rows_rejected} rejected, in {elapsed:.1f}s ({read[0] / elapsed:,.0f} lines/s)'
+            ))
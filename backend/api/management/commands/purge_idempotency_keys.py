@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records (run periodically, e.g. from cron).'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(f'Deleted {deleted} expired idempotency keys')
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Client-supplied Idempotency-Key header', max_length=255, unique=True)),
+                ('fingerprint', models.CharField(help_text='SHA-256 of the validated request body', max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(help_text='HTTP status of the stored response')),
+                ('response', models.JSONField(help_text='Stored response body')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='After this the key may be reused')),
+            ],
+            options={
+                'verbose_name': 'Idempotency key',
+                'verbose_name_plural': 'Idempotency keys',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GateLogImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Absolute path of the imported file', max_length=1024, unique=True)),
+                ('size', models.BigIntegerField(help_text='File size when the import started, to detect a changed file')),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes of the (uncompressed) file read and stored so far')),
+                ('rows_read', models.BigIntegerField(default=0)),
+                ('journeys_loaded', models.BigIntegerField(default=0)),
+                ('rows_rejected', models.BigIntegerField(default=0)),
+                ('rejects_size', models.BigIntegerField(default=0, help_text='Bytes written to the rejects file so far')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Gate log import',
+                'verbose_name_plural': 'Gate log imports',
+            },
+        ),
+    ]
@@ -1,3 +1,98 @@
 from django.db import models
 
-# Create your models here.
+
+class IdempotencyKey(models.Model):
+    """
+    The stored outcome of a POST sent with an Idempotency-Key header.
+    Repeats of the request within the TTL replay the stored response
+    instead of running again; see api.idempotency.
+    """
+
+    key = models.CharField(
+        max_length=255,
+        unique=True,
+        help_text="Client-supplied Idempotency-Key header"
+    )
+
+    fingerprint = models.CharField(
+        max_length=64,
+        help_text="SHA-256 of the validated request body"
+    )
+
+    status_code = models.PositiveSmallIntegerField(
+        help_text="HTTP status of the stored response"
+    )
+
+    response = models.JSONField(
+        help_text="Stored response body"
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    expires_at = models.DateTimeField(
+        db_index=True,
+        help_text="After this the key may be reused"
+    )
+
+    class Meta:
+        verbose_name = "Idempotency key"
+        verbose_name_plural = "Idempotency keys"
+
+    def __str__(self):
+        return f"{self.key} -> {self.status_code}"
+
+
+class GateLogImport(models.Model):
+    """
+    Progress of one gate log file being imported; see api.gate_logs.
+    Updated in the transaction that stores each chunk, so an interrupted
+    import resumes exactly after its last stored chunk.
+    """
+
+    source = models.CharField(
+        max_length=1024,
+        unique=True,
+        help_text="Absolute path of the imported file"
+    )
+
+    size = models.BigIntegerField(
+        help_text="File size when the import started, to detect a changed file"
+    )
+
+    offset = models.BigIntegerField(
+        default=0,
+        help_text="Bytes of the (uncompressed) file read and stored so far"
+    )
+
+    rows_read = models.BigIntegerField(default=0)
+
+    journeys_loaded = models.BigIntegerField(default=0)
+
+    rows_rejected = models.BigIntegerField(default=0)
+
+    rejects_size = models.BigIntegerField(
+        default=0,
+        help_text="Bytes written to the rejects file so far"
+    )
+
+    started_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    updated_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    completed_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = "Gate log import"
+        verbose_name_plural = "Gate log imports"
+
+    def __str__(self):
+        return f"{self.source}: {self.journeys_loaded} journeys, {self.rows_rejected} rejected"
@@ -0,0 +1,128 @@
+"""
+Keyset (cursor) pagination for journey history.
+
+Pages are fetched with a WHERE clause on the ordering columns rather than
+OFFSET, so page 10,000 costs the same as page 1. Cursors are opaque
+base64 tokens holding the ordering values of the last row served.
+"""
+import base64
+import json
+from functools import reduce
+from typing import List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+
+
+class InvalidCursor(ValueError):
+    """The cursor is malformed or was issued for a different ordering."""
+
+
+def parse_page_size(value: Optional[str]) -> int:
+    """Validate a page_size query parameter against the configured bounds."""
+    if value in (None, ''):
+        return settings.JOURNEY_HISTORY_PAGE_SIZE
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('page_size must be an integer')
+    if not 1 <= page_size <= settings.JOURNEY_HISTORY_MAX_PAGE_SIZE:
+        raise ValueError(f'page_size must be between 1 and {settings.JOURNEY_HISTORY_MAX_PAGE_SIZE}')
+    return page_size
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset over a fixed, unique ordering.
+
+    The ordering must end in a unique column (normally 'id') so that every
+    row has a distinct position.
+    """
+
+    def __init__(self, ordering: Sequence[str] = ('-timestamp', 'id')):
+        self.ordering = tuple(ordering)
+        self.fields = tuple(name.lstrip('-') for name in self.ordering)
+
+    def paginate(self, queryset: QuerySet, page_size: int, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+        """
+        Return (rows, next_cursor). next_cursor is None on the last page.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(queryset.model, self.decode(cursor)))
+
+        # One extra row tells us whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        return self._page(rows, page_size)
+
+    async def apaginate(self, queryset: QuerySet, page_size: int, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+        """
+        Async version of paginate(), using the async ORM.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(queryset.model, self.decode(cursor)))
+
+        rows = [row async for row in queryset[:page_size + 1]]
+        return self._page(rows, page_size)
+
+    def _page(self, rows: List, page_size: int) -> Tuple[List, Optional[str]]:
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        return rows, self.encode(rows[-1])
+
+    def encode(self, row) -> str:
+        """Cursor pointing just after `row`."""
+        if isinstance(row, dict):
+            values = [row[name] for name in self.fields]
+        else:
+            values = [getattr(row, name) for name in self.fields]
+        payload = json.dumps([self.ordering, [_to_json(value) for value in values]], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode(self, cursor: str) -> list:
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            ordering, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(ordering, list) or not isinstance(values, list):
+                raise TypeError
+        except (ValueError, TypeError):
+            raise InvalidCursor('invalid cursor')
+        if tuple(ordering) != self.ordering or len(values) != len(self.fields):
+            raise InvalidCursor('cursor does not match the requested ordering')
+        return values
+
+    def _after(self, model, values: list) -> Q:
+        """
+        Rows strictly after `values` in this ordering.
+
+        For ordering (a, b, c) that is:
+            a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        with > flipped to < for descending columns. The first column's
+        bound (a >= x) is repeated on its own so the planner can use it as
+        an index range.
+        """
+        try:
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor('invalid cursor')
+
+        clauses = []
+        for idx, (name, value) in enumerate(zip(self.fields, values)):
+            lookup = 'lt' if self.ordering[idx].startswith('-') else 'gt'
+            equal = {field: prior for field, prior in zip(self.fields[:idx], values[:idx])}
+            clauses.append(Q(**equal, **{f'{name}__{lookup}': value}))
+
+        first_lookup = 'lte' if self.ordering[0].startswith('-') else 'gte'
+        return Q(**{f'{self.fields[0]}__{first_lookup}': values[0]}) & reduce(lambda a, b: a | b, clauses)
+
+
+def _to_json(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
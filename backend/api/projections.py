@@ -0,0 +1,62 @@
+"""
+Hand-written projections for the hot response paths.
+
+These produce exactly what the DRF serializers they replace produce
+(FareCalculationResponseSerializer, JourneyHistorySerializer), from
+plain dicts and values() rows, without per-field serializer machinery.
+api.tests.TestProjections checks them against the serializers.
+"""
+import datetime
+from typing import Dict, Iterable, List
+
+from django.utils import timezone
+
+# Journey columns in a history or export row, in JourneyHistorySerializer order
+HISTORY_FIELDS = ('id', 'user_id', 'from_zone', 'to_zone', 'fare', 'timestamp')
+
+
+def isoformat(value: datetime.datetime, tz=None) -> str:
+    """Format a timestamp exactly like DRF's DateTimeField does."""
+    value = value.astimezone(tz or timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def journey_history_rows(rows: Iterable[Dict]) -> List[Dict]:
+    """JourneyHistorySerializer(many=True).data, from values(*HISTORY_FIELDS) rows."""
+    tz = timezone.get_current_timezone()
+    return [
+        {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'from_zone': row['from_zone'],
+            'to_zone': row['to_zone'],
+            'fare': row['fare'],
+            'timestamp': isoformat(row['timestamp'], tz),
+        }
+        for row in rows
+    ]
+
+
+def fare_calculation_data(result: Dict) -> Dict:
+    """FareCalculationResponseSerializer(result).data, from FareMatrix.price_journeys output."""
+    journeys = []
+    for journey in result['journeys']:
+        item = {
+            'from_zone': int(journey['from_zone']),
+            'to_zone': int(journey['to_zone']),
+            'fare': int(journey['fare']),
+        }
+        if 'error' in journey:
+            item['error'] = str(journey['error'])
+        journeys.append(item)
+
+    data = {
+        'journeys': journeys,
+        'total_fare': int(result['total_fare']),
+        'journey_count': int(result['journey_count']),
+    }
+    if 'user_id' in result:
+        data['user_id'] = str(result['user_id'])
+    return data
@@ -41,7 +41,7 @@ class ZoneSerializer(serializers.ModelSerializer):
 class FareRuleSerializer(serializers.Serializer):
     """
     Serializer for displaying fare rules.
-    No model needed - data comes from SimpleFareCalculator.
+    Data comes from the compiled fare rule snapshot (fare.rules).
     """
     from_zone = serializers.IntegerField(read_only=True)
     to_zone = serializers.IntegerField(read_only=True)
@@ -0,0 +1,197 @@
+'''
+Request handling shared by the sync (WSGI) and async (ASGI) API views.
+'''
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from rest_framework import status
+from django.conf import settings
+from django.db import transaction
+
+from backend.replicas import pin_to_primary, pinned_to_primary
+from fare.cache import CacheNamespace
+from fare.models import Journey, travel_date_of
+from fare.partitions import ensure_partitions_for
+from fare.rollups import record_journeys
+from fare.quota import MAX_JOURNEYS_PER_DAY, QuotaExceeded, reserve_journeys
+from fare.rules import get_rule_snapshot
+from fare.write_behind import journey_writer
+
+from .idempotency import IdempotencyConflict, fingerprint, run_once, validate_key
+from .filters import get_paginator, parse_journey_filters
+from .pagination import KeysetPaginator, parse_page_size
+from .projections import HISTORY_FIELDS, fare_calculation_data, journey_history_rows
+
+# Per-user history pages, stamped with the user's cache generation
+HISTORY_CACHE = CacheNamespace('history', timeout=settings.JOURNEY_HISTORY_CACHE_TIMEOUT)
+
+
+def calculate_and_record_fares(user_id: str, journeys: List[Dict]) -> Tuple[int, Dict]:
+    '''
+    Price a batch of journeys, reserve them against the daily quota and
+    store them, or queue them for fare.write_behind when
+    settings.JOURNEY_WRITE_BEHIND is on.
+
+    Returns:
+        (status_code, response body)
+    '''
+    # Price and validate the whole batch before anything is written
+    snapshot = get_rule_snapshot()
+    result = snapshot.matrix.price_journeys(journeys)
+    result['user_id'] = user_id
+    if any(jour.get('status') == 'error' for jour in result['journeys']):
+        return status.HTTP_400_BAD_REQUEST, {
+            'success': False,
+            'error': 'zone is invalid'
+        }
+
+    journey_rows = [
+        Journey(
+            user_id=str(user_id), #extend requirement to make storage as user_id
+            from_zone=str(jour['from_zone']),
+            to_zone=str(jour['to_zone']),
+            fare=int(jour['fare']),  # Store as integer
+        )
+        for jour in result['journeys']
+    ]
+
+    writer = None
+    if settings.JOURNEY_WRITE_BEHIND:
+        # Back-pressure: wait for the queue to drain rather than let it grow
+        writer = journey_writer(on_flush=HISTORY_CACHE.bump_generations)
+        if not writer.wait_for_room(len(journey_rows), settings.JOURNEY_WRITE_BEHIND_PUT_TIMEOUT):
+            return status.HTTP_503_SERVICE_UNAVAILABLE, {
+                'success': False,
+                'error': 'Too many journeys waiting to be stored; please retry shortly'
+            }
+
+    # Quota check and insert share one transaction, so a rejected or
+    # failed batch leaves nothing behind
+    with transaction.atomic():
+        # Reserve the journeys against today's quota; concurrent
+        # requests for the same user queue on the counter row
+        try:
+            reserve_journeys(user_id, len(journeys))
+        except QuotaExceeded as exceeded:
+            return status.HTTP_429_TOO_MANY_REQUESTS, {
+                "success": False,
+                "error": f"Maximum {MAX_JOURNEYS_PER_DAY} journeys per day exceeded. "
+                        f"You already have {exceeded.used} journeys today."
+            }
+
+        if writer is not None:
+            # Queued only once the reservation is committed, so waiting
+            # journeys are always counted against the quota
+            transaction.on_commit(lambda: writer.put(journey_rows))
+        else:
+            # One INSERT for the whole batch, one upsert for the rollups
+            ensure_partitions_for({travel_date_of(journey.timestamp) for journey in journey_rows})
+            created = Journey.objects.bulk_create(journey_rows)
+            record_journeys(created)
+        # Cached history pages for this user are stale once this commits,
+        # and replicas may lag behind it (pin_recent_writer). Queued
+        # journeys bump it again once stored.
+        transaction.on_commit(lambda: HISTORY_CACHE.bump_generation(str(user_id)))
+
+    return status.HTTP_200_OK, {
+        'success': True,
+        'data': fare_calculation_data(result)
+    }
+
+
+def calculate_fares_once(idempotency_key: Optional[str], user_id: str, journeys: List[Dict]) -> Tuple[int, Dict, bool]:
+    '''
+    calculate_and_record_fares, honouring an Idempotency-Key header.
+
+    Returns:
+        (status_code, response body, replayed)
+    '''
+    if idempotency_key is None:
+        return (*calculate_and_record_fares(user_id, journeys), False)
+
+    try:
+        key = validate_key(idempotency_key)
+        return run_once(
+            key,
+            fingerprint({'user_id': user_id, 'journeys': journeys}),
+            lambda: calculate_and_record_fares(user_id, journeys),
+        )
+    except ValueError as e:
+        return status.HTTP_400_BAD_REQUEST, {'success': False, 'error': str(e)}, False
+    except IdempotencyConflict:
+        return status.HTTP_422_UNPROCESSABLE_ENTITY, {
+            'success': False,
+            'error': 'Idempotency-Key was already used with a different request'
+        }, False
+
+
+def prepare_history_page(journeys, params) -> Tuple:
+    '''
+    Apply history filters and pick the paginator for a request.
+
+    Query parameters:
+        fare, from_zone, to_zone, date_from, date_to: see api.filters
+        ordering: timestamp, fare, from_zone or to_zone, '-' for descending
+            (default -timestamp)
+        cursor: next_cursor from the previous page
+        page_size: rows per page (default settings.JOURNEY_HISTORY_PAGE_SIZE)
+        count: 'true' to also return the exact total (costs a COUNT query)
+
+    Returns:
+        (filtered values() queryset, paginator, page_size)
+
+    Raises:
+        ValueError: If a parameter is malformed
+    '''
+    journeys = journeys.filter(**parse_journey_filters(params)).values(*HISTORY_FIELDS)
+    return journeys, get_paginator(params), parse_page_size(params.get('page_size'))
+
+
+def wants_count(params) -> bool:
+    '''Exact totals are only computed on request.'''
+    return params.get('count', '').lower() in ('1', 'true')
+
+
+def history_body(rows, next_cursor, page_size, **extra) -> Dict:
+    '''Response body for one page of journey history.'''
+    return {
+        'success': True,
+        **extra,
+        'journeys': journey_history_rows(rows),
+        'next_cursor': next_cursor,
+        'page_size': page_size,
+    }
+
+
+def pin_recent_writer(user_id: str) -> str:
+    '''
+    Read `user_id`'s data from the primary for the rest of the request if
+    their journeys changed within DATABASE_REPLICA_PIN_SECONDS, so every
+    client sees the rider's own writes, whether or not it kept the pin
+    cookie. Returns the rider's history generation, which dates that
+    change (see fare.cache.CacheNamespace.generation_age).
+    '''
+    generation = HISTORY_CACHE.generation(user_id)
+    if (
+        settings.DATABASE_REPLICAS
+        and HISTORY_CACHE.generation_age(generation) < settings.DATABASE_REPLICA_PIN_SECONDS
+    ):
+        pin_to_primary()
+    return generation
+
+
+def history_cache_slot(user_id: str, params) -> Optional[Tuple[str, str]]:
+    '''
+    Cache key and generation for one user's history request, or None if
+    it reads the primary to see recent writes: the cached page may have
+    been read from a lagging replica.
+
+    Every query parameter is part of the key, so each filter, ordering
+    and cursor combination is cached separately.
+    '''
+    generation = pin_recent_writer(user_id)
+    if pinned_to_primary():
+        return None
+    query = urlencode(sorted((name, value) for name, values in params.lists() for value in values))
+    return f'{user_id}:{hashlib.sha256(query.encode()).hexdigest()[:32]}', generation
@@ -1,8 +1,39 @@
+import asyncio
+import base64
+import datetime
+import io
+import os
+import re
+from decimal import Decimal
 import pytest
 import json
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.utils import timezone
+from django.test import AsyncRequestFactory
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from fare.models import Journey
+from fare.models import JourneyDailyRollup, travel_date_of
+from fare.rollups import record_journeys
+from fare.quota import journeys_on, travel_day
+from zones.models import Zone
+from api.idempotency import run_once
+from fare.write_behind import JourneyWriter
+from backend import metrics
+from backend.replicas import PIN_COOKIE, ReplicaRouter, replica_reads
+from api.projections import HISTORY_FIELDS, fare_calculation_data, journey_history_rows
+from api.renderers import FastJSONRenderer
+from api.serializers import FareCalculationResponseSerializer, JourneyHistorySerializer
+from fare import SimpleFareCalculator
+from api.models import IdempotencyKey
+from api.async_views import (
+    AsyncCalculateFareView,
+    AsyncJourneyHistoryView,
+    AsyncUserJourneyHistoryView,
+    AsyncUserJourneyCountView,
+)
 
 @pytest.mark.django_db
 class TestSingleJourneyAPISimple:
@@ -168,6 +199,42 @@ class TestJourneyPersistence:
         assert 55 in fares  
         assert 45 in fares  
 
+    def test_invalid_zone_saves_nothing(self):
+        '''An invalid zone anywhere in the batch rejects the whole batch.'''
+        response = self.client.post(
+            self.url,
+            data={'user_id':'1', 'journeys':[{'from_zone': '1', 'to_zone': '2'},{'from_zone': '1', 'to_zone': '9'}]},
+            format='json'
+        )
+
+        assert response.status_code == 400
+        assert Journey.objects.count() == 0
+
+    def test_quota_exceeded_saves_nothing(self):
+        '''A batch that would pass the daily limit is rejected as a whole.'''
+        batch = {'user_id':'1', 'journeys':[{'from_zone': '1', 'to_zone': '1'}] * 15}
+        assert self.client.post(self.url, data=batch, format='json').status_code == 200
+
+        response = self.client.post(self.url, data=batch, format='json')
+
+        assert response.status_code == 429
+        assert Journey.objects.filter(user_id='1').count() == 15
+
+    def test_batch_saved_with_one_insert(self, django_assert_max_num_queries):
+        '''Nineteen journeys cost one INSERT, not nineteen.'''
+        # Compile fare rules and open today's quota counter outside the
+        # measured request
+        first = {'user_id':'1', 'journeys':[{'from_zone': '1', 'to_zone': '2'}]}
+        assert self.client.post(self.url, data=first, format='json').status_code == 200
+
+        batch = {'user_id':'1', 'journeys':[{'from_zone': '1', 'to_zone': '2'}] * 19}
+        # Savepoint, quota UPDATE, INSERT, rollup upsert, release
+        with django_assert_max_num_queries(5):
+            response = self.client.post(self.url, data=batch, format='json')
+
+        assert response.status_code == 200
+        assert Journey.objects.filter(user_id='1').count() == 20
+
 @pytest.mark.django_db
 class TestUserJourneyAPI:
     '''Test user journey history endpoints.'''
@@ -203,3 +270,1362 @@ class TestUserJourneyAPI:
         assert data['success'] is True
         assert data['user_id'] == 'user123'
         assert len(data['journeys']) == 3
+
+    def test_get_user_journey_count(self):
+        '''Today's count includes journeys made through the API.'''
+        response = self.client.get('/api/users/user123/journeys/count')
+        assert response.json()['count'] == 3
+
+        self.client.post(
+            '/api/calculate-fare/',
+            data={'user_id':'user123', 'journeys':[{'from_zone': '1', 'to_zone': '2'}] * 2},
+            format='json'
+        )
+        response = self.client.get('/api/users/user123/journeys/count')
+        assert response.json()['count'] == 5
+
+
+@pytest.mark.django_db
+class TestJourneyHistoryPagination:
+    '''Test keyset pagination of the journey history endpoints.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+        Journey.objects.bulk_create([
+            Journey(user_id='user123' if i % 2 else 'user456', from_zone='1', to_zone='2', fare=55)
+            for i in range(25)
+        ])
+        # Give groups of rows identical timestamps to exercise the id tie-break
+        for journey in Journey.objects.all():
+            journey.timestamp = journey.timestamp.replace(microsecond=journey.id % 3)
+            journey.save(update_fields=['timestamp'])
+
+    def walk(self, url, page_size):
+        '''Follow next_cursor until the last page.'''
+        ids, cursor = [], None
+        while True:
+            params = {'page_size': page_size}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(url, params).json()
+            ids += [journey['id'] for journey in data['journeys']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_every_row_once(self):
+        '''Walking the cursors returns every journey once, newest first.'''
+        ids = self.walk('/api/journeys/', page_size=4)
+        expected = list(Journey.objects.order_by('-timestamp', 'id').values_list('id', flat=True))
+        assert ids == expected
+
+    def test_user_pages(self):
+        '''The per-user history paginates the user's rows only.'''
+        ids = self.walk('/api/users/user123/journeys/', page_size=5)
+        assert len(ids) == 12
+        assert set(ids) == set(Journey.objects.filter(user_id='user123').values_list('id', flat=True))
+
+    def test_count_only_on_request(self):
+        '''The exact count is opt-in.'''
+        assert 'count' not in self.client.get('/api/journeys/').json()
+        assert self.client.get('/api/journeys/', {'count': 'true'}).json()['count'] == 25
+
+    def test_deep_page_has_no_offset(self, django_assert_num_queries):
+        '''Later pages seek with WHERE instead of OFFSET.'''
+        first = self.client.get('/api/journeys/', {'page_size': 10}).json()
+        with django_assert_num_queries(1) as captured:
+            self.client.get('/api/journeys/', {'page_size': 10, 'cursor': first['next_cursor']})
+        assert 'OFFSET' not in captured.captured_queries[0]['sql'].upper()
+
+    def test_user_pages_cached_until_user_writes(self, django_assert_num_queries, django_capture_on_commit_callbacks):
+        '''Repeated user history requests are served from the shared cache.'''
+        url = '/api/users/user123/journeys/'
+        first = self.client.get(url, {'page_size': 5, 'count': 'true'}).json()
+        with django_assert_num_queries(0):
+            assert self.client.get(url, {'count': 'true', 'page_size': 5}).json() == first
+
+        # Another user's journey leaves this user's pages cached
+        payload = {'user_id': 'other', 'journeys': [{'from_zone': 1, 'to_zone': 2}]}
+        with django_capture_on_commit_callbacks(execute=True):
+            self.client.post('/api/calculate-fare/', payload, format='json')
+        with django_assert_num_queries(0):
+            self.client.get(url, {'count': 'true', 'page_size': 5})
+
+        payload['user_id'] = 'user123'
+        with django_capture_on_commit_callbacks(execute=True):
+            self.client.post('/api/calculate-fare/', payload, format='json')
+        assert self.client.get(url, {'count': 'true', 'page_size': 5}).json()['count'] == first['count'] + 1
+
+    @pytest.mark.parametrize('params', [{'cursor': 'not-a-cursor'}, {'page_size': '0'}, {'page_size': 'abc'}])
+    def test_bad_parameters(self, params):
+        '''Malformed cursors and page sizes are rejected.'''
+        response = self.client.get('/api/journeys/', params)
+        assert response.status_code == 400
+        assert response.json()['success'] is False
+
+    @pytest.mark.parametrize('payload', [
+        [1, 2],
+        [None, None],
+        [['-timestamp', 'id'], 5],
+        [['-timestamp', 'id'], [[1], {'id': 2}]],
+        [['-timestamp', 'id'], ['2025-03-01T08:15:00+00:00', 'abc']],
+        {'ordering': ['-timestamp', 'id']},
+        'cursor',
+    ])
+    def test_cursor_of_the_wrong_shape(self, payload):
+        '''Well-formed cursors holding the wrong values are rejected, not a server error.'''
+        cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+        response = self.client.get('/api/journeys/', {'cursor': cursor})
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestJourneyExport:
+    '''Test streaming journey exports.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+        Journey.objects.create(user_id='user123', from_zone='1', to_zone='2', fare=55)
+        Journey.objects.create(user_id='user123', from_zone='2', to_zone='3', fare=45)
+        Journey.objects.create(user_id='user456', from_zone='1', to_zone='3', fare=65)
+
+    def read(self, response):
+        '''Collect a streamed body.'''
+        assert response.streaming
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_history_format(self):
+        '''NDJSON rows carry the same fields and values as the history API.'''
+        response = self.client.get('/api/journeys/export.ndjson')
+        assert response['Content-Type'] == 'application/x-ndjson'
+
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        history = self.client.get('/api/journeys/').json()['journeys']
+        assert sorted(rows, key=lambda row: row['id']) == sorted(history, key=lambda row: row['id'])
+
+    def test_user_csv(self):
+        '''The per-user CSV export has a header and only that user's rows.'''
+        response = self.client.get('/api/users/user123/journeys/export.csv')
+        lines = self.read(response).splitlines()
+        assert lines[0] == 'id,user_id,from_zone,to_zone,fare,timestamp'
+        assert len(lines) == 3
+        assert all(',user123,' in line for line in lines[1:])
+
+    def test_date_range(self):
+        '''Rows outside the date range are left out.'''
+        assert self.read(self.client.get('/api/journeys/export.ndjson', {'date_to': '2000-01-01'})) == ''
+        response = self.client.get('/api/journeys/export.ndjson', {'date_from': '2000-01-01'})
+        assert len(self.read(response).splitlines()) == 3
+
+    def test_history_filters(self):
+        '''The export takes the same fare and zone filters as the history.'''
+        response = self.client.get('/api/users/user123/journeys/export.ndjson', {'fare': '<50'})
+        assert [json.loads(line)['fare'] for line in self.read(response).splitlines()] == [45]
+        response = self.client.get('/api/journeys/export.ndjson', {'from_zone': '1', 'to_zone': '3'})
+        assert [json.loads(line)['user_id'] for line in self.read(response).splitlines()] == ['user456']
+        assert self.client.get('/api/journeys/export.csv', {'fare': 'cheap'}).status_code == 400
+
+    def test_asgi_streams_async(self):
+        '''Under ASGI the body is streamed asynchronously, with the same content.'''
+        from api.exports import JourneyExportView
+
+        async def collect():
+            request = AsyncRequestFactory().get('/api/journeys/export.csv')
+            response = JourneyExportView.as_view()(request, export_format='csv')
+            assert response.is_async
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        assert async_to_sync(collect)() == self.read(self.client.get('/api/journeys/export.csv'))
+
+    def test_bad_requests(self):
+        '''Unknown formats and malformed dates are rejected.'''
+        assert self.client.get('/api/journeys/export.xml').status_code == 404
+        assert self.client.get('/api/journeys/export.csv', {'date_from': 'soon'}).status_code == 400
+
+
+@pytest.mark.django_db
+class TestJourneyHistoryFilters:
+    '''Test server-side filtering and ordering of journey history.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+        for from_zone, to_zone, fare in [('1', '1', 40), ('1', '2', 55), ('1', '3', 65),
+                                         ('2', '2', 35), ('2', '3', 45), ('3', '3', 30)]:
+            Journey.objects.create(user_id='user123', from_zone=from_zone, to_zone=to_zone, fare=fare)
+        Journey.objects.create(user_id='user456', from_zone='1', to_zone='3', fare=65)
+
+    def fares(self, url, params):
+        response = self.client.get(url, params)
+        assert response.status_code == 200
+        return [journey['fare'] for journey in response.json()['journeys']]
+
+    @pytest.mark.parametrize('expression,expected', [
+        ('>45', {55, 65}),
+        ('>=45', {45, 55, 65}),
+        ('<40', {30, 35}),
+        ('=55', {55}),
+        ('40', {40}),
+    ])
+    def test_fare_expressions(self, expression, expected):
+        '''Fare filters use the results-table syntax.'''
+        assert set(self.fares('/api/users/user123/journeys/', {'fare': expression})) == expected
+
+    def test_fare_range(self):
+        '''Two fare expressions combine into a range.'''
+        fares = self.fares('/api/journeys/', {'fare': ['>30', '<50']})
+        assert sorted(fares) == [35, 40, 45]
+
+    def test_zone_filter(self):
+        '''Zone filters apply across users on the global history.'''
+        assert self.fares('/api/journeys/', {'from_zone': '1', 'to_zone': '3'}) == [65, 65]
+
+    def test_ordering(self):
+        '''Ordering by fare works in both directions and across pages.'''
+        url = '/api/users/user123/journeys/'
+        assert self.fares(url, {'ordering': 'fare'}) == [30, 35, 40, 45, 55, 65]
+
+        first = self.client.get(url, {'ordering': '-fare', 'page_size': 4}).json()
+        second = self.client.get(url, {'ordering': '-fare', 'page_size': 4, 'cursor': first['next_cursor']}).json()
+        assert [j['fare'] for j in first['journeys'] + second['journeys']] == [65, 55, 45, 40, 35, 30]
+
+    def test_cursor_tied_to_ordering(self):
+        '''A cursor from one ordering cannot be replayed with another.'''
+        first = self.client.get('/api/journeys/', {'ordering': 'fare', 'page_size': 2}).json()
+        response = self.client.get('/api/journeys/', {'ordering': 'to_zone', 'cursor': first['next_cursor']})
+        assert response.status_code == 400
+
+    def test_count_reflects_filters(self):
+        '''The optional count is of the filtered rows.'''
+        data = self.client.get('/api/journeys/', {'fare': '=65', 'count': 'true'}).json()
+        assert data['count'] == 2
+
+    @pytest.mark.parametrize('params', [{'fare': 'cheap'}, {'ordering': 'user_id'}, {'date_to': '31/01/2025'}])
+    def test_bad_filters(self, params):
+        '''Malformed filters are rejected.'''
+        assert self.client.get('/api/journeys/', params).status_code == 400
+
+
+@pytest.mark.django_db
+class TestIdempotencyKeys:
+    '''Test Idempotency-Key handling on POST /api/calculate-fare/.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+        self.payload = {'user_id': 'user123', 'journeys': [{'from_zone': 1, 'to_zone': 2}]}
+
+    def post(self, payload, key='key-1'):
+        return self.client.post('/api/calculate-fare/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeat_replays_without_writing(self):
+        '''A retried request gets the first response and writes nothing.'''
+        first = self.post(self.payload)
+        second = self.post(self.payload)
+
+        assert first.status_code == second.status_code == 200
+        assert second.json() == first.json()
+        assert second['Idempotent-Replayed'] == 'true'
+        assert 'Idempotent-Replayed' not in first
+        assert Journey.objects.count() == 1
+        assert journeys_on('user123') == 1
+
+    def test_replay_is_one_query(self, django_assert_num_queries):
+        '''Replays are a single indexed lookup.'''
+        self.post(self.payload)
+        with django_assert_num_queries(1):
+            self.post(self.payload)
+
+    def test_different_body_is_rejected(self):
+        '''Reusing a key for another request is a client error.'''
+        self.post(self.payload)
+        other = {'user_id': 'user123', 'journeys': [{'from_zone': 3, 'to_zone': 3}]}
+        response = self.post(other)
+        assert response.status_code == 422
+        assert Journey.objects.count() == 1
+
+    def test_distinct_keys_both_run(self):
+        '''Different keys are different requests.'''
+        self.post(self.payload, key='a')
+        self.post(self.payload, key='b')
+        assert Journey.objects.count() == 2
+
+    def test_no_key_is_not_deduplicated(self):
+        '''Without the header every request is recorded.'''
+        self.client.post('/api/calculate-fare/', self.payload, format='json')
+        self.client.post('/api/calculate-fare/', self.payload, format='json')
+        assert Journey.objects.count() == 2
+        assert not IdempotencyKey.objects.exists()
+
+    def test_expired_key_runs_again(self):
+        '''After the TTL a key can be reused.'''
+        self.post(self.payload)
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        response = self.post(self.payload)
+        assert 'Idempotent-Replayed' not in response
+        assert Journey.objects.count() == 2
+        assert IdempotencyKey.objects.count() == 1
+
+    def test_quota_rejection_is_replayed(self):
+        '''A stored 429 is replayed rather than re-checked.'''
+        journeys = [{'from_zone': 1, 'to_zone': 1}] * 20
+        self.post({'user_id': 'user123', 'journeys': journeys}, key='fill')
+        assert self.post(self.payload).status_code == 429
+        assert self.post(self.payload).status_code == 429
+        assert journeys_on('user123') == 20
+
+    def test_failed_request_leaves_no_key(self):
+        '''A request that raises rolls back its key, so a retry runs.'''
+        def handler():
+            raise RuntimeError('boom')
+
+        with pytest.raises(RuntimeError):
+            run_once('k', 'fp', handler)
+        assert run_once('k', 'fp', lambda: (200, {'ok': True})) == (200, {'ok': True}, False)
+        assert run_once('k', 'fp', lambda: (500, {})) == (200, {'ok': True}, True)
+
+    @pytest.mark.parametrize('key', ['', ' ', 'x' * 256])
+    def test_bad_key(self, key):
+        '''Empty or oversized keys are rejected.'''
+        assert self.post(self.payload, key=key).status_code == 400
+        assert Journey.objects.count() == 0
+
+    def test_purge_expired_keys(self):
+        '''The purge command deletes expired keys only.'''
+        self.post(self.payload, key='old')
+        self.post(self.payload, key='new')
+        IdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now())
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        assert list(IdempotencyKey.objects.values_list('key', flat=True)) == ['new']
+
+
+@pytest.mark.django_db
+class TestReferenceDataETags:
+    '''Test conditional GETs on the zone and fare-rule endpoints.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+        Zone.objects.create(zone_number='1', name='Central')
+
+    @pytest.mark.parametrize('url', ['/api/zones/', '/api/fare-rules/', '/zones/'])
+    def test_matching_etag_is_not_modified(self, url, django_assert_num_queries):
+        '''A matching If-None-Match gets a 304 with no queries.'''
+        first = self.client.get(url)
+        etag = first['ETag']
+        assert first.status_code == 200
+        assert etag.startswith('"') and not etag.startswith('W/')
+
+        with django_assert_num_queries(0):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert second.status_code == 304
+        assert second['ETag'] == etag
+        assert second.content == b''
+
+    def test_body_matches_serializer_output(self):
+        '''The pre-rendered body is what the serializers produced.'''
+        data = self.client.get('/api/zones/').json()
+        assert data == {
+            'success': True,
+            'zones': [{'zone_number': '1', 'name': 'Central', 'description': '', 'is_active': True}],
+            'count': 1,
+        }
+        assert self.client.get('/zones/').content == self.client.get('/api/zones/').content
+        rules = self.client.get('/api/fare-rules/').json()
+        assert rules['success'] is True
+        assert rules['count'] == len(rules['fare_rules']) > 0
+
+    def test_change_invalidates_etag(self):
+        '''Editing zones changes the ETag, so stale copies are re-sent.'''
+        etag = self.client.get('/api/zones/')['ETag']
+        Zone.objects.create(zone_number='2', name='Inner')
+
+        response = self.client.get('/api/zones/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+        assert response.json()['count'] == 2
+
+    def test_etag_lists(self):
+        '''Lists, weak tags and * are honoured; other tags are not.'''
+        etag = self.client.get('/api/zones/')['ETag']
+        assert self.client.get('/api/zones/', HTTP_IF_NONE_MATCH=f'"x", W/{etag}').status_code == 304
+        assert self.client.get('/api/zones/', HTTP_IF_NONE_MATCH='*').status_code == 304
+        assert self.client.get('/api/zones/', HTTP_IF_NONE_MATCH='"other"').status_code == 200
+
+
+class TestProjections:
+    '''Test the fast response path produces the serializers' output.'''
+
+    @pytest.mark.django_db
+    def test_history_rows_match_serializer(self):
+        '''values() projections equal JourneyHistorySerializer output.'''
+        Journey.objects.create(user_id='u1', from_zone='1', to_zone='2', fare=55)
+        journey = Journey.objects.create(user_id='u2', from_zone='3', to_zone='3', fare=30)
+        journey.timestamp = journey.timestamp.replace(microsecond=0)
+        journey.save(update_fields=['timestamp'])
+
+        queryset = Journey.objects.order_by('id')
+        expected = JourneyHistorySerializer(queryset, many=True).data
+        assert journey_history_rows(queryset.values(*HISTORY_FIELDS)) == expected
+
+    def test_fare_calculation_matches_serializer(self):
+        '''The calculation projection equals FareCalculationResponseSerializer output.'''
+        result = SimpleFareCalculator.compiled().price_journeys(
+            [{'from_zone': '1', 'to_zone': '2'}, {'from_zone': '3', 'to_zone': '3'}]
+        )
+        result['user_id'] = 'u1'
+        assert fare_calculation_data(result) == FareCalculationResponseSerializer(result).data
+
+    @pytest.mark.parametrize('data', [
+        {'a': 1, 'b': [1.5, 55.0, None, True], 'c': 'Zone é \u2028', 'd': {'nested': 'x'}},
+        {'price': Decimal('1.10')},
+        [],
+        {'at': datetime.datetime(2025, 3, 1, 8, 15, 0, 123456, tzinfo=datetime.timezone.utc)},
+        {'at': datetime.datetime(2025, 3, 1, 8, 15, tzinfo=datetime.timezone(datetime.timedelta(hours=1)))},
+        {'at': datetime.datetime(2025, 3, 1, 8, 15), 'day': datetime.date(2025, 3, 1), 'time': datetime.time(8, 15)},
+        {'big': 1e16, 'small': 0.00001, 'huge': [-1.5e300], 'tiny': 5e-324},
+        {'plain': [1e15, 0.0001, 0.0, -0.0, 1 / 3]},
+        {'text': '0.00001 and 1e5', 'empty': None, 'price': Decimal('1E+20')},
+    ])
+    def test_renderer_matches_drf(self, data):
+        '''FastJSONRenderer output is byte-identical to JSONRenderer.'''
+        assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+    @pytest.mark.parametrize('value', [float('nan'), float('inf'), datetime.time(8, 15, tzinfo=datetime.timezone.utc)])
+    def test_renderer_refuses_what_drf_refuses(self, value):
+        '''Values JSONRenderer cannot represent are refused, not written as null.'''
+        with pytest.raises(ValueError):
+            JSONRenderer().render({'value': value})
+        with pytest.raises(ValueError):
+            FastJSONRenderer().render({'value': value})
+
+    def test_renderer_indent(self):
+        '''Indentation requested in the Accept header is honoured.'''
+        data = {'a': [1]}
+        media_type = 'application/json; indent=2'
+        assert FastJSONRenderer().render(data, media_type) == JSONRenderer().render(data, media_type)
+
+
+@pytest.mark.django_db
+class TestUserJourneyTotals:
+    '''Test the daily and monthly totals endpoints.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+
+    def post(self, user_id, *legs):
+        journeys = [{'from_zone': f, 'to_zone': t} for f, t in legs]
+        response = self.client.post('/api/calculate-fare/', {'user_id': user_id, 'journeys': journeys}, format='json')
+        assert response.status_code == 200
+
+    def test_daily_totals_follow_writes(self):
+        '''Journeys recorded through the API show up in the totals.'''
+        self.post('user123', (1, 2), (1, 2), (3, 3))
+        self.post('user123', (1, 2))
+        self.post('other', (1, 1))
+
+        data = self.client.get('/api/users/user123/totals/daily').json()
+        today = travel_day().isoformat()
+        assert data['totals'] == [{
+            'day': today,
+            'journey_count': 4,
+            'total_fare': 55 * 3 + 30,
+            'zone_pairs': [
+                {'from_zone': '1', 'to_zone': '2', 'journey_count': 3, 'total_fare': 165},
+                {'from_zone': '3', 'to_zone': '3', 'journey_count': 1, 'total_fare': 30},
+            ],
+        }]
+        assert (data['journey_count'], data['total_fare']) == (4, 195)
+
+    def test_monthly_totals_and_range(self):
+        '''Monthly totals merge days; date filters apply to travel days.'''
+        for day, fare in [(datetime.date(2025, 1, 5), 40), (datetime.date(2025, 1, 20), 55), (datetime.date(2025, 2, 1), 30)]:
+            JourneyDailyRollup.objects.create(
+                user_id='u1', day=day, from_zone='1', to_zone='2', journey_count=1, total_fare=fare,
+            )
+
+        monthly = self.client.get('/api/users/u1/totals/monthly').json()['totals']
+        assert [(m['month'], m['journey_count'], m['total_fare']) for m in monthly] == [('2025-01', 2, 95), ('2025-02', 1, 30)]
+
+        daily = self.client.get('/api/users/u1/totals/daily', {'date_from': '2025-01-10', 'date_to': '2025-01-31'}).json()
+        assert [d['day'] for d in daily['totals']] == ['2025-01-20']
+
+    def test_cost_does_not_grow_with_journeys(self, django_assert_num_queries):
+        '''Totals are one query over rollup rows.'''
+        for _ in range(3):
+            self.post('user123', *[(1, 2)] * 5)
+        with django_assert_num_queries(1):
+            data = self.client.get('/api/users/user123/totals/daily').json()
+        assert data['journey_count'] == 15
+
+    def test_bad_date(self):
+        '''Malformed dates are rejected.'''
+        response = self.client.get('/api/users/u1/totals/daily', {'date_from': '01/02/2025'})
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestAsyncViews:
+    '''Test the ASGI views give the same answers as the DRF ones.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, request, **kwargs):
+        '''Run an async view to completion.'''
+        return async_to_sync(view.as_view())(request, **kwargs)
+
+    def calculate(self, payload):
+        request = self.factory.post('/api/calculate-fare/', data=payload, content_type='application/json')
+        return self.call(AsyncCalculateFareView, request)
+
+    def test_calculate_matches_sync_view(self):
+        '''The async calculate endpoint prices and stores journeys.'''
+        payload = {'user_id': 'user123', 'journeys': [{'from_zone': 1, 'to_zone': 2}, {'from_zone': 3, 'to_zone': 3}]}
+        response = self.calculate(payload)
+        expected = self.client.post('/api/calculate-fare/', payload, format='json').json()
+
+        assert response.status_code == 200
+        assert json.loads(response.content) == expected
+        assert Journey.objects.filter(user_id='user123').count() == 4
+
+    def test_calculate_errors(self):
+        '''Bad payloads, unknown zones and the quota are rejected as before.'''
+        assert self.calculate({'journeys': []}).status_code == 400
+        assert self.calculate({'user_id': 'u', 'journeys': [{'from_zone': 1, 'to_zone': 9}]}).status_code == 400
+
+        journeys = [{'from_zone': 1, 'to_zone': 1}] * 20
+        assert self.calculate({'user_id': 'u', 'journeys': journeys}).status_code == 200
+        assert self.calculate({'user_id': 'u', 'journeys': journeys[:1]}).status_code == 429
+
+    def test_history_and_count(self):
+        '''History pages and counts match the sync endpoints.'''
+        Journey.objects.bulk_create([
+            Journey(user_id='user123' if i % 2 else 'user456', from_zone='1', to_zone='2', fare=55)
+            for i in range(9)
+        ])
+        params = {'page_size': 3, 'count': 'true'}
+
+        for path, view, kwargs in [
+            ('/api/journeys/', AsyncJourneyHistoryView, {}),
+            ('/api/users/user123/journeys/', AsyncUserJourneyHistoryView, {'user_id': 'user123'}),
+        ]:
+            response = self.call(view, self.factory.get(path, params), **kwargs)
+            assert json.loads(response.content) == self.client.get(path, params).json()
+
+        response = self.call(AsyncUserJourneyCountView, self.factory.get('/'), user_id='user123')
+        assert json.loads(response.content) == {'count': 4}
+
+    def test_calculate_idempotency_key(self):
+        '''The async endpoint replays repeats of an Idempotency-Key.'''
+        payload = {'user_id': 'user123', 'journeys': [{'from_zone': 1, 'to_zone': 2}]}
+        for _ in range(2):
+            request = self.factory.post(
+                '/api/calculate-fare/', data=payload, content_type='application/json',
+                headers={'Idempotency-Key': 'async-1'},
+            )
+            response = self.call(AsyncCalculateFareView, request)
+        assert response['Idempotent-Replayed'] == 'true'
+        assert Journey.objects.count() == 1
+
+    def test_history_bad_cursor(self):
+        '''Malformed cursors are rejected.'''
+        response = self.call(AsyncJourneyHistoryView, self.factory.get('/api/journeys/', {'cursor': 'nope'}))
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestBulkJourneys:
+    '''Test POST /api/journeys/bulk/.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+
+    def post(self, payload, **headers):
+        return self.client.post('/api/journeys/bulk/', payload, format='json', **headers)
+
+    def test_per_record_status(self):
+        '''Valid records are stored; the others get their own status.'''
+        payload = {
+            'user_id': ['u1', 'u2', 'u3', '', 'u4'],
+            'from_zone': ['1', 2, '9', '1', '1'],
+            'to_zone': ['2', '2', '1', '1', '1'],
+            'timestamp': ['2025-03-01T08:15:00+00:00', None, None, None, '2025-03-01T08:15:00'],
+        }
+        response = self.post(payload)
+
+        assert response.status_code == 200
+        data = response.json()['data']
+        codes = data['status_codes']
+        assert [codes[code] for code in data['status']] == [
+            'accepted', 'accepted', 'invalid_zone', 'invalid_record', 'invalid_record',
+        ]
+        assert data['fare'] == [55, 35, 0, 0, 0]
+        assert (data['received'], data['accepted'], data['total_fare']) == (5, 2, 90)
+
+        stored = Journey.objects.get(user_id='u1')
+        assert stored.timestamp == datetime.datetime(2025, 3, 1, 8, 15, tzinfo=datetime.timezone.utc)
+        assert set(JourneyDailyRollup.objects.values_list('user_id', 'journey_count')) == {('u1', 1), ('u2', 1)}
+
+    def test_quota_is_per_user_and_day(self):
+        '''Records past a user's daily limit are rejected, in upload order.'''
+        self.client.post('/api/calculate-fare/', {
+            'user_id': 'u1', 'journeys': [{'from_zone': 1, 'to_zone': 1}] * 18,
+        }, format='json')
+        yesterday = (timezone.now() - datetime.timedelta(days=1)).isoformat()
+        payload = {
+            'user_id': ['u1'] * 4 + ['u2', 'u1'],
+            'from_zone': ['1'] * 6,
+            'to_zone': ['1'] * 6,
+            'timestamp': [None] * 4 + [None, yesterday],
+        }
+        data = self.post(payload).json()['data']
+
+        assert data['status'] == [0, 0, 3, 3, 0, 0]
+        assert journeys_on('u1') == 20
+        assert journeys_on('u1', day=travel_date_of(timezone.now() - datetime.timedelta(days=1))) == 1
+
+    def test_query_count_does_not_grow_with_records(self, django_assert_max_num_queries):
+        '''Quotas, journeys and rollups are written in bulk.'''
+        payload = {
+            'user_id': [f'u{n}' for n in range(100)],
+            'from_zone': ['1'] * 100,
+            'to_zone': ['2'] * 100,
+        }
+        with django_assert_max_num_queries(12):
+            data = self.post(payload).json()['data']
+        assert data['accepted'] == 100
+        assert Journey.objects.count() == 100
+
+    @pytest.mark.parametrize('payload', [
+        [],
+        {'user_id': ['u1'], 'from_zone': ['1']},
+        {'user_id': ['u1'], 'from_zone': ['1'], 'to_zone': ['1', '2']},
+        {'user_id': [], 'from_zone': [], 'to_zone': []},
+    ])
+    def test_malformed_upload(self, payload):
+        '''Uploads with missing or uneven columns are rejected whole.'''
+        response = self.post(payload)
+        assert response.status_code == 400
+        assert Journey.objects.count() == 0
+
+    def test_idempotent_retry(self):
+        '''A retried upload with the same key is replayed, not stored twice.'''
+        payload = {'user_id': ['u1', 'u2'], 'from_zone': ['1', '1'], 'to_zone': ['2', '2']}
+        first = self.post(payload, HTTP_IDEMPOTENCY_KEY='gate-7-batch-1')
+        second = self.post(payload, HTTP_IDEMPOTENCY_KEY='gate-7-batch-1')
+
+        assert second.json() == first.json()
+        assert second['Idempotent-Replayed'] == 'true'
+        assert Journey.objects.count() == 2
+
+
+@pytest.mark.django_db
+class TestImportGateLogs:
+    '''Test the import_gate_logs management command (api.gate_logs).'''
+
+    ROWS = [
+        ('u1', '1', '2', '2025-03-01T08:15:00+00:00'),
+        ('u2', '2', '2', '2025-03-01T23:30:00+00:00'),
+        ('', '1', '1', '2025-03-01T09:00:00+00:00'),
+        ('u3', '1', '9', '2025-03-01T09:00:00+00:00'),
+        ('u4', '1', '1', '2025-03-01T09:00:00'),
+        ('u5', '3', '1', '2999-01-01T00:00:00+00:00'),
+        ('u6', '3', '1', 'yesterday'),
+        ('u7', '3', '1', '2025-03-02T07:00:00Z'),
+    ]
+
+    def write_csv(self, path, rows):
+        path.write_text('user_id,from_zone,to_zone,timestamp\n' + ''.join(','.join(row) + '\n' for row in rows))
+        return str(path)
+
+    def run(self, path, *args):
+        output = io.StringIO()
+        call_command('import_gate_logs', path, *args, stdout=output)
+        return output.getvalue()
+
+    def rejects(self, path):
+        with open(f'{path}.rejects.ndjson') as source:
+            return [json.loads(line) for line in source]
+
+    def test_csv(self, tmp_path):
+        '''Valid lines are stored with their own timestamps; the rest are rejected with a reason.'''
+        path = self.write_csv(tmp_path / 'gates.csv', self.ROWS)
+        output = self.run(path)
+
+        assert 'Imported' in output
+        stored = {journey.user_id: journey for journey in Journey.objects.all()}
+        assert set(stored) == {'u1', 'u2', 'u7'}
+        assert stored['u1'].timestamp == datetime.datetime(2025, 3, 1, 8, 15, tzinfo=datetime.timezone.utc)
+        assert stored['u1'].fare == 55
+        assert stored['u2'].travel_date == travel_date_of(stored['u2'].timestamp)
+        assert JourneyDailyRollup.objects.filter(user_id='u1').get().journey_count == 1
+        assert [(reject['line'], reject['reason']) for reject in self.rejects(path)] == [
+            (4, 'invalid user_id'),
+            (5, 'no fare between these zones'),
+            (6, 'timestamp without UTC offset'),
+            (7, 'timestamp in the future'),
+            (8, 'invalid timestamp'),
+        ]
+        assert self.rejects(path)[0]['record'] == ',1,1,2025-03-01T09:00:00+00:00'
+
+    def test_ndjson(self, tmp_path):
+        '''NDJSON lines may give zones as numbers; malformed lines are rejected.'''
+        path = tmp_path / 'gates.ndjson'
+        path.write_text(
+            '{"user_id": "u1", "from_zone": 1, "to_zone": 2, "timestamp": "2025-03-01T08:15:00+00:00"}\n'
+            '{"user_id": "u2", "from_zone": "1"\n'
+            '["u3", 1, 2, "2025-03-01T08:15:00+00:00"]\n'
+            '\n'
+            '{"user_id": "u4", "from_zone": "3", "to_zone": "3", "timestamp": "2025-03-01T08:15:00+00:00"}\n'
+        )
+        self.run(str(path))
+
+        assert sorted(Journey.objects.values_list('user_id', 'fare')) == [('u1', 55), ('u4', 30)]
+        assert [(reject['line'], reject['reason']) for reject in self.rejects(path)] == [
+            (2, 'malformed record'), (3, 'malformed record'),
+        ]
+
+    def test_assume_time_zone(self, tmp_path):
+        '''Timestamps without an offset are taken in the given time zone.'''
+        path = self.write_csv(tmp_path / 'gates.csv', [('u4', '1', '1', '2025-07-01T09:00:00')])
+        self.run(path, '--assume-time-zone', 'Europe/London')
+
+        assert Journey.objects.get().timestamp == datetime.datetime(2025, 7, 1, 8, 0, tzinfo=datetime.timezone.utc)
+
+    def test_resume_after_failure(self, tmp_path, monkeypatch):
+        '''An interrupted import resumes after its last stored chunk, storing and rejecting each line once.'''
+        from api import gate_logs
+
+        path = self.write_csv(tmp_path / 'gates.csv', self.ROWS * 3)
+        load_journeys = gate_logs.load_journeys
+        calls = []
+
+        def failing_load(*columns):
+            calls.append(len(columns[0]))
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return load_journeys(*columns)
+
+        monkeypatch.setattr(gate_logs, 'load_journeys', failing_load)
+        with pytest.raises(RuntimeError):
+            self.run(path, '--chunk-size', '8')
+        assert Journey.objects.count() == 3
+        assert len(self.rejects(path)) == 10  # the failed chunk's rejects are written, then cut back
+
+        self.run(path, '--chunk-size', '8')
+
+        assert Journey.objects.count() == 9
+        assert [reject['line'] for reject in self.rejects(path)] == [
+            line + 8 * chunk for chunk in range(3) for line in (4, 5, 6, 7, 8)
+        ]
+
+    def test_imported_file_is_not_imported_again(self, tmp_path):
+        '''A completed import is refused, and so is restarting it once it stored journeys.'''
+        from django.core.management.base import CommandError
+
+        path = self.write_csv(tmp_path / 'gates.csv', self.ROWS[:2])
+        self.run(path)
+        with pytest.raises(CommandError, match='already imported'):
+            self.run(path)
+        with pytest.raises(CommandError, match='already stored 2 journeys'):
+            self.run(path, '--restart')
+
+        assert Journey.objects.count() == 2
+        assert sum(JourneyDailyRollup.objects.values_list('journey_count', flat=True)) == 2
+
+    def test_restart_without_stored_journeys(self, tmp_path):
+        '''An import that stored nothing may be restarted, e.g. after fixing its time zone.'''
+        path = self.write_csv(tmp_path / 'gates.csv', [('u4', '1', '1', '2025-07-01T09:00:00')])
+        self.run(path)
+        assert Journey.objects.count() == 0
+
+        self.run(path, '--restart', '--assume-time-zone', 'Europe/London')
+        assert Journey.objects.count() == 1
+
+    def test_changed_file_is_not_resumed(self, tmp_path, monkeypatch):
+        '''A file that changed after some of it was stored is refused, restarted or not.'''
+        from django.core.management.base import CommandError
+        from api import gate_logs
+
+        path = self.write_csv(tmp_path / 'gates.csv', self.ROWS * 2)
+        load_journeys = gate_logs.load_journeys
+        calls = []
+
+        def failing_load(*columns):
+            calls.append(len(columns[0]))
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return load_journeys(*columns)
+
+        monkeypatch.setattr(gate_logs, 'load_journeys', failing_load)
+        with pytest.raises(RuntimeError):
+            self.run(path, '--chunk-size', '8')
+        self.write_csv(tmp_path / 'gates.csv', self.ROWS * 3)
+
+        with pytest.raises(CommandError, match='cannot be resumed; 3 journeys from its first 8 lines'):
+            self.run(path)
+        with pytest.raises(CommandError, match='cannot be restarted'):
+            self.run(path, '--restart')
+        assert Journey.objects.count() == 3
+
+    def test_missing_column(self, tmp_path):
+        '''A CSV without the expected columns is rejected whole.'''
+        from django.core.management.base import CommandError
+
+        path = tmp_path / 'gates.csv'
+        path.write_text('user,from_zone,to_zone,timestamp\nu1,1,2,2025-03-01T08:15:00+00:00\n')
+        with pytest.raises(CommandError, match='user_id'):
+            self.run(str(path))
+        assert Journey.objects.count() == 0
+
+
+@pytest.mark.django_db
+class TestWriteBehind:
+    '''Test POST /api/calculate-fare/ with JOURNEY_WRITE_BEHIND on.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self, settings, monkeypatch, django_capture_on_commit_callbacks):
+        '''Setup for each test.'''
+        settings.JOURNEY_WRITE_BEHIND = True
+        self.writer = JourneyWriter(max_size=4, batch_size=10, flush_interval=1, background=False)
+        monkeypatch.setattr('api.services.journey_writer', lambda on_flush=None: self.writer)
+        self.client = APIClient()
+        self.on_commit = django_capture_on_commit_callbacks
+
+    def post(self, count, **headers):
+        payload = {'user_id': 'user123', 'journeys': [{'from_zone': 1, 'to_zone': 2}] * count}
+        # Journeys are queued by an on_commit callback
+        with self.on_commit(execute=True):
+            return self.client.post('/api/calculate-fare/', payload, format='json', **headers)
+
+    def test_journeys_are_stored_on_flush(self):
+        '''The response does not wait for the insert; the quota is reserved at once.'''
+        response = self.post(3)
+        assert response.status_code == 200
+        assert response.json()['data']['total_fare'] == 165
+        assert Journey.objects.count() == 0
+        assert journeys_on('user123') == 3
+
+        self.writer.flush()
+        assert Journey.objects.count() == 3
+
+    def test_quota_counts_queued_journeys(self):
+        '''Journeys still waiting to be stored count against the daily limit.'''
+        self.writer.max_size = 100
+        assert self.post(18).status_code == 200
+        assert self.post(3).status_code == 429
+        assert self.post(2).status_code == 200
+        self.writer.flush()
+        assert Journey.objects.count() == 20
+
+    def test_full_queue_is_503(self, settings):
+        '''A full queue turns requests away without reserving quota.'''
+        settings.JOURNEY_WRITE_BEHIND_PUT_TIMEOUT = 0.01
+        assert self.post(4).status_code == 200
+        response = self.post(1, HTTP_IDEMPOTENCY_KEY='retry-me')
+        assert response.status_code == 503
+        assert journeys_on('user123') == 4
+
+        # The 503 is not replayed: once there is room the retry runs
+        self.writer.flush()
+        assert self.post(1, HTTP_IDEMPOTENCY_KEY='retry-me').status_code == 200
+
+
+@pytest.mark.django_db(databases=['default', 'replica'])
+class TestReadReplicas:
+    '''Test routing reads to a replica, with read-your-writes pinning.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self, settings):
+        '''Setup for each test.'''
+        settings.DATABASE_REPLICAS = ['replica']
+        self.client = APIClient()
+
+    def on_replica(self, user_id, count=1):
+        Journey.objects.using('replica').bulk_create([
+            Journey(user_id=user_id, from_zone='1', to_zone='1', fare=40) for _ in range(count)
+        ])
+
+    def history(self, client, user_id):
+        return client.get(f'/api/users/{user_id}/journeys/').json()['journeys']
+
+    def test_get_reads_replica(self):
+        '''History requests are served from the replica.'''
+        self.on_replica('u1', 2)
+        assert len(self.history(self.client, 'u1')) == 2
+        assert len(self.client.get('/api/journeys/').json()['journeys']) == 2
+        assert Journey.objects.count() == 0
+
+    def test_writer_is_pinned_to_primary(self):
+        '''After a write the client reads the primary, also for other riders' journeys.'''
+        response = self.client.post('/api/calculate-fare/', {
+            'user_id': 'u1', 'journeys': [{'from_zone': 1, 'to_zone': 2}],
+        }, format='json')
+        assert response.cookies[PIN_COOKIE]['max-age'] == 5
+
+        # Another client reads the lagging replica; the writer does not
+        other = APIClient()
+        assert other.get('/api/journeys/').json()['journeys'] == []
+        assert len(self.client.get('/api/journeys/').json()['journeys']) == 1
+
+    def test_cross_origin_client_reads_own_writes(self, settings, django_capture_on_commit_callbacks):
+        '''
+        Clients without the pin cookie (the frontend calls the API
+        cross-origin without credentials) read a rider's journeys from the
+        primary within the pin window after the rider's last write.
+        '''
+        origin = {'HTTP_ORIGIN': 'http://localhost:3000'}
+        with django_capture_on_commit_callbacks(execute=True):
+            response = APIClient().post('/api/calculate-fare/', {
+                'user_id': 'u1', 'journeys': [{'from_zone': 1, 'to_zone': 2}],
+            }, format='json', **origin)
+        assert response['Access-Control-Allow-Origin'] == 'http://localhost:3000'
+
+        assert len(APIClient().get('/api/users/u1/journeys/', **origin).json()['journeys']) == 1
+        assert APIClient().get('/api/users/u1/journeys/count', **origin).json()['count'] == 1
+        # Other riders are still read from the replica
+        self.on_replica('u2')
+        assert len(self.history(APIClient(), 'u2')) == 1
+
+        # Past the pin window, the rider is read from the replica again,
+        # and those pages are cached
+        settings.DATABASE_REPLICA_PIN_SECONDS = 0
+        assert self.history(APIClient(), 'u1') == []
+        self.on_replica('u1')
+        assert self.history(APIClient(), 'u1') == []
+
+    def test_fare_rules_compiled_from_primary(self):
+        '''A GET compiling the fare rules reads them from the primary, not a lagging replica.'''
+        from fare.models import FareRule
+
+        FareRule.objects.create(from_zone='1', to_zone='1', fare=99)
+        assert self.client.get('/api/fare-rules/').status_code == 200
+
+        response = APIClient().post('/api/calculate-fare/', {
+            'user_id': 'u1', 'journeys': [{'from_zone': '1', 'to_zone': '1'}],
+        }, format='json')
+        assert response.json()['data']['total_fare'] == 99
+
+    def test_read_after_write_in_request(self):
+        '''Within a request, reads follow a write to the primary.'''
+        router = ReplicaRouter()
+        with replica_reads():
+            assert router.db_for_read(Journey) == 'replica'
+            assert router.db_for_write(Journey) == 'default'
+            assert router.db_for_read(Journey) == 'default'
+
+    def test_outside_requests_use_primary(self, settings):
+        '''Commands and background work read the primary; replicas are not migrated.'''
+        router = ReplicaRouter()
+        assert router.db_for_read(Journey) == 'default'
+        assert not router.allow_migrate('replica', 'fare')
+        assert router.allow_migrate('default', 'fare')
+
+        settings.DATABASE_REPLICAS = []
+        with replica_reads():
+            assert router.db_for_read(Journey) == 'default'
+
+
+class TestConcurrencyLimit:
+    '''Test backend.concurrency.ConcurrencyLimitMiddleware under ASGI.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self, settings):
+        '''Setup for each test.'''
+        settings.ASGI_MAX_CONCURRENT_REQUESTS = 2
+        self.factory = AsyncRequestFactory()
+
+    def test_waits_for_a_free_slot(self):
+        '''Past the limit, requests wait until one in flight finishes.'''
+        from django.http import HttpResponse
+        from backend.concurrency import ConcurrencyLimitMiddleware
+
+        running, peak = 0, 0
+
+        async def view(request):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return HttpResponse('ok')
+
+        middleware = ConcurrencyLimitMiddleware(view)
+
+        async def serve():
+            return await asyncio.gather(*(middleware(self.factory.get('/')) for _ in range(5)))
+
+        assert [response.status_code for response in async_to_sync(serve)()] == [200] * 5
+        assert peak == 2
+
+    def test_streaming_keeps_its_slot(self):
+        '''A streaming response holds its slot until its body is sent.'''
+        from django.http import HttpResponse, StreamingHttpResponse
+        from backend.concurrency import ConcurrencyLimitMiddleware
+
+        async def body():
+            yield b'row\n'
+
+        async def view(request):
+            if request.path == '/export':
+                return StreamingHttpResponse(body())
+            return HttpResponse('ok')
+
+        middleware = ConcurrencyLimitMiddleware(view)
+
+        async def serve():
+            exports = [await middleware(self.factory.get('/export')) for _ in range(2)]
+            waiting = asyncio.ensure_future(middleware(self.factory.get('/')))
+            await asyncio.sleep(0.01)
+            assert not waiting.done()
+            assert [chunk async for chunk in exports[0]] == [b'row\n']
+            return await waiting
+
+        assert async_to_sync(serve)().status_code == 200
+
+
+@pytest.mark.django_db
+class TestRequestMetrics:
+    '''Test the Server-Timing header and the /metrics endpoint.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Setup for each test.'''
+        self.client = APIClient()
+
+    def metric(self, text, line_prefix):
+        for line in text.splitlines():
+            if line.startswith(line_prefix + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        assert response.status_code == 200
+        assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+        return response.content.decode()
+
+    def test_server_timing(self):
+        '''Each response reports its SQL, serialization and total time.'''
+        response = self.client.post('/api/calculate-fare/', {
+            'user_id': 'u1', 'journeys': [{'from_zone': 1, 'to_zone': 2}],
+        }, format='json')
+        timing = response['Server-Timing']
+        assert re.match(r'db;dur=[\d.]+;desc="[1-9]\d* queries", serialize;dur=[\d.]+, total;dur=[\d.]+$', timing)
+
+    def test_metrics_per_url_name(self):
+        '''Requests are counted per URL name, with cumulative latency buckets.'''
+        view = 'view="api:zone-list"'
+        before = self.metric(self.scrape(), f'http_request_duration_seconds_count{{{view}}}')
+        self.client.get('/api/zones/')
+        self.client.get('/api/zones/')
+        text = self.scrape()
+
+        count = self.metric(text, f'http_request_duration_seconds_count{{{view}}}')
+        assert count == before + 2
+        assert self.metric(text, f'http_request_duration_seconds_bucket{{{view},le="+Inf"}}') == count
+        assert self.metric(text, f'http_response_bytes_total{{{view}}}') > 0
+        assert '# TYPE http_request_sql_queries_total counter' in text
+        assert 'fare_cache_misses_total{namespace="fare"}' in text
+
+    def test_totals_across_processes(self, settings, tmp_path):
+        '''With METRICS_DIR, other workers' files are added in.'''
+        settings.METRICS_DIR = str(tmp_path)
+        view = 'view="api:fare-rules"'
+        before = self.metric(self.scrape(), f'http_request_duration_seconds_count{{{view}}}')
+
+        other = [0] * metrics.ROW_SIZE
+        other[0] = other[metrics.COUNT] = 5
+        other[metrics.QUERIES] = 7
+        (tmp_path / '999999.json').write_text(json.dumps({
+            'views': {'api:fare-rules': other}, 'cache': {'fare': {'hits': 3, 'misses': 1}},
+        }))
+        text = self.scrape()
+
+        assert self.metric(text, f'http_request_duration_seconds_count{{{view}}}') == before + 5
+        assert self.metric(text, f'http_request_duration_seconds_bucket{{{view},le="0.001"}}') >= 5
+        assert self.metric(text, 'fare_cache_hits_total{namespace="fare"}') >= 3
+        # This process wrote its own file while serving the scrapes
+        assert (tmp_path / f'{os.getpid()}.json').exists()
+
+
+# Rows seeded for the 'large history' scenarios
+LARGE_HISTORY = 500
+
+LEG = {'from_zone': 1, 'to_zone': 2}
+
+# Query budgets per endpoint and scenario:
+# (URL name, scenario, seeded history rows, method, path, body, max queries).
+# Counts include compiling the fare rule snapshot, which each test starts
+# without. TestQueryBudgets.test_every_url_has_a_budget keeps this list in
+# step with api/urls.py.
+QUERY_BUDGETS = [
+    ('calculate-fare', '1 journey', 0, 'post', '/api/calculate-fare/', {'user_id': 'user123', 'journeys': [LEG]}, 14),
+    ('calculate-fare', '20 journeys', 0, 'post', '/api/calculate-fare/', {'user_id': 'user123', 'journeys': [LEG] * 20}, 14),
+    ('calculate-fare', '1 journey, large history', LARGE_HISTORY, 'post', '/api/calculate-fare/',
+     {'user_id': 'user123', 'journeys': [LEG]}, 14),
+    ('journey-bulk', '1 record', 0, 'post', '/api/journeys/bulk/',
+     {'user_id': ['user123'], 'from_zone': ['1'], 'to_zone': ['2']}, 12),
+    ('journey-bulk', '20 records', 0, 'post', '/api/journeys/bulk/',
+     {'user_id': [f'u{n}' for n in range(20)], 'from_zone': ['1'] * 20, 'to_zone': ['2'] * 20}, 12),
+    ('journey-bulk', '20 records, large history', LARGE_HISTORY, 'post', '/api/journeys/bulk/',
+     {'user_id': ['user123'] * 20, 'from_zone': ['1'] * 20, 'to_zone': ['2'] * 20}, 12),
+    ('zone-list', 'default', 0, 'get', '/api/zones/', None, 3),
+    ('fare-rules', 'default', 0, 'get', '/api/fare-rules/', None, 3),
+    ('journey-history', 'empty', 0, 'get', '/api/journeys/', None, 1),
+    ('journey-history', 'large history', LARGE_HISTORY, 'get', '/api/journeys/', None, 1),
+    ('journey-history', 'large history, filtered with count', LARGE_HISTORY, 'get',
+     '/api/journeys/?fare=>30&ordering=-fare&count=true', None, 2),
+    ('user-journeys', 'empty', 0, 'get', '/api/users/user123/journeys/', None, 1),
+    ('user-journeys', 'large history', LARGE_HISTORY, 'get', '/api/users/user123/journeys/?page_size=500', None, 1),
+    ('user-journeys-count', 'empty', 0, 'get', '/api/users/user123/journeys/count', None, 2),
+    ('user-journeys-count', 'large history', LARGE_HISTORY, 'get', '/api/users/user123/journeys/count', None, 2),
+    ('user-totals-daily', 'empty', 0, 'get', '/api/users/user123/totals/daily', None, 1),
+    ('user-totals-daily', 'large history', LARGE_HISTORY, 'get', '/api/users/user123/totals/daily', None, 1),
+    ('user-totals-monthly', 'large history', LARGE_HISTORY, 'get', '/api/users/user123/totals/monthly', None, 1),
+    ('journey-export', 'empty', 0, 'get', '/api/journeys/export.csv', None, 1),
+    ('journey-export', 'large history', LARGE_HISTORY, 'get', '/api/journeys/export.ndjson', None, 1),
+    ('user-journey-export', 'large history', LARGE_HISTORY, 'get', '/api/users/user123/journeys/export.csv', None, 1),
+]
+
+
+@pytest.mark.django_db
+class TestQueryBudgets:
+    '''Every API endpoint stays within its declared number of SQL queries.'''
+
+    def seed(self, count):
+        # Spread over users and days, with rollups, as the API would leave them
+        now = timezone.now()
+        created = Journey.objects.bulk_create([
+            Journey(
+                user_id='user123' if n % 2 else f'u{n % 7}',
+                from_zone='1', to_zone=str(1 + n % 3), fare=40 + n % 3 * 10,
+                timestamp=now - datetime.timedelta(days=n % 30),
+            )
+            for n in range(count)
+        ])
+        record_journeys(created)
+
+    @pytest.mark.parametrize(
+        'name,scenario,history,method,path,body,budget',
+        QUERY_BUDGETS,
+        ids=[f'{name}: {scenario}' for name, scenario, *_ in QUERY_BUDGETS],
+    )
+    def test_query_budget(self, query_budget, name, scenario, history, method, path, body, budget):
+        '''The request runs at most `budget` queries.'''
+        self.seed(history)
+        client = APIClient()
+        with query_budget(budget, f'{name} ({scenario})'):
+            response = getattr(client, method)(path, body, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        assert response.status_code == 200
+
+    def test_calculate_fare_warm(self, query_budget):
+        '''With the rule snapshot compiled and today's quota counter in place.'''
+        client = APIClient()
+        payload = {'user_id': 'user123', 'journeys': [LEG] * 5}
+        client.post('/api/calculate-fare/', payload, format='json')
+        with query_budget(5, 'calculate-fare (warm)'):
+            response = client.post('/api/calculate-fare/', payload, format='json')
+        assert response.status_code == 200
+
+    def test_every_url_has_a_budget(self):
+        '''New routes in api/urls.py need a budget here.'''
+        from api.urls import urlpatterns
+
+        assert {pattern.name for pattern in urlpatterns} == {name for name, *_ in QUERY_BUDGETS}
+
+
+# Journeys seeded for the query plan checks: PLAN_USERS riders over the
+# past PLAN_DAYS days, enough that a sequential scan or a full sort
+# costs more than the intended index to the planner
+PLAN_ROWS = 500_000
+PLAN_USERS = 10_000
+PLAN_DAYS = 365
+# Sequential scans of smaller relations (empty partitions), scans of them
+# using another index, and sorts of fewer input rows, are not reported
+PLAN_SMALL_ROWS = 1000
+
+# Query plans per access pattern:
+# (name, method, path, body, key columns the Journey scans must start
+# with, most Journey partitions the plan may touch or None).
+# {today} and {week_ago} are travel days.
+JOURNEY_PLANS = [
+    ('quota check', 'post', '/api/calculate-fare/', {'user_id': 'u42', 'journeys': [LEG]}, ('user_id', 'travel_date'), 1),
+    ('bulk quota check', 'post', '/api/journeys/bulk/',
+     {'user_id': ['u42', 'u43'], 'from_zone': ['1', '1'], 'to_zone': ['2', '3']}, ('user_id', 'travel_date'), 1),
+    ('daily count', 'get', '/api/users/u42/journeys/count', None, ('user_id', 'travel_date'), 1),
+    ('user history', 'get', '/api/users/u42/journeys/?count=true', None, ('user_id',), None),
+    ('user history, last week', 'get', '/api/users/u42/journeys/?date_from={week_ago}&date_to={today}', None, ('user_id',), 2),
+    ('global history', 'get', '/api/journeys/', None, ('timestamp',), None),
+    ('global history, oldest first', 'get', '/api/journeys/?ordering=timestamp', None, ('timestamp',), None),
+    ('global history by fare', 'get', '/api/journeys/?fare=>40&ordering=fare', None, ('fare',), None),
+    ('global history by fare, highest first', 'get', '/api/journeys/?fare=>40&ordering=-fare', None, ('fare',), None),
+    ('global history by from_zone', 'get', '/api/journeys/?ordering=from_zone', None, ('from_zone', 'timestamp'), None),
+    ('global history by from_zone, descending', 'get', '/api/journeys/?ordering=-from_zone', None,
+     ('from_zone', 'timestamp'), None),
+    ('global history by to_zone', 'get', '/api/journeys/?ordering=to_zone', None, ('to_zone', 'timestamp'), None),
+    ('global history by to_zone, descending', 'get', '/api/journeys/?ordering=-to_zone', None,
+     ('to_zone', 'timestamp'), None),
+    ('global history by zones', 'get', '/api/journeys/?from_zone=1&to_zone=2', None, ('from_zone', 'to_zone'), None),
+]
+
+
+@pytest.fixture(scope='class')
+def large_journey_table(django_db_setup, django_db_blocker):
+    '''
+    PLAN_ROWS journeys, generated server-side and analyzed, kept for the
+    whole class and truncated afterwards. On a partitioned table every
+    seeded month gets its own partition, as in production.
+    '''
+    from django.conf import settings
+    from django.db import connection
+    from fare.partitions import add_months, create_partition, is_partitioned, month_start
+
+    with django_db_blocker.unblock():
+        if connection.vendor != 'postgresql':
+            pytest.skip('Query plan checks need PostgreSQL')
+        today = travel_day()
+        if is_partitioned():
+            month = month_start(today - datetime.timedelta(days=PLAN_DAYS))
+            while month <= today:
+                create_partition(month)
+                month = add_months(month, 1)
+
+        table = connection.ops.quote_name(Journey._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {table} (user_id, from_zone, to_zone, fare, timestamp, travel_date)
+                SELECT 'u' || (n %% {PLAN_USERS}),
+                       (1 + n %% 3)::text,
+                       (1 + (n / 3) %% 3)::text,
+                       30 + (n %% 4) * 10,
+                       ts,
+                       (ts AT TIME ZONE %s)::date
+                FROM (
+                    SELECT n, now() - (n::float8 / {PLAN_ROWS}) * interval '{PLAN_DAYS} days' AS ts
+                    FROM generate_series(1, {PLAN_ROWS}) AS n
+                ) s
+                ''',
+                [settings.FARE_OPERATOR_TIME_ZONE],
+            )
+            # Statistics, and a visibility map for index-only scans
+            cursor.execute(f'VACUUM ANALYZE {table}')
+        yield
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {table}')
+
+
+def plan_nodes(node):
+    '''Every node of an EXPLAIN (FORMAT JSON) plan, depth first.'''
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('large_journey_table')
+class TestJourneyQueryPlans:
+    '''
+    The Journey queries behind each access pattern keep using their index
+    and, on a partitioned table, only the partitions they need, on a
+    realistically large table (PostgreSQL only).
+    '''
+
+    def explain(self, cursor, sql):
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+        return (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']
+
+    def index_keys(self, cursor, index):
+        '''(table, key columns) of an index.'''
+        cursor.execute(
+            'SELECT i.indrelid::regclass::text, a.attname FROM pg_index i '
+            'CROSS JOIN LATERAL unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, position) '
+            'JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum '
+            'WHERE i.indexrelid = %s::regclass AND k.position <= i.indnkeyatts ORDER BY k.position',
+            [index],
+        )
+        rows = cursor.fetchall()
+        return rows[0][0].strip('"'), tuple(column for _, column in rows)
+
+    def estimated_rows(self, cursor, relation):
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [relation])
+        return cursor.fetchone()[0]
+
+    def problems(self, cursor, plan, index_keys, max_partitions):
+        '''What is wrong with one query's plan, if anything.'''
+        from fare.partitions import is_partitioned
+
+        table = Journey._meta.db_table
+
+        def is_journey(relation):
+            return relation == table or relation.startswith(f'{table}_')
+
+        found, relations = [], set()
+        for node in plan_nodes(plan):
+            kind, relation = node['Node Type'], node.get('Relation Name', '')
+            if is_journey(relation):
+                relations.add(relation)
+                if kind == 'Seq Scan' and self.estimated_rows(cursor, relation) > PLAN_SMALL_ROWS:
+                    found.append(f'Seq Scan on {relation}')
+            if 'Index Name' in node:
+                indexed, keys = self.index_keys(cursor, node['Index Name'])
+                if (
+                    is_journey(indexed) and keys[:len(index_keys)] != index_keys
+                    and self.estimated_rows(cursor, indexed) > PLAN_SMALL_ROWS
+                ):
+                    found.append(f'{kind} using {node["Index Name"]} {keys}, expected an index on {index_keys}')
+            if kind in ('Sort', 'Incremental Sort') and node['Plans'][0]['Plan Rows'] > PLAN_SMALL_ROWS:
+                found.append(f'{kind} of ~{node["Plans"][0]["Plan Rows"]} rows on {node["Sort Key"]}')
+        if max_partitions is not None and is_partitioned() and len(relations) > max_partitions:
+            found.append(f'touches {len(relations)} partitions, expected at most {max_partitions}: {sorted(relations)}')
+        return found
+
+    @pytest.mark.parametrize(
+        'name,method,path,body,index_keys,max_partitions',
+        JOURNEY_PLANS,
+        ids=[name for name, *_ in JOURNEY_PLANS],
+    )
+    def test_query_plan(self, name, method, path, body, index_keys, max_partitions):
+        '''Each Journey SELECT the request runs has an acceptable plan.'''
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        today = travel_day()
+        path = path.format(today=today, week_ago=today - datetime.timedelta(days=7))
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(APIClient(), method)(path, body, format='json')
+        assert response.status_code == 200
+
+        table = connection.ops.quote_name(Journey._meta.db_table)
+        statements = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT') and table in query['sql']
+        ]
+        assert statements, f'{name} ran no Journey queries'
+
+        with connection.cursor() as cursor:
+            for sql in statements:
+                found = self.problems(cursor, self.explain(cursor, sql), index_keys, max_partitions)
+                if found:
+                    cursor.execute(f'EXPLAIN {sql}')
+                    plan = '\n'.join(row[0] for row in cursor.fetchall())
+                    pytest.fail(f'{name}: {"; ".join(found)}\n{sql}\n{plan}', pytrace=False)
@@ -1,6 +1,7 @@
 """
 URL routing for API.
 """
+from django.conf import settings
 from django.urls import path
 from .views import (
     CalculateFareAPIView,
@@ -9,18 +10,50 @@ from .views import (
     JourneyHistoryAPIView,
     UserJourneyHistoryAPIView,
     UserJourneyHistoryCountAPIView,
+    UserJourneyTotalsAPIView,
+)
+from .bulk import BulkJourneyAPIView
+from .exports import JourneyExportView
+from .async_views import (
+    AsyncCalculateFareView,
+    AsyncJourneyHistoryView,
+    AsyncUserJourneyHistoryView,
+    AsyncUserJourneyCountView,
 )
 
 app_name = 'api'
 
+if settings.API_ASYNC_VIEWS:
+    # Served by an ASGI server (see backend/asgi.py)
+    calculate_fare_view = AsyncCalculateFareView.as_view()
+    journey_history_view = AsyncJourneyHistoryView.as_view()
+    user_journeys_view = AsyncUserJourneyHistoryView.as_view()
+    user_journeys_count_view = AsyncUserJourneyCountView.as_view()
+else:
+    calculate_fare_view = CalculateFareAPIView.as_view()
+    journey_history_view = JourneyHistoryAPIView.as_view()
+    user_journeys_view = UserJourneyHistoryAPIView.as_view()
+    user_journeys_count_view = UserJourneyHistoryCountAPIView.as_view()
+
 urlpatterns = [
     # Main endpoints
-    path('calculate-fare/', CalculateFareAPIView.as_view(), name='calculate-fare'),
+    path('calculate-fare/', calculate_fare_view, name='calculate-fare'),
     path('zones/', ZoneListAPIView.as_view(), name='zone-list'),
     path('fare-rules/', FareRulesAPIView.as_view(), name='fare-rules'),
-    path('journeys/', JourneyHistoryAPIView.as_view(), name='journey-history'),
-    path('users/<str:user_id>/journeys/', UserJourneyHistoryAPIView.as_view(), name='user-journeys'),
-    path('users/<str:user_id>/journeys/count', UserJourneyHistoryCountAPIView.as_view(), name='user-journeys'),
+    path('journeys/', journey_history_view, name='journey-history'),
+    path('users/<str:user_id>/journeys/', user_journeys_view, name='user-journeys'),
+    path('users/<str:user_id>/journeys/count', user_journeys_count_view, name='user-journeys-count'),
+
+    # Many users' journeys per request, for gate controllers
+    path('journeys/bulk/', BulkJourneyAPIView.as_view(), name='journey-bulk'),
+
+    # Per-day / per-month totals from the rollups
+    path('users/<str:user_id>/totals/daily', UserJourneyTotalsAPIView.as_view(), {'period': 'daily'}, name='user-totals-daily'),
+    path('users/<str:user_id>/totals/monthly', UserJourneyTotalsAPIView.as_view(), {'period': 'monthly'}, name='user-totals-monthly'),
+
+    # Streaming exports (ndjson or csv)
+    path('journeys/export.<str:export_format>', JourneyExportView.as_view(), name='journey-export'),
+    path('users/<str:user_id>/journeys/export.<str:export_format>', JourneyExportView.as_view(), name='user-journey-export'),
 
     ]
 
@@ -6,13 +6,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view
-from django.views.decorators.cache import cache_page
-from django.utils.decorators import method_decorator
 
-from fare import SimpleFareCalculator
-from zones.models import Zone
 from fare.models import Journey  # Add this import
-from django.utils import timezone
+from fare.quota import journeys_on
+from fare.rollups import daily_totals, monthly_totals
 
 from .serializers import (
     JourneyInputSerializer,
@@ -23,15 +20,28 @@ from .serializers import (
     JourneyHistorySerializer,
     FareCalculationResponseSerializer,
 )
-ZONE = {'1','2','3'}
-
-MAX_JOURNEYS_PER_DAY = 20
+from .conditional import fare_rules_body, reference_response, zones_body
+from .filters import parse_date_range
+from .idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER
+from .services import (
+    HISTORY_CACHE,
+    calculate_fares_once,
+    history_body,
+    history_cache_slot,
+    pin_recent_writer,
+    prepare_history_page,
+    wants_count,
+)
 
 class CalculateFareAPIView(APIView):
     '''
     Calculate fare for a single journey.
     
     POST /api/calculate-fare/
+
+    Send an Idempotency-Key header to make retries safe: repeats with the
+    same key replay the first response (with Idempotent-Replayed: true)
+    instead of recording the journeys again.
     
     Request:
         {   'user_id': '1',
@@ -69,70 +79,13 @@ class CalculateFareAPIView(APIView):
         journeys = serializer.validated_data['journeys']
         user_id = serializer.validated_data['user_id']
 
-        # Count how many journeys this user has already made today
-        today = timezone.now().date()
-
-        existing_journeys_count = Journey.objects.filter(
-            user_id=user_id,
-            timestamp__date=today
-        ).count()
-        new_journeys_count = len(journeys)
-        if existing_journeys_count+new_journeys_count > MAX_JOURNEYS_PER_DAY:
-            return Response(
-                {
-                    "success": False,
-                    "error": f"Maximum {MAX_JOURNEYS_PER_DAY} journeys per day exceeded. "
-                            f"You already have {existing_journeys_count} journeys today."
-                },
-                status=status.HTTP_429_TOO_MANY_REQUESTS
-            )
-
-        try:
-            # Calculate fare using SimpleFareCalculator
-            result = SimpleFareCalculator.calculate_batch_fares(journeys)
-            result['user_id'] = user_id
-            for jour in result['journeys']:
-                # Extract zones
-                from_zone = jour.get('from_zone')
-                to_zone = jour.get('to_zone')
-                fare = jour.get('fare')
-                if from_zone not in ZONE or to_zone not in ZONE:
-                    return Response(
-                    {
-                        'success': False,
-                        'error': 'zone is invalid'
-                    },
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                journey = Journey.objects.create(
-                    user_id = str(user_id), #extend requirement to make storage as user_id 
-                    from_zone=str(from_zone),
-                    to_zone=str(to_zone),
-                    fare=int(fare),  # Store as integer
-                )
-
-
-            # Prepare response data
-            response_serializer = FareCalculationResponseSerializer(result)
-
-            return Response(
-                {
-                    'success': True,
-                    'data': response_serializer.data
-                },
-                status=status.HTTP_200_OK
-            )
-            
-            
-        except ValueError as e:
-            # Handle calculation errors
-            return Response(
-                {
-                    'success': False,
-                    'error': str(e)
-                },
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        status_code, body, replayed = calculate_fares_once(
+            request.headers.get(IDEMPOTENCY_HEADER), user_id, journeys
+        )
+        response = Response(body, status=status_code)
+        if replayed:
+            response[REPLAYED_HEADER] = 'true'
+        return response
 
 
 class ZoneListAPIView(APIView):
@@ -140,19 +93,15 @@ class ZoneListAPIView(APIView):
     List all active zones.
     
     GET /api/zones/
+
+    Responses carry a strong ETag; send it back in If-None-Match to get
+    a 304 when the zones have not changed.
     '''
     
-    @method_decorator(cache_page(60 * 15))  # Cache for 15 minutes
     def get(self, request):
         '''Get all active zones.'''
-        zones = Zone.objects.filter(is_active=True).order_by('zone_number')
-        serializer = ZoneSerializer(zones, many=True)
-        
-        return Response({
-            'success': True,
-            'zones': serializer.data,
-            'count': zones.count()
-        }, status=status.HTTP_200_OK)
+        # Pre-rendered from the fare rule snapshot; 304 on a matching ETag
+        return reference_response(request, 'zones', zones_body)
 
 
 class FareRulesAPIView(APIView):
@@ -161,44 +110,67 @@ class FareRulesAPIView(APIView):
     
     GET /api/fare-rules/
     
-    Note: This doesn't use a database model - rules come from SimpleFareCalculator.
+    Note: Rules come from the fare rule snapshot (FareRule rows, or the
+    SimpleFareCalculator defaults when none are configured).
     '''
     
-    @method_decorator(cache_page(60 * 60))  # Cache for 1 hour (rules don't change)
     def get(self, request):
         '''Get all fare rules.'''
-        rules = SimpleFareCalculator.get_all_fare_rules()
-        serializer = FareRuleSerializer(rules, many=True)
-        
-        return Response({
-            'success': True,
-            'fare_rules': serializer.data,
-            'count': len(rules)
-        }, status=status.HTTP_200_OK)
+        return reference_response(request, 'fare_rules', fare_rules_body)
+
+def journey_history_page(request, journeys, **extra):
+    '''
+    Build a filtered, paginated journey history response.
+    See api.services.prepare_history_page for the query parameters.
+    '''
+    params = request.query_params
+
+    # A user's pages are served from the shared cache until they record
+    # new journeys. Requests reading the primary to see recent writes
+    # skip it: the cached page may have been read from a lagging replica.
+    slot = history_cache_slot(extra['user_id'], params) if 'user_id' in extra else None
+    if slot:
+        key, generation = slot
+        data = HISTORY_CACHE.get(key, version=generation)
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK)
+
+    try:
+        journeys, paginator, page_size = prepare_history_page(journeys, params)
+        rows, next_cursor = paginator.paginate(journeys, page_size, params.get('cursor'))
+    except ValueError as e:
+        return Response(
+            {
+                'success': False,
+                'error': str(e)
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    data = history_body(rows, next_cursor, page_size, **extra)
+    if wants_count(params):
+        data['count'] = journeys.count()
+    if slot:
+        HISTORY_CACHE.set(key, data, version=generation)
+    return Response(data, status=status.HTTP_200_OK)
+
 
 class JourneyHistoryAPIView(APIView):
     '''
-    Get journey history.
+    Get journey history, one page at a time.
     
-    GET /api/journeys/
+    GET /api/journeys/?fare=>30&from_zone=1&ordering=-fare&cursor=<next_cursor>
     '''
     
     def get(self, request):
         '''Get journey history '''
-        # Get journey history
-        journeys = Journey.objects.all()
-        serializer = JourneyHistorySerializer(journeys, many=True)
-        return Response({
-            'success': True,
-            'journeys': serializer.data,
-            'count': journeys.count()
-        }, status=status.HTTP_200_OK)
+        return journey_history_page(request, Journey.objects.all())
     
 class UserJourneyHistoryAPIView(APIView):
     '''
-    Get journey history for a specific user.
+    Get journey history for a specific user, one page at a time.
     
-    GET /api/users/{user_id}/journeys/
+    GET /api/users/{user_id}/journeys/?fare=<60&date_from=2025-01-01&cursor=<next_cursor>
     '''
     
     def get(self, request, user_id=None):
@@ -217,19 +189,7 @@ class UserJourneyHistoryAPIView(APIView):
             )
         
         journeys = Journey.objects.filter(user_id=user_id)
-        
-        
-        # Serialize journeys
-        serializer = JourneyHistorySerializer(journeys, many=True)
-        
-
-        
-        return Response({
-            'success': True,
-            'user_id': user_id,
-            'journeys': serializer.data,
-            'count': journeys.count()
-        }, status=status.HTTP_200_OK)
+        return journey_history_page(request, journeys, user_id=user_id)
     
 class UserJourneyHistoryCountAPIView(APIView):
     '''
@@ -252,11 +212,59 @@ class UserJourneyHistoryCountAPIView(APIView):
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
-        today = timezone.now().date()
-        journeysCount = Journey.objects.filter(
-            user_id=user_id, 
-            timestamp__date=today).count()
+        # Read from the daily quota counter instead of counting journeys
+        pin_recent_writer(user_id)
+        journeysCount = journeys_on(user_id)
         
         return Response({
             'count': journeysCount
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+class UserJourneyTotalsAPIView(APIView):
+    '''
+    A user's journey counts and spend per day or per month, with a
+    breakdown by zone pair. Served from fare.rollups, so the cost grows
+    with the number of days, not journeys.
+
+    GET /api/users/{user_id}/totals/daily?date_from=2025-01-01&date_to=2025-01-31
+    GET /api/users/{user_id}/totals/monthly
+
+    Response:
+        {
+            'success': true,
+            'user_id': '1',
+            'period': 'daily',
+            'totals': [
+                {'day': '2025-01-05', 'journey_count': 3, 'total_fare': 120,
+                 'zone_pairs': [{'from_zone': '1', 'to_zone': '2', 'journey_count': 2, 'total_fare': 110}, ...]},
+                ...
+            ],
+            'journey_count': 3,
+            'total_fare': 120
+        }
+    '''
+
+    PERIODS = {'daily': daily_totals, 'monthly': monthly_totals}
+
+    def get(self, request, user_id, period):
+        '''Get a user's totals for the period.'''
+        try:
+            day_filters = parse_date_range(request.query_params, field='day')
+        except ValueError as e:
+            return Response(
+                {
+                    'success': False,
+                    'error': str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        totals = self.PERIODS[period](user_id, **day_filters)
+        return Response({
+            'success': True,
+            'user_id': user_id,
+            'period': period,
+            'totals': totals,
+            'journey_count': sum(total['journey_count'] for total in totals),
+            'total_fare': sum(total['total_fare'] for total in totals),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,68 @@
+"""
+A bound on the requests an ASGI worker serves at once.
+
+Under ASGI, Django runs each request's database work (sync views, the
+async ORM, sync_to_async) in a thread of the request's own, and each
+thread opens its own database connection. A worker therefore holds as
+many connections as it has requests in flight, and past the database's
+max_connections new ones fail ("too many clients") with a 500.
+
+ConcurrencyLimitMiddleware lets ASGI_MAX_CONCURRENT_REQUESTS requests per
+worker run at a time; the rest wait in the event loop. A request closes
+its connections before making room for the next. Streaming responses
+keep their place until the body is sent, as they read while streaming.
+Under WSGI each worker serves one request at a time, so sync requests
+pass straight through.
+"""
+import asyncio
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+class ConcurrencyLimitMiddleware:
+    """See the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slots = None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(settings.ASGI_MAX_CONCURRENT_REQUESTS)
+        await self.slots.acquire()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await self._release()
+            raise
+        if response.streaming and response.is_async:
+            response.streaming_content = self._release_after(response.streaming_content)
+        else:
+            await self._release()
+        return response
+
+    async def _release_after(self, content):
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            await self._release()
+
+    async def _release(self):
+        try:
+            # In the request's thread, which holds its connections
+            await sync_to_async(connections.close_all)()
+        finally:
+            self.slots.release()
@@ -0,0 +1,251 @@
+"""
+Request metrics: Server-Timing headers and a Prometheus /metrics endpoint.
+
+MetricsMiddleware records, per URL name (e.g. 'api:calculate-fare'):
+
+  * a latency histogram (LATENCY_BUCKETS, seconds);
+  * SQL queries and SQL time, through a database execute wrapper that is
+    installed on every connection as it is created, so queries run in
+    sync_to_async threads are counted too;
+  * serialization time, reported by api.renderers.FastJSONRenderer;
+  * response bytes (non-streaming responses).
+
+Each response gets a Server-Timing header with that request's figures.
+
+Counters live in process memory. With METRICS_DIR set, every process
+also writes its totals to METRICS_DIR/<pid>.json, at most once per
+METRICS_WRITE_INTERVAL seconds and at exit, and /metrics adds up all
+the files, so any gunicorn worker reports totals for all of them. Clear
+METRICS_DIR when the server starts; files of exited workers are kept so
+counters do not go backwards.
+"""
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+from fare import cache as fare_cache
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per view: latency bucket counts (the last is +Inf), then these totals
+COUNT, LATENCY, QUERIES, SQL_SECONDS, SERIALIZE_SECONDS, RESPONSE_BYTES = range(
+    len(LATENCY_BUCKETS) + 1, len(LATENCY_BUCKETS) + 7
+)
+ROW_SIZE = RESPONSE_BYTES + 1
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _RequestTimings:
+    __slots__ = ('queries', 'sql_seconds', 'serialize_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+
+_current: contextvars.ContextVar[Optional[_RequestTimings]] = contextvars.ContextVar('request_timings', default=None)
+
+_views: Dict[str, list] = {}
+_lock = threading.Lock()
+_next_write = 0.0
+
+
+def record_serialization(seconds: float) -> None:
+    """Add rendering time to the current request, if it is being measured."""
+    timings = _current.get()
+    if timings is not None:
+        timings.serialize_seconds += seconds
+
+
+def _count_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.sql_seconds += time.perf_counter() - start
+
+
+def _instrument(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_instrument, dispatch_uid='backend.metrics')
+
+
+class MetricsMiddleware:
+    """Measures each request; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            _instrument(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = _RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return _finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = _RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return _finish(request, response, timings, time.perf_counter() - start)
+
+
+def _finish(request, response, timings, elapsed):
+    match = request.resolver_match
+    view = match.view_name if match is not None else 'unmatched'
+    size = 0 if response.streaming else len(response.content)
+    bucket = bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+
+    with _lock:
+        row = _views.get(view)
+        if row is None:
+            row = _views[view] = [0] * ROW_SIZE
+        row[bucket] += 1
+        row[COUNT] += 1
+        row[LATENCY] += elapsed
+        row[QUERIES] += timings.queries
+        row[SQL_SECONDS] += timings.sql_seconds
+        row[SERIALIZE_SECONDS] += timings.serialize_seconds
+        row[RESPONSE_BYTES] += size
+
+    if settings.METRICS_DIR and time.monotonic() >= _next_write:
+        write_process_metrics()
+
+    if settings.METRICS_SERVER_TIMING:
+        response['Server-Timing'] = (
+            f'db;dur={timings.sql_seconds * 1000:.2f};desc="{timings.queries} queries", '
+            f'serialize;dur={timings.serialize_seconds * 1000:.2f}, '
+            f'total;dur={elapsed * 1000:.2f}'
+        )
+    return response
+
+
+def _snapshot() -> Dict:
+    with _lock:
+        views = {view: list(row) for view, row in _views.items()}
+    return {'views': views, 'cache': fare_cache.stats()}
+
+
+def write_process_metrics() -> None:
+    """Write this process's totals to METRICS_DIR/<pid>.json."""
+    global _next_write
+    _next_write = time.monotonic() + settings.METRICS_WRITE_INTERVAL
+    directory = settings.METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(_snapshot(), output)
+    os.replace(temporary, path)
+
+
+@atexit.register
+def _write_at_exit():
+    if settings.configured and settings.METRICS_DIR:
+        write_process_metrics()
+
+
+def collect() -> Dict:
+    """
+    Totals for this process, plus every other process's file in
+    METRICS_DIR when it is set.
+    """
+    totals = _snapshot()
+    directory = settings.METRICS_DIR
+    if not directory or not os.path.isdir(directory):
+        return totals
+
+    own = f'{os.getpid()}.json'
+    for name in os.listdir(directory):
+        if not name.endswith('.json') or name == own:
+            continue
+        try:
+            with open(os.path.join(directory, name)) as source:
+                other = json.load(source)
+        except (OSError, ValueError):
+            continue  # being replaced, or written by something else
+        for view, row in other['views'].items():
+            merged = totals['views'].setdefault(view, [0] * ROW_SIZE)
+            for index, value in enumerate(row):
+                merged[index] += value
+        for namespace, counts in other['cache'].items():
+            merged = totals['cache'].setdefault(namespace, {'hits': 0, 'misses': 0})
+            for key in ('hits', 'misses'):
+                merged[key] += counts.get(key, 0)
+    return totals
+
+
+def render_prometheus(totals: Dict) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = [
+        '# HELP http_request_duration_seconds Request latency, by URL name.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    views = sorted(totals['views'].items())
+    for view, row in views:
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), row):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{view="{view}"}} {row[LATENCY]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{{view="{view}"}} {row[COUNT]}')
+
+    for metric, index, help_text in (
+        ('http_request_sql_queries_total', QUERIES, 'SQL queries run by requests, by URL name.'),
+        ('http_request_sql_seconds_total', SQL_SECONDS, 'Time spent in SQL, by URL name.'),
+        ('http_request_serialize_seconds_total', SERIALIZE_SECONDS, 'Time spent rendering JSON, by URL name.'),
+        ('http_response_bytes_total', RESPONSE_BYTES, 'Response body bytes (non-streaming), by URL name.'),
+    ):
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+        for view, row in views:
+            value = row[index]
+            lines.append(f'{metric}{{view="{view}"}} {value:.6f}' if isinstance(value, float) else f'{metric}{{view="{view}"}} {value}')
+
+    for key in ('hits', 'misses'):
+        metric = f'fare_cache_{key}_total'
+        lines += [f'# HELP {metric} Shared cache {key}, by namespace (fare.cache).', f'# TYPE {metric} counter']
+        for namespace, counts in sorted(totals['cache'].items()):
+            lines.append(f'{metric}{{namespace="{namespace}"}} {counts.get(key, 0)}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """GET /metrics"""
+    return HttpResponse(render_prometheus(collect()), content_type=CONTENT_TYPE)
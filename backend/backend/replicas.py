@@ -0,0 +1,153 @@
+"""
+Read replica routing.
+
+ReplicaRoutingMiddleware marks each request as replica-safe or not, and
+ReplicaRouter sends the ORM reads of replica-safe requests to one of
+settings.DATABASE_REPLICAS. Everything else uses 'default':
+
+  * writes, and every read after a write in the same request;
+  * requests other than GET, HEAD and OPTIONS;
+  * requests carrying the pin cookie, set for DATABASE_REPLICA_PIN_SECONDS
+    on responses to requests that wrote, so a client reads its own
+    writes until the replicas have caught up;
+  * requests a view pins with pin_to_primary(), e.g. reads of a rider's
+    journeys within DATABASE_REPLICA_PIN_SECONDS of their last change,
+    for clients that do not keep the cookie (the frontend calls the API
+    cross-origin without credentials; gates keep no cookies);
+  * code outside a request (management commands, background threads).
+
+A request keeps to the replica it first picked, so a page and its count
+come from the same database.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class _RequestReads:
+    """Routing state for one request; shared with the threads it uses."""
+
+    def __init__(self, replica_safe: bool):
+        self.replica_safe = replica_safe
+        self.replica = None
+        self.wrote = False
+
+
+_reads: contextvars.ContextVar[Optional[_RequestReads]] = contextvars.ContextVar('replica_reads', default=None)
+
+
+def reads_from_primary() -> bool:
+    """Whether ORM reads in the current context go to the primary."""
+    state = _reads.get()
+    return not settings.DATABASE_REPLICAS or state is None or not state.replica_safe or state.wrote
+
+
+def pinned_to_primary() -> bool:
+    """
+    Whether replicas are in use but this request reads the primary to see
+    its client's own writes. Such requests should also skip caches that
+    replica reads may have filled.
+    """
+    state = _reads.get()
+    return bool(settings.DATABASE_REPLICAS) and state is not None and (not state.replica_safe or state.wrote)
+
+
+def pin_to_primary() -> None:
+    """
+    Send the rest of this request's reads to the primary, as if its
+    client carried the pin cookie. Call it before the request's first read.
+    """
+    state = _reads.get()
+    if state is not None:
+        state.replica_safe = False
+
+
+@contextmanager
+def replica_reads():
+    """
+    Let reads in the block use a replica, outside of a request. For
+    reporting jobs that can tolerate replication lag.
+    """
+    token = _reads.set(_RequestReads(replica_safe=True))
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+class ReplicaRouter:
+    """Database router; see the module docstring."""
+
+    def db_for_read(self, model, **hints):
+        if reads_from_primary():
+            return DEFAULT_DB_ALIAS
+        state = _reads.get()
+        if state.replica is None:
+            state.replica = random.choice(settings.DATABASE_REPLICAS)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _reads.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """Scopes replica routing to each request and sets the pin cookie."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self._state_for(request)
+        token = _reads.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _reads.reset(token)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        state = self._state_for(request)
+        token = _reads.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _reads.reset(token)
+        return self._pin(state, response)
+
+    def _state_for(self, request) -> _RequestReads:
+        return _RequestReads(request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES)
+
+    def _pin(self, state, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
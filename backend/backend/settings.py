@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,8 +50,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.MetricsMiddleware',
+    'backend.concurrency.ConcurrencyLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  
+    'backend.replicas.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,6 +97,17 @@ DATABASES = {
     }
 }
 
+# Read replicas: a comma separated DB_REPLICA_HOSTS adds a 'replica_N'
+# alias per host, with the primary's credentials. Reads of GET requests
+# go to a replica (see backend.replicas); a client that wrote keeps
+# reading the primary for DATABASE_REPLICA_PIN_SECONDS, and so does any
+# client reading a rider's journeys that long after the rider's last write.
+for n, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica_{n}'] = {**DATABASES['default'], 'HOST': host.strip()}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+DATABASE_REPLICA_PIN_SECONDS = 5
+DATABASE_ROUTERS = ['backend.replicas.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,6 +139,10 @@ USE_I18N = True
 
 USE_TZ = True
 
+# Time zone that defines the operator's travel day (journey travel_date,
+# daily quotas). Defaults to TIME_ZONE.
+FARE_OPERATOR_TIME_ZONE = os.environ.get('FARE_OPERATOR_TIME_ZONE', TIME_ZONE)
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
@@ -138,11 +159,103 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
+# Shared cache (see fare.cache). The file-based default is shared by all
+# workers on one host and needs no extra service; for several hosts set
+# e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://redis:6379/1
+#
+# MAX_ENTRIES is sized for the per-user history cache. The file cache
+# keeps one file per entry and, once MAX_ENTRIES is reached, deletes a
+# random third of them whatever their expiry. Django's default of 300
+# would keep it culling: pages are cached per user and query, and
+# generation keys never expire. 10,000 entries hold a generation key
+# and a couple of pages for ~3,000 riders browsing within
+# JOURNEY_HISTORY_CACHE_TIMEOUT. It is no larger because every set lists
+# the cache directory, about 2us per file. Evictions stay safe: the
+# rule-set version falls back to the database, and a lost generation
+# restarts with a new token. A database cache would put a query behind
+# every cache read, including the fare rule hot path, so busier sites
+# should use Redis.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'pearlcard-cache')),
+        'TIMEOUT': 300,
+    }
+}
+if CACHES['default']['BACKEND'].endswith('FileBasedCache'):
+    # Redis and Memcached pass OPTIONS on to their client libraries
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10_000))}
+
+# Fare rules: seconds a worker trusts the cached rule-set version before
+# re-checking the database (see fare.rules)
+FARE_RULE_VERSION_TIMEOUT = 60
+
+# Journey history pagination (see api.pagination)
+JOURNEY_HISTORY_PAGE_SIZE = 50
+JOURNEY_HISTORY_MAX_PAGE_SIZE = 500
+
+# Seconds a per-user history page stays cached. Recording journeys through
+# the API invalidates the user's pages straight away; this bounds how long
+# other changes (admin edits) can go unseen.
+JOURNEY_HISTORY_CACHE_TIMEOUT = 60
+
+# Route the fare calculation and history endpoints to the async views in
+# api.async_views. Enable when serving backend.asgi under an ASGI server.
+API_ASYNC_VIEWS = os.environ.get('API_ASYNC_VIEWS', '').lower() in ('1', 'true', 'yes')
+
+# Requests an ASGI worker runs at once, each holding its own database
+# connection (see backend.concurrency). Keep workers x this below the
+# database's max_connections (100 by default on PostgreSQL).
+ASGI_MAX_CONCURRENT_REQUESTS = int(os.environ.get('ASGI_MAX_CONCURRENT_REQUESTS', 20))
+
+# Journey partitions (PostgreSQL; see fare.partitions). Run
+# `manage.py manage_journey_partitions` daily to create partitions this
+# many months ahead and, if JOURNEY_RETENTION_MONTHS is set, to detach
+# older months into JOURNEY_ARCHIVE_SCHEMA.
+JOURNEY_PARTITION_MONTHS_AHEAD = 3
+JOURNEY_RETENTION_MONTHS = int(os.environ.get('JOURNEY_RETENTION_MONTHS', 0)) or None
+JOURNEY_ARCHIVE_SCHEMA = os.environ.get('JOURNEY_ARCHIVE_SCHEMA', 'journey_archive')
+
+# Seconds a POST /api/calculate-fare/ Idempotency-Key is remembered
+# (see api.idempotency)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Rows fetched per server-side cursor round trip when streaming exports
+JOURNEY_EXPORT_CHUNK_SIZE = 2000
+
+# POST /api/journeys/bulk/ (api.bulk): records accepted per request, and
+# rows per INSERT statement when storing them
+JOURNEY_BULK_MAX_RECORDS = 50_000
+JOURNEY_BULK_BATCH_SIZE = 5000
+
+# Lines per transaction when importing gate logs (api.gate_logs); an
+# interrupted import resumes after its last stored chunk
+JOURNEY_IMPORT_CHUNK_SIZE = 50_000
+
+# Write-behind journey storage for POST /api/calculate-fare/ (see
+# fare.write_behind): journeys are queued after their quota is reserved
+# and inserted in the background. History shows them once flushed.
+JOURNEY_WRITE_BEHIND = os.environ.get('JOURNEY_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+JOURNEY_WRITE_BEHIND_QUEUE_SIZE = 10_000
+JOURNEY_WRITE_BEHIND_BATCH_SIZE = 500
+JOURNEY_WRITE_BEHIND_FLUSH_INTERVAL = 0.2
+# Seconds a request waits for room in a full queue before a 503
+JOURNEY_WRITE_BEHIND_PUT_TIMEOUT = 2.0
+
+# Request metrics (see backend.metrics). Set METRICS_DIR to a directory
+# shared by all worker processes, emptied at server start, so /metrics
+# reports totals across gunicorn workers.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_WRITE_INTERVAL = 1.0
+METRICS_SERVER_TIMING = True
 
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'api.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from backend.metrics import metrics_view
+
 urlpatterns = [
     path("zones/", include("zones.urls")),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for the PearlCard backend.
+
+Run from the backend directory, e.g. ``python -m benchmarks.fare_matrix``.
+"""
@@ -0,0 +1,45 @@
+"""
+Benchmark: per-journey dict pricing vs the vectorized column API.
+
+Usage:
+    python -m benchmarks.batch_pricing [--journeys 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from fare import SimpleFareCalculator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--journeys', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    zones = np.array(sorted(SimpleFareCalculator.VALID_ZONES))
+    from_zones = zones[rng.integers(0, len(zones), args.journeys)]
+    to_zones = zones[rng.integers(0, len(zones), args.journeys)]
+
+    # Old path: one calculate_single_fare call and one dict per journey
+    start = time.perf_counter()
+    total = 0
+    for from_zone, to_zone in zip(from_zones.tolist(), to_zones.tolist()):
+        fare = SimpleFareCalculator.calculate_single_fare(from_zone, to_zone)
+        total += fare
+        {'from_zone': from_zone, 'to_zone': to_zone, 'fare': fare, 'status': 'success'}
+    loop_rate = args.journeys / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    fares, errors = SimpleFareCalculator.calculate_fare_arrays(from_zones, to_zones)
+    vector_rate = args.journeys / (time.perf_counter() - start)
+
+    assert int(fares.sum()) == total and not errors.any()
+    print(f"journeys:        {args.journeys:,}")
+    print(f"python loop:     {loop_rate:,.0f} journeys/s")
+    print(f"vectorized:      {vector_rate:,.0f} journeys/s ({vector_rate / loop_rate:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: queries and latency of POST /api/calculate-fare/ by batch size.
+
+Runs against the database configured in DJANGO_SETTINGS_MODULE, which
+must already be migrated. Every request uses a fresh user_id so the
+daily quota never trips.
+
+Usage:
+    python -m benchmarks.calculate_fare_writes [--requests 200] [--sizes 1 10 20]
+
+PostgreSQL 16, fresh database per run, 200 requests per size, one core.
+Per-journey INSERTs vs the batched INSERT, as of the change that added it:
+
+              per journey               batched
+    journeys  queries  p50 ms  p99 ms   queries  p50 ms  p99 ms
+           1        2    3.85    7.39         4    3.83    8.98
+          10       11   12.16   25.54         4    5.35    7.70
+          20       21   18.10   28.28         4    7.72   17.23
+
+Batched counts include BEGIN and COMMIT. Later changes add the daily quota
+counter and the rollups: 11 queries for a rider's first request of the
+day (seeding the counter), fewer after that.
+"""
+import argparse
+import os
+import statistics
+import time
+import uuid
+
+import django
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 20])
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client()
+    legs = [('1', '2'), ('2', '3'), ('3', '3'), ('1', '1')]
+
+    print(f"{'journeys':>8} {'queries':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in args.sizes:
+        journeys = [
+            {'from_zone': legs[i % len(legs)][0], 'to_zone': legs[i % len(legs)][1]}
+            for i in range(size)
+        ]
+        latencies, queries = [], []
+        for _ in range(args.requests):
+            body = {'user_id': uuid.uuid4().hex[:10], 'journeys': journeys}
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.post('/api/calculate-fare/', body, content_type='application/json')
+                latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.content
+            queries.append(len(captured.captured_queries))
+
+        print(f"{size:>8} {statistics.median(queries):>8.0f} "
+              f"{percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
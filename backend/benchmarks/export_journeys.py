@@ -0,0 +1,126 @@
+"""
+Benchmark: streaming journey export throughput and memory.
+
+Seeds the Journey table (optional), then streams /api/journeys/export.<fmt>
+through the Django test client and reports rows/sec and peak RSS. With
+--asgi the request goes through the async test client and the body is
+read the way Django's ASGI handler reads it.
+Runs against the database configured in DJANGO_SETTINGS_MODULE, which
+must already be migrated.
+
+Usage:
+    python -m benchmarks.export_journeys --seed 5000000
+    python -m benchmarks.export_journeys --format csv
+    python -m benchmarks.export_journeys --asgi
+    python -m benchmarks.export_journeys --baseline   # old in-memory serializer path
+"""
+import argparse
+import os
+import time
+
+import django
+
+
+def rss_mb():
+    """Current resident set size, from /proc (Linux)."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def seed(count, batch_size=50_000):
+    """
+    Insert `count` synthetic journeys, one per second back from now, with
+    fare.loading.load_journeys (COPY on Postgres, creating partitions).
+    """
+    import datetime
+    import random
+
+    from django.utils import timezone
+
+    from fare.loading import load_journeys
+    from fare.models import travel_date_of
+
+    fares = {('1', '1'): 40, ('1', '2'): 55, ('1', '3'): 65, ('2', '2'): 35, ('2', '3'): 45, ('3', '3'): 30}
+    pairs = list(fares.items())
+    rng = random.Random(7)
+    now = timezone.now()
+
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        columns = ([], [], [], [], [], [])
+        for n in range(start, start + size):
+            (from_zone, to_zone), fare = rng.choice(pairs)
+            timestamp = now - datetime.timedelta(seconds=n)
+            row = (f'u{rng.randrange(100_000)}', from_zone, to_zone, fare, timestamp, travel_date_of(timestamp))
+            for column, value in zip(columns, row):
+                column.append(value)
+        load_journeys(*columns)
+        print(f'seeded {start + size:,}/{count:,}', end='\r', flush=True)
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seed', type=int, default=0, help='rows to insert before exporting')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    parser.add_argument('--baseline', action='store_true', help='serialize every row in memory instead')
+    parser.add_argument('--asgi', action='store_true', help='stream as served by an ASGI server')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient, Client
+
+    if args.seed:
+        seed(args.seed)
+
+    start_rss = peak_rss = rss_mb()
+    start = time.perf_counter()
+    rows = size = 0
+
+    if args.baseline:
+        from api.serializers import JourneyHistorySerializer
+        from fare.models import Journey
+        import json
+
+        data = JourneyHistorySerializer(Journey.objects.all(), many=True).data
+        body = json.dumps(data)
+        rows, size = len(data), len(body)
+        peak_rss = max(peak_rss, rss_mb())
+    else:
+        def count(chunk):
+            nonlocal rows, size, peak_rss
+            size += len(chunk)
+            rows += chunk.count(b'\n')
+            peak_rss = max(peak_rss, rss_mb())
+
+        if args.asgi:
+            async def stream():
+                response = await AsyncClient().get(f'/api/journeys/export.{args.format}')
+                # As django.core.handlers.asgi.ASGIHandler.send_response
+                async for chunk in response:
+                    count(chunk)
+
+            async_to_sync(stream)()
+        else:
+            for chunk in Client().get(f'/api/journeys/export.{args.format}').streaming_content:
+                count(chunk)
+        if args.format == 'csv':
+            rows -= 1  # header
+
+    elapsed = time.perf_counter() - start
+    mode = 'in-memory serializer' if args.baseline else f'streaming {args.format}{" (ASGI)" if args.asgi else ""}'
+    print(f'mode:      {mode}')
+    print(f'rows:      {rows:,}')
+    print(f'bytes:     {size:,}')
+    print(f'rows/sec:  {rows / elapsed:,.0f}')
+    print(f'RSS:       start {start_rss:.0f} MB, peak {peak_rss:.0f} MB (+{peak_rss - start_rss:.0f} MB)')
+
+
+if __name__ == '__main__':
+    main()
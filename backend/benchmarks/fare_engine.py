@@ -0,0 +1,245 @@
+"""
+Micro-benchmark suite for the fare engine, with regression thresholds.
+
+Times SimpleFareCalculator.calculate_single_fare, calculate_batch_fares
+and get_all_fare_rules over fare tables of ZONE_COUNTS zones and batches
+of BATCH_SIZES journeys. Each case is warmed up, then timed over
+--repeat rounds of about --min-time seconds each, keeping the fastest,
+least disturbed run (as timeit does). Allocations are measured separately, in one untimed call under
+tracemalloc: blocks still allocated afterwards and peak bytes.
+
+Each case's timed runs alternate with runs of a calibration loop of
+plain Python dict lookups, and the case is judged by its rate relative
+to the calibration's. That ratio is stored in BASELINES, so baselines
+recorded on another machine, or under different load, stay meaningful.
+The exit status is 1 when a case's ratio is more than --tolerance below
+its baseline, and stays there when measured again (--retries).
+
+Usage:
+    python -m benchmarks.fare_engine
+    python -m benchmarks.fare_engine --tolerance 0.1 --cases batch
+    python -m benchmarks.fare_engine --update    # record new baselines
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from fare import SimpleFareCalculator
+
+from .fare_matrix import build_tables
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines', 'fare_engine.json')
+
+ZONE_COUNTS = (3, 50, 500)
+BATCH_SIZES = (1, 5, 20)
+
+
+def calculator_for(zone_count):
+    """A SimpleFareCalculator subclass over synthetic tables of `zone_count` zones."""
+    same, different = build_tables(zone_count)
+    return type(f'FareCalculator{zone_count}', (SimpleFareCalculator,), {
+        'VALID_ZONES': set(same),
+        'SAME_ZONE_FARES': same,
+        'DIFFERENT_ZONE_FARES': different,
+    })
+
+
+def build_cases():
+    """{case name: function doing one unit of work}, in report order."""
+    cases = {}
+    for zone_count in ZONE_COUNTS:
+        calculator = calculator_for(zone_count)
+        zones = sorted(calculator.VALID_ZONES, key=int)
+        # Fixed spread of pairs: first, middle and last zones, both ways
+        picks = [zones[0], zones[len(zones) // 2], zones[-1]]
+        pairs = [(a, b) for a in picks for b in picks]
+
+        def single(calculator=calculator, pairs=pairs):
+            for from_zone, to_zone in pairs:
+                calculator.calculate_single_fare(from_zone, to_zone)
+
+        cases[f'single_fare[{zone_count} zones, {len(pairs)} lookups]'] = single
+        for size in BATCH_SIZES:
+            journeys = [{'from_zone': a, 'to_zone': b} for a, b in (pairs * size)[:size]]
+            cases[f'batch_fares[{zone_count} zones, {size} journeys]'] = (
+                lambda calculator=calculator, journeys=journeys: calculator.calculate_batch_fares(journeys)
+            )
+        cases[f'fare_rules[{zone_count} zones]'] = calculator.get_all_fare_rules
+    return cases
+
+
+def calibration():
+    """One unit of the reference workload: plain dict lookups."""
+    table = _CALIBRATION_TABLE
+    total = 0
+    for key in _CALIBRATION_KEYS:
+        total += table[key]
+    return total
+
+
+_CALIBRATION_TABLE = {str(n): n for n in range(100)}
+_CALIBRATION_KEYS = list(_CALIBRATION_TABLE) * 10
+
+
+def calls_per_run(function, min_time, warmup):
+    """
+    Call `function` for `warmup` seconds untimed, then return how many
+    calls take about `min_time` seconds.
+    """
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        function()
+
+    calls, elapsed = 1, 0.0
+    while elapsed < min_time / 10:
+        calls *= 2
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        elapsed = time.perf_counter() - start
+    return max(1, int(calls * min_time / elapsed))
+
+
+def measure_rates(functions, repeat, min_time, warmup):
+    """
+    Best calls per second of each function over `repeat` rounds. Each
+    round runs every function for about `min_time` seconds in turn, so
+    they all see the same machine load.
+    """
+    calls = [calls_per_run(function, min_time, warmup) for function in functions]
+    rates = [0.0] * len(functions)
+    # Collections would land in whichever run happens to trigger them
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for index, (function, count) in enumerate(zip(functions, calls)):
+                start = time.perf_counter()
+                for _ in range(count):
+                    function()
+                rates[index] = max(rates[index], count / (time.perf_counter() - start))
+    finally:
+        gc.enable()
+    return rates
+
+
+def measure_allocations(function):
+    """(blocks still allocated after one call, peak bytes during it)."""
+    function()  # fill any caches first
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return blocks, peak - start_bytes
+
+
+def run(cases, repeat, min_time, warmup):
+    """
+    Measure every case, each interleaved with the calibration loop; a
+    case's `relative` rate is its rate over the calibration's.
+    """
+    results = {}
+    for name, function in cases.items():
+        blocks, peak = measure_allocations(function)
+        rate, calibration_rate = measure_rates([function, calibration], repeat, min_time, warmup)
+        results[name] = {
+            'ops_per_sec': rate,
+            'relative': rate / calibration_rate,
+            'retained_blocks': blocks,
+            'peak_bytes': peak,
+        }
+    return results
+
+
+def compare(results, baselines, tolerance):
+    """
+    Rows of (case, ops/sec, change against the baseline or None) and the
+    names of the cases whose relative rate fell by more than `tolerance`.
+    """
+    rows, regressed = [], []
+    for name, result in results.items():
+        baseline = (baselines or {}).get(name)
+        if baseline is None:
+            rows.append((name, result['ops_per_sec'], None))
+            continue
+        change = result['relative'] / baseline['relative'] - 1
+        rows.append((name, result['ops_per_sec'], change))
+        if change < -tolerance:
+            regressed.append(name)
+    return rows, regressed
+
+
+def load_baselines(path=BASELINES):
+    """{case name: result} as last recorded, or None."""
+    try:
+        with open(path) as source:
+            return json.load(source)['cases']
+    except FileNotFoundError:
+        return None
+
+
+def save_baselines(results, path=BASELINES):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as output:
+        json.dump({'python': platform.python_version(), 'cases': results}, output, indent=2, sort_keys=True)
+        output.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', help='only cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=7, help='timed rounds per case')
+    parser.add_argument('--min-time', type=float, default=0.1, help='seconds per timed run')
+    parser.add_argument('--warmup', type=float, default=0.1, help='seconds of untimed calls before timing')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, e.g. 0.25 for 25%%')
+    parser.add_argument('--retries', type=int, default=1, help='times to re-measure apparent regressions')
+    parser.add_argument('--update', action='store_true', help=f'write the results to {os.path.relpath(BASELINES)}')
+    args = parser.parse_args()
+
+    cases = build_cases()
+    if args.cases:
+        cases = {name: function for name, function in cases.items() if args.cases in name}
+    results = run(cases, args.repeat, args.min_time, args.warmup)
+    baselines = load_baselines()
+    rows, regressed = compare(results, baselines, args.tolerance)
+    for _ in range(args.retries if not args.update else 0):
+        if not regressed:
+            break
+        # Measure suspects again before reporting them; a noisy neighbour
+        # rarely slows the same case twice
+        results.update(run({name: cases[name] for name in regressed}, args.repeat, args.min_time, args.warmup))
+        rows, regressed = compare(results, baselines, args.tolerance)
+
+    print(f"{'case':<40} {'ops/s':>12} {'change':>8} {'blocks':>7} {'peak B':>11}")
+    for name, rate, change in rows:
+        result = results[name]
+        print(
+            f"{name:<40} {rate:>12,.0f} "
+            + (f"{change:>+8.1%}" if change is not None else f"{'new':>8}")
+            + f" {result['retained_blocks']:>7} {result['peak_bytes']:>11,}"
+            + ('  REGRESSED' if name in regressed else '')
+        )
+
+    if args.update:
+        # Cases that were not run keep their baselines
+        save_baselines({**(baselines or {}), **results})
+        print(f'Baselines written to {BASELINES}')
+    elif regressed:
+        print(f'{len(regressed)} case(s) more than {args.tolerance:.0%} slower than baseline')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
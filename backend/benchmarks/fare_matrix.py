@@ -0,0 +1,74 @@
+"""
+Micro-benchmark: fare lookups per second, legacy dict lookup vs FareMatrix.
+
+Usage:
+    python -m benchmarks.fare_matrix [--lookups 200000] [--zones 3 50 500]
+"""
+import argparse
+import random
+import time
+
+from fare import FareMatrix, SimpleFareCalculator
+
+
+def build_tables(zone_count):
+    """Synthetic fare tables in the SimpleFareCalculator layout."""
+    if zone_count == 3:
+        return (
+            dict(SimpleFareCalculator.SAME_ZONE_FARES),
+            dict(SimpleFareCalculator.DIFFERENT_ZONE_FARES),
+        )
+
+    zones = [str(n) for n in range(1, zone_count + 1)]
+    same = {zone: 30 + (idx % 10) for idx, zone in enumerate(zones)}
+    different = {}
+    for i, a in enumerate(zones):
+        for b in zones[i + 1:]:
+            different[tuple(sorted([a, b]))] = 40 + abs(int(a) - int(b)) % 60
+    return same, different
+
+
+def legacy_lookup(valid_zones, same, different):
+    """The pre-FareMatrix algorithm: validate, sort, build a tuple, probe."""
+    def lookup(from_zone, to_zone):
+        if from_zone not in valid_zones:
+            raise ValueError(from_zone)
+        if to_zone not in valid_zones:
+            raise ValueError(to_zone)
+        if from_zone == to_zone:
+            return same[from_zone]
+        return different[tuple(sorted([from_zone, to_zone]))]
+    return lookup
+
+
+def time_lookups(lookup, pairs):
+    start = time.perf_counter()
+    for from_zone, to_zone in pairs:
+        lookup(from_zone, to_zone)
+    return len(pairs) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--zones', type=int, nargs='+', default=[3, 50, 500])
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'zones':>6} {'build ms':>9} {'legacy lookups/s':>17} {'matrix lookups/s':>17} {'speedup':>8}")
+    for zone_count in args.zones:
+        same, different = build_tables(zone_count)
+        zones = sorted(same)
+
+        start = time.perf_counter()
+        matrix = FareMatrix.from_tables(same, different)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        pairs = [(rng.choice(zones), rng.choice(zones)) for _ in range(args.lookups)]
+        legacy = time_lookups(legacy_lookup(set(zones), same, different), pairs)
+        compiled = time_lookups(matrix.fare, pairs)
+        print(f"{zone_count:>6} {build_ms:>9.1f} {legacy:>17,.0f} {compiled:>17,.0f} {compiled / legacy:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: HTTP load against a running server.
+
+A small asyncio HTTP/1.1 client (stdlib only) that holds N keep-alive
+connections open and fires requests as fast as the server answers.
+Reports requests/sec, latency percentiles and errors per concurrency
+level, so WSGI (runserver/gunicorn) and ASGI (uvicorn workers with
+API_ASYNC_VIEWS=1) deployments can be compared on the same endpoints.
+
+Usage:
+    python -m benchmarks.http_load --url http://localhost:8001/api/users/u1/journeys/
+    python -m benchmarks.http_load --url http://localhost:8001/api/calculate-fare/ \\
+        --body '{"user_id": "load-{n}", "journeys": [{"from_zone": 1, "to_zone": 2}]}'
+    python -m benchmarks.http_load --concurrency 100 500 1000 --duration 30
+
+In --body, "{n}" is replaced with a per-request counter so writes spread
+over many users instead of hitting one user's daily quota.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+
+    def record(self, status, latency):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latencies.append(latency)
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; return (status, keep_alive)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+
+    length, chunked, keep_alive = 0, False, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection' and value == 'close':
+            keep_alive = False
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def worker(url, method, body, deadline, counter, stats):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    reader = writer = None
+
+    while time.perf_counter() < deadline:
+        n = next(counter)
+        payload = body.replace('{n}', str(n)).encode() if body else b''
+        request = (
+            f'{method} {target} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'
+        ).encode() + payload
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            stats.record(status, time.perf_counter() - start)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+            stats.errors += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+
+    if writer is not None:
+        writer.close()
+
+
+async def run_level(url, method, body, concurrency, duration):
+    stats = Stats()
+    counter = iter(range(10 ** 12))
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        worker(url, method, body, deadline, counter, stats) for _ in range(concurrency)
+    ))
+    return stats, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000/api/journeys/')
+    parser.add_argument('--body', help='JSON body; sends POST when given')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 500, 1000])
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per concurrency level')
+    args = parser.parse_args()
+    method = 'POST' if args.body else 'GET'
+
+    print(f'{method} {args.url}')
+    print(f'{"conc":>6} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"mean ms":>8} {"errors":>7}  statuses')
+    for concurrency in args.concurrency:
+        stats, elapsed = asyncio.run(run_level(args.url, method, args.body, concurrency, args.duration))
+        mean = statistics.fmean(stats.latencies) if stats.latencies else 0.0
+        print(
+            f'{concurrency:>6} {len(stats.latencies) / elapsed:>9,.0f} '
+            f'{stats.percentile(50) * 1000:>8.1f} {stats.percentile(99) * 1000:>8.1f} '
+            f'{mean * 1000:>8.1f} {stats.errors:>7}  {dict(sorted(stats.statuses.items()))}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Benchmark: monthly-partitioned vs single-table Journey storage (PostgreSQL).
+
+Builds two scratch tables with Journey's columns and indexes, one plain
+and one partitioned by month of travel_date (as migration 0007 does),
+seeds both with the same synthetic rows server-side, then reports:
+
+  * EXPLAIN ANALYZE for typical reads, with the number of partitions
+    each plan touches (pruning) and the median execution time;
+  * latency of 20-row INSERT batches, as written by calculate-fare;
+  * cost of dropping the oldest month: DELETE vs DETACH + DROP
+    (both rolled back).
+
+The scratch tables are dropped afterwards unless --keep is given.
+
+Usage:
+    python -m benchmarks.journey_partitions --rows 1000000
+    python -m benchmarks.journey_partitions --rows 100000000 --months 24 --keep
+"""
+import argparse
+import os
+import re
+import statistics
+import time
+
+import django
+
+PLAIN = 'bench_journey_plain'
+PARTITIONED = 'bench_journey_part'
+
+COLUMNS = '''
+    id bigint NOT NULL,
+    user_id varchar(10) NOT NULL,
+    from_zone varchar(10) NOT NULL,
+    to_zone varchar(10) NOT NULL,
+    fare integer NOT NULL,
+    timestamp timestamptz NOT NULL,
+    travel_date date NOT NULL
+'''
+
+INDEXES = [
+    '(timestamp DESC, id)',
+    '(fare, timestamp DESC, id)',
+    '(from_zone, to_zone, timestamp DESC, id)',
+    '(to_zone, timestamp DESC, id)',
+    '(user_id, travel_date) INCLUDE (fare, from_zone, to_zone)',
+    '(user_id, timestamp DESC, id)',
+]
+
+
+def create_tables(cursor, months, first_month):
+    cursor.execute(f'DROP TABLE IF EXISTS {PLAIN}, {PARTITIONED} CASCADE')
+    cursor.execute(f'CREATE TABLE {PLAIN} ({COLUMNS}, PRIMARY KEY (id))')
+    cursor.execute(f'CREATE TABLE {PARTITIONED} ({COLUMNS}, PRIMARY KEY (id, travel_date)) PARTITION BY RANGE (travel_date)')
+    for n in range(months + 1):
+        cursor.execute(
+            f"CREATE TABLE {PARTITIONED}_p{n:03d} PARTITION OF {PARTITIONED} "
+            f"FOR VALUES FROM ((%s::date + make_interval(months => %s))::date) TO ((%s::date + make_interval(months => %s))::date)",
+            [first_month, n, first_month, n + 1],
+        )
+    cursor.execute(f'CREATE TABLE {PARTITIONED}_default PARTITION OF {PARTITIONED} DEFAULT')
+
+
+def seed(cursor, rows, months, first_month, users):
+    # Rows are spread evenly over the months, so each partition gets
+    # rows / months of them. Run with parameters, so % is written %%.
+    select = f'''
+        SELECT n,
+               'u' || (n %% {users}),
+               (1 + n %% 3)::text,
+               (1 + (n / 3) %% 3)::text,
+               30 + (n %% 4) * 10,
+               ts,
+               (ts AT TIME ZONE 'UTC')::date
+        FROM (
+            SELECT n, %s::timestamptz + (n::float8 / {rows}) * ((%s::date + make_interval(months => {months}))::date - %s::date) * interval '1 day' AS ts
+            FROM generate_series(1, {rows}) AS n
+        ) s
+    '''
+    for table in (PLAIN, PARTITIONED):
+        start = time.perf_counter()
+        cursor.execute(f'INSERT INTO {table} {select}', [first_month, first_month, first_month])
+        for n, columns in enumerate(INDEXES):
+            cursor.execute(f'CREATE INDEX {table}_idx{n} ON {table} {columns}')
+        cursor.execute(f'ANALYZE {table}')
+        print(f'seeded {table}: {time.perf_counter() - start:.1f}s')
+
+
+def explain(cursor, sql, params, repeat):
+    times, plan = [], ''
+    for _ in range(repeat):
+        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+        times.append(float(re.search(r'Execution Time: ([\d.]+) ms', plan).group(1)))
+    scanned = len(set(re.findall(rf'on ({PARTITIONED}_\w+)', plan)))
+    return statistics.median(times), scanned, plan
+
+
+def insert_latency(cursor, table, batches, start_id):
+    latencies = []
+    values = ', '.join(['(%s, %s, %s, %s, %s, now(), CURRENT_DATE)'] * 20)
+    for batch in range(batches):
+        params = []
+        for n in range(20):
+            params += [start_id + batch * 20 + n, f'ins{batch}', '1', '2', 55]
+        started = time.perf_counter()
+        cursor.execute(f'INSERT INTO {table} VALUES {values}', params)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--plans', action='store_true', help='print the full partitioned plans')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch tables')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from django.db import connection, transaction
+
+    if connection.vendor != 'postgresql':
+        raise SystemExit('This benchmark needs PostgreSQL')
+
+    first_month = '2024-01-01'
+    with connection.cursor() as cursor:
+        create_tables(cursor, args.months, first_month)
+        seed(cursor, args.rows, args.months, first_month, args.users)
+
+        queries = [
+            ('one week, newest first',
+             "SELECT * FROM {t} WHERE travel_date BETWEEN %s::date + 300 AND %s::date + 306 ORDER BY timestamp DESC, id LIMIT 50",
+             [first_month, first_month]),
+            ('user day count (quota)',
+             "SELECT count(*) FROM {t} WHERE user_id = 'u42' AND travel_date = %s::date + 300",
+             [first_month]),
+            ('user month totals',
+             "SELECT from_zone, to_zone, count(*), sum(fare) FROM {t} WHERE user_id = 'u42' "
+             "AND travel_date >= %s::date + 300 AND travel_date < %s::date + 330 GROUP BY 1, 2",
+             [first_month, first_month]),
+            ('user history, no date (no pruning)',
+             "SELECT * FROM {t} WHERE user_id = 'u42' ORDER BY timestamp DESC, id LIMIT 50",
+             []),
+        ]
+        print(f'\nrows: {args.rows:,} over {args.months} months\n')
+        print(f"{'query':<36} {'plain ms':>9} {'part ms':>9} {'partitions':>11}")
+        for name, sql, params in queries:
+            plain_ms, _, _ = explain(cursor, sql.format(t=PLAIN), params, args.repeat)
+            part_ms, scanned, plan = explain(cursor, sql.format(t=PARTITIONED), params, args.repeat)
+            print(f'{name:<36} {plain_ms:>9.2f} {part_ms:>9.2f} {scanned:>5} / {args.months + 2}')
+            if args.plans:
+                print(plan, end='\n\n')
+
+        print(f"\n{'20-row insert':<36} {'p50 ms':>9} {'p99 ms':>9}")
+        for table in (PLAIN, PARTITIONED):
+            p50, p99 = insert_latency(cursor, table, 500, args.rows + 1_000_000)
+            print(f'{table:<36} {p50:>9.2f} {p99:>9.2f}')
+
+    print(f"\n{'drop oldest month':<36} {'ms':>9}")
+    for name, statements in [
+        ('plain: DELETE', [f"DELETE FROM {PLAIN} WHERE travel_date < DATE '{first_month}' + interval '1 month'"]),
+        ('partitioned: DETACH + DROP', [
+            f'ALTER TABLE {PARTITIONED} DETACH PARTITION {PARTITIONED}_p000',
+            f'DROP TABLE {PARTITIONED}_p000',
+        ]),
+    ]:
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                started = time.perf_counter()
+                for statement in statements:
+                    cursor.execute(statement)
+                elapsed = (time.perf_counter() - started) * 1000
+                raise RuntimeError('roll back')
+        except RuntimeError:
+            pass
+        print(f'{name:<36} {elapsed:>9.1f}')
+
+    if not args.keep:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {PLAIN}, {PARTITIONED} CASCADE')
+
+
+if __name__ == '__main__':
+    main()
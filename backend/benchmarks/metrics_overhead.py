@@ -0,0 +1,65 @@
+"""
+Benchmark: per-request overhead of backend.metrics.MetricsMiddleware.
+
+Calls a trivial view through a resolved URL with and without the
+middleware wrapped around it and reports the difference per request,
+including a few SQL queries so the execute wrapper is exercised.
+
+Usage:
+    python -m benchmarks.metrics_overhead [--requests 20000] [--queries 3]
+"""
+import argparse
+import os
+import time
+
+import django
+
+
+def per_request(handler, request, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        handler(request)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--queries', type=int, default=3, help='SQL queries per request')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from django.urls import resolve
+
+    from backend.metrics import MetricsMiddleware
+
+    def view(request):
+        with connection.cursor() as cursor:
+            for _ in range(args.queries):
+                cursor.execute('SELECT 1')
+        return HttpResponse(b'{}', content_type='application/json')
+
+    request = RequestFactory().get('/api/zones/')
+    request.resolver_match = resolve('/api/zones/')
+    connection.ensure_connection()
+
+    plain = view
+    measured = MetricsMiddleware(view)
+    # Warm up both paths, then interleave runs to even out noise
+    per_request(plain, request, 1000)
+    per_request(measured, request, 1000)
+    baseline = min(per_request(plain, request, args.requests) for _ in range(3))
+    with_metrics = min(per_request(measured, request, args.requests) for _ in range(3))
+
+    print(f'without middleware: {baseline * 1e6:8.1f} us/request')
+    print(f'with middleware:    {with_metrics * 1e6:8.1f} us/request')
+    print(f'overhead:           {(with_metrics - baseline) * 1e6:8.1f} us/request ({args.queries} queries)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Load test: simulated riders against a running server.
+
+Each of --riders riders holds one keep-alive connection and plays a
+seeded user (see the seed_journeys management command) through a mix of
+requests, weighted by MIX: pricing and recording journeys, reading
+their history with and without filters, checking today's count
+and their totals, and occasionally the global history. With --think,
+riders pause for an exponentially distributed time between requests
+instead of sending as fast as the server answers.
+
+Reports per request type and overall: requests/sec, latency percentiles
+and error rates. 4xx answers (e.g. a rider over the daily journey
+limit) are counted as rejected, not as errors; 5xx answers and failed
+connections are errors.
+
+Runs on one Linux box against the docker-compose stack:
+    docker compose up -d
+    docker compose exec backend python manage.py seed_journeys --journeys 1000000 --riders 10000
+    python -m benchmarks.rider_load --url http://localhost:8000 --riders 200 --duration 60
+    python -m benchmarks.rider_load --url http://localhost:8001 --riders 1000 --think 0.5
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import resource
+import time
+from urllib.parse import urlsplit
+
+from .http_load import Stats, read_response
+
+# (request type, weight)
+MIX = [
+    ('calculate-fare', 30),
+    ('history', 30),
+    ('history, filtered', 10),
+    ('journeys-count', 15),
+    ('totals', 10),
+    ('global history', 5),
+]
+
+
+def build_request(kind, user_id, zones, rng):
+    """(method, path, JSON body or None) for one request of `kind`."""
+    if kind == 'calculate-fare':
+        journeys = [
+            {'from_zone': rng.choice(zones), 'to_zone': rng.choice(zones)}
+            for _ in range(rng.choice((1, 1, 1, 2, 2, 3)))
+        ]
+        return 'POST', '/api/calculate-fare/', {'user_id': user_id, 'journeys': journeys}
+    if kind == 'history':
+        return 'GET', f'/api/users/{user_id}/journeys/', None
+    if kind == 'history, filtered':
+        week_ago = datetime.date.today() - datetime.timedelta(days=7)
+        return 'GET', rng.choice((
+            f'/api/users/{user_id}/journeys/?fare=%3E30',
+            f'/api/users/{user_id}/journeys/?from_zone={rng.choice(zones)}&ordering=-fare',
+            f'/api/users/{user_id}/journeys/?date_from={week_ago}&count=true',
+        )), None
+    if kind == 'journeys-count':
+        return 'GET', f'/api/users/{user_id}/journeys/count', None
+    if kind == 'totals':
+        return 'GET', f'/api/users/{user_id}/totals/{rng.choice(("daily", "monthly"))}', None
+    return 'GET', '/api/journeys/', None
+
+
+async def rider(url, number, args, deadline, stats):
+    parts = urlsplit(url)
+    rng = random.Random(args.seed * 1_000_003 + number)
+    user_id = f'{args.prefix}{rng.randrange(args.users)}'
+    kinds, weights = zip(*MIX)
+    reader = writer = None
+
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        method, path, body = build_request(kind, user_id, args.zones, rng)
+        payload = json.dumps(body).encode() if body is not None else b''
+        request = (
+            f'{method} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'
+        ).encode() + payload
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            stats[kind].record(status, time.perf_counter() - start)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+            stats[kind].errors += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+
+        if args.think:
+            await asyncio.sleep(rng.expovariate(1 / args.think))
+
+    if writer is not None:
+        writer.close()
+
+
+async def run(args):
+    stats = {kind: Stats() for kind, _ in MIX}
+    start = time.perf_counter()
+    deadline = start + args.duration
+    # Riders join over --ramp-up seconds rather than all at once
+    tasks = []
+    for number in range(args.riders):
+        tasks.append(asyncio.create_task(rider(args.url, number, args, deadline, stats)))
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up / args.riders)
+    await asyncio.gather(*tasks)
+    return stats, time.perf_counter() - start
+
+
+def report(stats, elapsed):
+    print(f'{"request":<20} {"count":>8} {"req/s":>8} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8} {"4xx %":>6} {"error %":>7}')
+    total = Stats()
+    for kind, _ in MIX:
+        line(kind, stats[kind], elapsed)
+        total.latencies += stats[kind].latencies
+        total.errors += stats[kind].errors
+        for status, count in stats[kind].statuses.items():
+            total.statuses[status] = total.statuses.get(status, 0) + count
+    line('all', total, elapsed)
+    print(f'statuses: {dict(sorted(total.statuses.items()))}')
+
+
+def line(name, stats, elapsed):
+    attempts = len(stats.latencies) + stats.errors
+    rejected = sum(count for status, count in stats.statuses.items() if 400 <= status < 500)
+    errors = stats.errors + sum(count for status, count in stats.statuses.items() if status >= 500)
+    print(
+        f'{name:<20} {len(stats.latencies):>8} {len(stats.latencies) / elapsed:>8,.0f} '
+        f'{stats.percentile(50) * 1000:>8.1f} {stats.percentile(90) * 1000:>8.1f} '
+        f'{stats.percentile(99) * 1000:>8.1f} {max(stats.latencies, default=0) * 1000:>8.1f} '
+        f'{100 * rejected / max(attempts, 1):>6.1f} {100 * errors / max(attempts, 1):>7.2f}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000', help='server base URL')
+    parser.add_argument('--riders', type=int, default=100, help='concurrent riders, one connection each')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='seconds over which riders join')
+    parser.add_argument('--think', type=float, default=0.0, help='mean pause between a rider\'s requests, seconds')
+    parser.add_argument('--users', type=int, default=10_000, help='seeded riders to pick users from')
+    parser.add_argument('--prefix', default='r', help='user id prefix used by seed_journeys')
+    parser.add_argument('--zones', nargs='+', default=['1', '2', '3'])
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    # One connection per rider; allow as many open files as the hard limit
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    print(f'{args.riders} riders against {args.url} for {args.duration:.0f}s')
+    stats, elapsed = asyncio.run(run(args))
+    report(stats, elapsed)
+
+
+if __name__ == '__main__':
+    main()
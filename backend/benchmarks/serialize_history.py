@@ -0,0 +1,83 @@
+"""
+Benchmark: serializing a journey history page, DRF serializers vs projections.
+
+Loads one page of journeys and turns it into response bytes both ways:
+
+  serializer  JourneyHistorySerializer over model instances + JSONRenderer
+  projection  values() rows + api.projections + FastJSONRenderer
+
+Query time is reported separately from serialize and render time. Runs
+against the database configured in DJANGO_SETTINGS_MODULE, which must
+already be migrated; missing rows are seeded first.
+
+Usage:
+    python -m benchmarks.serialize_history [--rows 10000] [--repeat 10]
+"""
+import argparse
+import os
+import time
+
+import django
+
+
+def best_of(repeat, func):
+    """Fastest of `repeat` runs, in seconds, and the last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000, help='rows in the page')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from rest_framework.renderers import JSONRenderer
+
+    from api.projections import HISTORY_FIELDS, journey_history_rows
+    from api.renderers import FastJSONRenderer
+    from api.serializers import JourneyHistorySerializer
+    from fare.models import Journey
+
+    missing = args.rows - Journey.objects.count()
+    if missing > 0:
+        Journey.objects.bulk_create(
+            [Journey(user_id=f'u{n % 100}', from_zone='1', to_zone='2', fare=55) for n in range(missing)],
+            batch_size=5000,
+        )
+
+    page = Journey.objects.order_by('-timestamp', 'id')[:args.rows]
+
+    query_old, instances = best_of(args.repeat, lambda: list(page.all()))
+    query_new, rows = best_of(args.repeat, lambda: list(page.values(*HISTORY_FIELDS)))
+
+    serialize_old, data_old = best_of(args.repeat, lambda: JourneyHistorySerializer(instances, many=True).data)
+    serialize_new, data_new = best_of(args.repeat, lambda: journey_history_rows(rows))
+    assert data_new == data_old, 'projection output differs from the serializer'
+
+    render_old, body_old = best_of(args.repeat, lambda: JSONRenderer().render({'journeys': data_old}))
+    render_new, body_new = best_of(args.repeat, lambda: FastJSONRenderer().render({'journeys': data_new}))
+    assert body_new == body_old, 'rendered bytes differ'
+
+    count = len(rows)
+    print(f'rows per page: {count:,}')
+    print(f"{'path':<11} {'query ms':>9} {'serialize ms':>13} {'render ms':>10} {'total ms':>9} {'rows/sec':>11}")
+    for name, query, serialize, render in [
+        ('serializer', query_old, serialize_old, render_old),
+        ('projection', query_new, serialize_new, render_new),
+    ]:
+        total = query + serialize + render
+        print(f'{name:<11} {query * 1000:>9.1f} {serialize * 1000:>13.1f} {render * 1000:>10.1f} '
+              f'{total * 1000:>9.1f} {count / (serialize + render):>11,.0f}')
+    print('rows/sec counts serialize + render only')
+
+
+if __name__ == '__main__':
+    main()
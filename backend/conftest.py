@@ -0,0 +1,55 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def fresh_fare_rules():
+    '''
+    Each test gets its own fare rule snapshot.
+    Test transactions are rolled back, so a snapshot or cached version
+    compiled in one test must not be reused by the next.
+    '''
+    from django.core.cache import cache
+    from fare.rules import invalidate_rule_snapshot
+
+    cache.clear()
+    invalidate_rule_snapshot()
+    yield
+    invalidate_rule_snapshot()
+
+
+def pytest_configure(config):
+    '''
+    Add a second test database, 'replica', for the read replica tests.
+    Nothing replicates to it, so rows written only there show which
+    database served a read.
+    '''
+    from django.conf import settings
+
+    primary = settings.DATABASES['default']
+    replica = {**primary, 'TEST': dict(primary.get('TEST', {}))}
+    if primary['ENGINE'] != 'django.db.backends.sqlite3':
+        replica['TEST']['NAME'] = f"test_{primary['NAME']}_replica"
+    settings.DATABASES.setdefault('replica', replica)
+
+
+@pytest.fixture
+def query_budget():
+    '''
+    Context manager factory: `with query_budget(3, 'label'):` fails the
+    test, listing every SQL statement run, if the block runs more than 3
+    queries on the default database.
+    '''
+    from contextlib import contextmanager
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    @contextmanager
+    def check(budget, label='block'):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        if len(context) > budget:
+            statements = '\n'.join(f'{n}. {query["sql"]}' for n, query in enumerate(context.captured_queries, 1))
+            pytest.fail(f'{label} ran {len(context)} queries, over its budget of {budget}:\n{statements}', pytrace=False)
+
+    return check
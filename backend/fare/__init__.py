@@ -1,4 +1,4 @@
 """Fare calculation services."""
-from .fare_calculator import SimpleFareCalculator
+from .fare_calculator import FareMatrix, SimpleFareCalculator
 
-__all__ = ['SimpleFareCalculator']
\ No newline at end of file
+__all__ = ['FareMatrix', 'SimpleFareCalculator']
\ No newline at end of file
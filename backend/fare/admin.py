@@ -1,3 +1,16 @@
 from django.contrib import admin
+from fare.models import FareRule
 
-# Register your models here.
+
+@admin.register(FareRule)
+class FareRuleAdmin(admin.ModelAdmin):
+    """
+    Edit fare rules without a redeploy.
+    Saving or deleting a rule publishes a new rule-set version.
+    """
+
+    list_display = ['from_zone', 'to_zone', 'fare', 'updated_at']
+
+    list_filter = ['from_zone']
+
+    ordering = ['from_zone', 'to_zone']
@@ -1,11 +1,30 @@
 """
-Fare app configuration - business logic only, no models.
+Fare app configuration - fare engine, fare rules and journey history.
 """
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class FareConfig(AppConfig):
     """Configuration for the Fare app."""
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fare'
-    verbose_name = 'Fare Management'
\ No newline at end of file
+    verbose_name = 'Fare Management'
+
+    def ready(self):
+        # Register signal handlers that invalidate fare rule snapshots
+        from . import signals  # noqa: F401
+
+        if settings.JOURNEY_WRITE_BEHIND:
+            # Queued journeys must be flushed before the process exits
+            # (see fare.write_behind)
+            if os.environ.get('RUN_MAIN') == 'true':
+                raise ImproperlyConfigured(
+                    "JOURNEY_WRITE_BEHIND can't drain its queue under runserver's autoreloader; "
+                    'run it with --noreload'
+                )
+            from .write_behind import exit_on_sigterm
+            exit_on_sigterm()
\ No newline at end of file
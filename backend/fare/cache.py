@@ -0,0 +1,153 @@
+"""
+Namespaced, version-stamped access to the shared Django cache.
+
+settings.CACHES points every worker at the same store (file-based on
+one host by default, Redis or Memcached via CACHE_BACKEND), so values
+cached here are shared across workers. Keys are prefixed with their
+namespace and, optionally, a version. Cached data is never deleted to
+invalidate it: the version moves on and old entries simply expire.
+
+    RULES = CacheNamespace('fare')
+    RULES.get_many(['zones', 'rules'], version=7)
+
+Versions are either supplied by the caller (e.g. the fare rule-set
+version) or kept in the cache itself per scope with generation() and
+bump_generation(), e.g. one generation per user for history pages.
+
+Hits and misses are counted per namespace in each process; see stats().
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+_MISSING = object()
+# Prefix of generations not started by a bump; see generation_age()
+_UNDATED = 'u'
+
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_stats_lock = threading.Lock()
+
+
+class CacheNamespace:
+    """
+    A key prefix in one of the configured caches.
+    """
+
+    def __init__(self, name: str, timeout=DEFAULT_TIMEOUT, alias: str = 'default'):
+        self.name = name
+        self.timeout = timeout
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, key: str, version: Optional[Any] = None) -> str:
+        if version is None:
+            return f'{self.name}:{key}'
+        return f'{self.name}:v{version}:{key}'
+
+    def get(self, key: str, default=None, version: Optional[Any] = None):
+        value = self.cache.get(self.make_key(key, version), _MISSING)
+        if value is _MISSING:
+            self._count(0, 1)
+            return default
+        self._count(1, 0)
+        return value
+
+    def get_many(self, keys: Iterable[str], version: Optional[Any] = None) -> Dict[str, Any]:
+        """Return the cached values among `keys`, in one round trip."""
+        keys = list(keys)
+        found = self.cache.get_many([self.make_key(key, version) for key in keys])
+        values = {
+            key: found[self.make_key(key, version)]
+            for key in keys if self.make_key(key, version) in found
+        }
+        self._count(len(values), len(keys) - len(values))
+        return values
+
+    def set(self, key: str, value, timeout=DEFAULT_TIMEOUT, version: Optional[Any] = None) -> None:
+        self.cache.set(self.make_key(key, version), value, self._timeout(timeout))
+
+    def set_many(self, mapping: Dict[str, Any], timeout=DEFAULT_TIMEOUT, version: Optional[Any] = None) -> None:
+        self.cache.set_many(
+            {self.make_key(key, version): value for key, value in mapping.items()},
+            self._timeout(timeout),
+        )
+
+    def add(self, key: str, value, timeout=DEFAULT_TIMEOUT, version: Optional[Any] = None) -> bool:
+        """Store `value` only if `key` is not cached; returns whether it was stored."""
+        return self.cache.add(self.make_key(key, version), value, self._timeout(timeout))
+
+    def delete(self, key: str, version: Optional[Any] = None) -> None:
+        self.cache.delete(self.make_key(key, version))
+
+    def get_or_set(self, key: str, build: Callable[[], Any], timeout=DEFAULT_TIMEOUT, version: Optional[Any] = None):
+        """Return the cached value, or build, store and return it."""
+        value = self.get(key, _MISSING, version)
+        if value is _MISSING:
+            value = build()
+            self.set(key, value, timeout, version)
+        return value
+
+    def generation(self, scope: str) -> str:
+        """
+        Current cache generation for `scope`, to pass as `version`.
+
+        Generations are opaque tokens rather than counters, so an evicted
+        generation can never come back with a value that was used before.
+        """
+        key = self.make_key(f'generation:{scope}')
+        value = self.cache.get(key)
+        if value is None:
+            self.cache.add(key, _UNDATED + _token(), None)
+            value = self.cache.get(key)
+        return value
+
+    def generation_age(self, generation: str) -> float:
+        """
+        Seconds since `generation` was started by bump_generation(s).
+        Infinite for one generation() started for a scope without one
+        (never bumped, or evicted), whose last change is unknown.
+        """
+        if generation.startswith(_UNDATED):
+            return math.inf
+        return (time.time_ns() - int(generation, 16)) / 1e9
+
+    def bump_generation(self, scope: str) -> None:
+        """Move `scope` to a new generation, orphaning its cached entries."""
+        self.cache.set(self.make_key(f'generation:{scope}'), _token(), None)
+
+    def bump_generations(self, scopes: Iterable[str]) -> None:
+        """bump_generation() for many scopes in one cache round trip."""
+        token = _token()
+        self.cache.set_many({self.make_key(f'generation:{scope}'): token for scope in scopes}, None)
+
+    def _timeout(self, timeout):
+        return self.timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _count(self, hits: int, misses: int) -> None:
+        with _stats_lock:
+            counts = _stats[self.name]
+            counts['hits'] += hits
+            counts['misses'] += misses
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Hit and miss counts per namespace for this process."""
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def _token() -> str:
+    return format(time.time_ns(), 'x')
@@ -1,10 +1,250 @@
 """
 Simple fare calculator for PearlCard system.
-No database required - uses hardcoded fare rules as per requirements.
+No database required - the hardcoded fare rules here are the defaults.
+Rules stored in the database are compiled by fare.rules.
 """
-from typing import List, Dict, Tuple
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
 from decimal import Decimal
 
+import numpy as np
+
+
+def _lookup(index: Mapping, zone, default=None):
+    """index.get(zone), treating unhashable zones (e.g. a list) as unknown."""
+    try:
+        return index.get(zone, default)
+    except TypeError:
+        return default
+
+
+def _zone_sort_key(zone: str) -> Tuple[int, int, str]:
+    """Order numeric zone ids numerically ("2" before "10"), others after."""
+    return (0, int(zone), zone) if zone.isdigit() else (1, 0, zone)
+
+
+class FareMatrix:
+    """
+    Compiled, immutable fare table.
+
+    Zone ids are interned to small integers and fares are stored in a flat,
+    symmetric N x N tuple. A lookup is one dict probe per zone plus a single
+    tuple index - no sorting, no tuple building, no allocation per call.
+    """
+
+    # Marker for zone pairs that have no fare rule
+    NO_FARE = -1
+
+    __slots__ = ('zones', 'zone_index', '_row_offset', '_fares', '_zone_list', '_array', '_keys')
+
+    def __init__(self, zones: Iterable[str], fares: Mapping[Tuple[str, str], int]):
+        """
+        Args:
+            zones: Zone ids that can be priced
+            fares: Fare per zone pair; each pair only needs one direction
+        """
+        self.zones = tuple(sorted(set(zones), key=_zone_sort_key))
+        self.zone_index = {zone: idx for idx, zone in enumerate(self.zones)}
+
+        size = len(self.zones)
+        table = [self.NO_FARE] * (size * size)
+        for (from_zone, to_zone), fare in fares.items():
+            row = self.zone_index[from_zone]
+            col = self.zone_index[to_zone]
+            # Fares are bidirectional, so fill both halves of the matrix
+            table[row * size + col] = int(fare)
+            table[col * size + row] = int(fare)
+
+        self._fares = tuple(table)
+        self._row_offset = {zone: idx * size for zone, idx in self.zone_index.items()}
+        self._zone_list = ', '.join(self.zones)
+        self._array = None
+        self._keys = None
+
+    @classmethod
+    def from_tables(
+        cls,
+        same_zone_fares: Mapping[str, int],
+        different_zone_fares: Mapping[Tuple[str, str], int],
+        zones: Optional[Iterable[str]] = None,
+    ) -> 'FareMatrix':
+        """
+        Build a matrix from the SAME_ZONE_FARES / DIFFERENT_ZONE_FARES layout.
+        """
+        fares = {(zone, zone): fare for zone, fare in same_zone_fares.items()}
+        fares.update(different_zone_fares)
+
+        all_zones = set(zones or ())
+        for from_zone, to_zone in fares:
+            all_zones.add(from_zone)
+            all_zones.add(to_zone)
+        return cls(all_zones, fares)
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    def __contains__(self, zone) -> bool:
+        return _lookup(self.zone_index, zone) is not None
+
+    def fare(self, from_zone: str, to_zone: str) -> int:
+        """
+        Look up the fare between two zones.
+
+        Raises:
+            ValueError: If a zone is unknown or the pair has no fare rule
+        """
+        row = _lookup(self._row_offset, from_zone)
+        if row is None:
+            raise ValueError(f"Invalid from_zone: {from_zone}. Must be one of {self._zone_list}")
+        col = _lookup(self.zone_index, to_zone)
+        if col is None:
+            raise ValueError(f"Invalid to_zone: {to_zone}. Must be one of {self._zone_list}")
+
+        fare = self._fares[row + col]
+        if fare == self.NO_FARE:
+            raise ValueError(f"No fare rule for Zone {from_zone} → Zone {to_zone}")
+        return fare
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        The fare matrix as a read-only (N, N) int64 array, for vectorized lookups.
+        """
+        if self._array is None:
+            size = len(self.zones)
+            array = np.array(self._fares, dtype=np.int64).reshape(size, size)
+            array.flags.writeable = False
+            self._array = array
+        return self._array
+
+    def _search_keys(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Zone ids in lexicographic order, with their matrix index."""
+        if self._keys is None:
+            ordered = sorted(self.zone_index.items())
+            self._keys = (
+                np.array([zone for zone, _ in ordered]),
+                np.array([idx for _, idx in ordered], dtype=np.intp),
+            )
+        return self._keys
+
+    def encode(self, zones: Sequence) -> np.ndarray:
+        """
+        Map a column of zone ids to matrix indices; unknown zones become -1.
+        """
+        if isinstance(zones, np.ndarray):
+            column = zones if zones.dtype.kind == 'U' else None
+        elif all(type(zone) is str for zone in zones):
+            column = np.array(zones, dtype=str)
+        else:
+            # np.asarray would coerce a mixed column such as ['1', 2] to
+            # strings, pricing the int 2 as zone '2'
+            column = None
+        if column is not None and len(column) and self.zones:
+            # Binary search against the sorted zone ids, O(n log N) for N zones
+            keys, key_codes = self._search_keys()
+            positions = np.searchsorted(keys, column).clip(max=len(keys) - 1)
+            return np.where(keys[positions] == column, key_codes[positions], -1)
+
+        # Mixed or non-string input (e.g. None for a missing zone, or a list)
+        index = self.zone_index
+        values = zones.tolist() if isinstance(zones, np.ndarray) else list(zones)
+        return np.fromiter((_lookup(index, zone, -1) for zone in values), dtype=np.intp, count=len(values))
+
+    def price_arrays(self, from_zones: Sequence, to_zones: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Price whole columns of journeys with one vectorized gather.
+
+        Args:
+            from_zones: Starting zone of each journey
+            to_zones: Destination zone of each journey
+
+        Returns:
+            (fares, errors): an int64 fare array and a boolean error mask.
+            Journeys with an unknown zone or no fare rule are flagged in the
+            mask and priced at 0.
+        """
+        from_codes = self.encode(from_zones)
+        to_codes = self.encode(to_zones)
+        if from_codes.shape != to_codes.shape:
+            raise ValueError("from_zones and to_zones must have the same length")
+
+        valid = (from_codes >= 0) & (to_codes >= 0)
+        fares = self.array[np.where(valid, from_codes, 0), np.where(valid, to_codes, 0)]
+        errors = ~valid | (fares == self.NO_FARE)
+        fares[errors] = 0
+        return fares, errors
+
+    def price_journeys(self, journeys: List[Dict]) -> Dict:
+        """
+        Price a list of journey dicts; see SimpleFareCalculator.calculate_batch_fares
+        for the result layout.
+        """
+        from_zones = [journey.get('from_zone') for journey in journeys]
+        to_zones = [journey.get('to_zone') for journey in journeys]
+        fares, errors = self.price_arrays(from_zones, to_zones)
+
+        results = []
+        for idx, (from_zone, to_zone, fare, error) in enumerate(
+            zip(from_zones, to_zones, fares.tolist(), errors.tolist()), 1
+        ):
+            if not error:
+                results.append({
+                    'journey_number': idx,
+                    'from_zone': from_zone,
+                    'to_zone': to_zone,
+                    'fare': fare,
+                    'status': 'success'
+                })
+                continue
+
+            # Only failed journeys take the slow path, to get the error message
+            try:
+                if from_zone is None or to_zone is None:
+                    raise ValueError("Missing from_zone or to_zone")
+                self.fare(from_zone, to_zone)
+            except (ValueError, TypeError, KeyError) as e:
+                message = str(e)
+            results.append({
+                'journey_number': idx,
+                'from_zone': from_zone,
+                'to_zone': to_zone,
+                'fare': 0.0,
+                'status': 'error',
+                'error_message': message
+            })
+
+        return {
+            'journeys': results,
+            'total_fare': int(fares.sum()),
+            'journey_count': len(results)
+        }
+
+    def pairs(self) -> List[Tuple[str, str, int]]:
+        """
+        All priced (from_zone, to_zone, fare) triples, both directions.
+        """
+        size = len(self.zones)
+        return [
+            (from_zone, to_zone, self._fares[row * size + col])
+            for row, from_zone in enumerate(self.zones)
+            for col, to_zone in enumerate(self.zones)
+            if self._fares[row * size + col] != self.NO_FARE
+        ]
+
+    def rules(self) -> List[Dict]:
+        """
+        All fare rules in display format, sorted by (from_zone, to_zone).
+        """
+        rules = [
+            {
+                'from_zone': from_zone,
+                'to_zone': to_zone,
+                'fare': fare,
+                'route': f"Zone {from_zone} → Zone {to_zone}"
+            }
+            for from_zone, to_zone, fare in self.pairs()
+        ]
+        return sorted(rules, key=lambda x: (x['from_zone'], x['to_zone']))
+
 
 class SimpleFareCalculator:
     """
@@ -20,6 +260,7 @@ class SimpleFareCalculator:
     
     This implementation:
     - Uses no database queries (fast)
+    - Compiles the rule tables into a FareMatrix once, so lookups are O(1)
     - Easy to test
     - Clear business logic
     - Can be extended if requirements change
@@ -41,6 +282,24 @@ class SimpleFareCalculator:
         ("1", "3"): 65,  # Zone 1 <-> Zone 3
         ("2", "3"): 45,  # Zone 2 <-> Zone 3
     }
+
+    # Compiled from the tables above on first use (see compiled())
+    _matrix = None
+
+    @classmethod
+    def compiled(cls) -> FareMatrix:
+        """
+        Return the FareMatrix compiled from this class's fare tables.
+        """
+        # Look in the class's own namespace so subclasses with different
+        # tables never reuse a parent's matrix
+        matrix = cls.__dict__.get('_matrix')
+        if matrix is None:
+            matrix = FareMatrix.from_tables(
+                cls.SAME_ZONE_FARES, cls.DIFFERENT_ZONE_FARES, zones=cls.VALID_ZONES
+            )
+            cls._matrix = matrix
+        return matrix
     
     @classmethod
     def calculate_single_fare(cls, from_zone: int, to_zone: int) -> int:
@@ -62,20 +321,24 @@ class SimpleFareCalculator:
         Raises:
             ValueError: If zones are invalid
         """
-        # Validate zones
-        if from_zone not in cls.VALID_ZONES:
-            raise ValueError(f"Invalid from_zone: {from_zone}. Must be 1, 2, or 3")
-        if to_zone not in cls.VALID_ZONES:
-            raise ValueError(f"Invalid to_zone: {to_zone}. Must be 1, 2, or 3")
-        
-        # Same zone travel
-        if from_zone == to_zone:
-            return cls.SAME_ZONE_FARES[from_zone]
-        
-        
-        # Different zone travel (handle bidirectional by sorting)
-        zone_pair = tuple(sorted([from_zone, to_zone]))
-        return cls.DIFFERENT_ZONE_FARES[zone_pair]
+        # Validation and the bidirectional lookup are both handled by the
+        # compiled matrix
+        return cls.compiled().fare(from_zone, to_zone)
+
+    @classmethod
+    def calculate_fare_arrays(cls, from_zones: Sequence, to_zones: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculate fares for columns of journeys in one vectorized pass.
+        Intended for back-office repricing, so there is no journey limit.
+
+        Args:
+            from_zones: Array-like of starting zones
+            to_zones: Array-like of destination zones
+
+        Returns:
+            (fares, errors) - see FareMatrix.price_arrays
+        """
+        return cls.compiled().price_arrays(from_zones, to_zones)
 
     @classmethod
     def calculate_batch_fares(cls, journeys: List[Dict]) -> Dict:
@@ -106,49 +369,8 @@ class SimpleFareCalculator:
         if len(journeys) > 20:
             journeys = journeys[:20]
         
-        results = []
-        total_fare = 0
-        
-        for idx, journey in enumerate(journeys, 1):
-            try:
-                # Extract zones
-                from_zone = journey.get('from_zone')
-                to_zone = journey.get('to_zone')
-                
-                # Validate input exists
-                if from_zone is None or to_zone is None:
-                    raise ValueError("Missing from_zone or to_zone")
-                
-                # Calculate fare
-                fare = cls.calculate_single_fare(from_zone, to_zone)
-                
-                # Add to results
-                results.append({
-                    'journey_number': idx,
-                    'from_zone': from_zone,
-                    'to_zone': to_zone,
-                    'fare': fare,
-                    'status': 'success'
-                })
-                total_fare += fare
-                
-            except (ValueError, TypeError, KeyError) as e:
-                # Handle errors gracefully
-                results.append({
-                    'journey_number': idx,
-                    'from_zone': journey.get('from_zone'),
-                    'to_zone': journey.get('to_zone'),
-                    'fare': 0.0,
-                    'status': 'error',
-                    'error_message': str(e)
-                })
-        
-        return {
-            'journeys': results,
-            'total_fare': total_fare,
-            'journey_count': len(results)
-        }
-    
+        return cls.compiled().price_journeys(journeys)
+
     @classmethod
     def get_all_fare_rules(cls) -> List[Dict]:
         """
@@ -158,32 +380,5 @@ class SimpleFareCalculator:
         Returns:
             List of fare rules
         """
-        rules = []
-        
-        # Add same zone fares
-        for zone, fare in cls.SAME_ZONE_FARES.items():
-            rules.append({
-                'from_zone': zone,
-                'to_zone': zone,
-                'fare': fare,
-                'route': f"Zone {zone} → Zone {zone}"
-            })
-        
-        # Add different zone fares
-        for (from_zone, to_zone), fare in cls.DIFFERENT_ZONE_FARES.items():
-            # Add both directions since fares are bidirectional
-            rules.append({
-                'from_zone': from_zone,
-                'to_zone': to_zone,
-                'fare': fare,
-                'route': f"Zone {from_zone} → Zone {to_zone}"
-            })
-            rules.append({
-                'from_zone': to_zone,
-                'to_zone': from_zone,
-                'fare': fare,
-                'route': f"Zone {to_zone} → Zone {from_zone}"
-            })
-        
-        return sorted(rules, key=lambda x: (x['from_zone'], x['to_zone']))
+        return cls.compiled().rules()
 
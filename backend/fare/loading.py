@@ -0,0 +1,120 @@
+"""
+Bulk loading of already priced journeys, for seeding and imports.
+
+load_journeys() writes a chunk of journeys into a temporary staging
+table (COPY on PostgreSQL, multi-row INSERTs elsewhere), then moves them
+into Journey and adds them to the rollups (JourneyDailyRollup) and daily
+quota counters (DailyJourneyCount) with one INSERT ... SELECT each, all
+in one transaction. Timestamps and travel days are stored as given.
+
+Counters are incremented, not recounted: load into days that have no
+journeys yet, or whose journeys already have counters.
+"""
+import csv
+import datetime
+import io
+from typing import Sequence
+
+from django.db import connection, transaction
+
+from .models import DailyJourneyCount, Journey, JourneyDailyRollup
+from .partitions import ensure_partitions_for
+from .rollups import ROLLUP_KEY
+
+STAGING_TABLE = 'fare_journey_staging'
+COLUMNS = ('user_id', 'from_zone', 'to_zone', 'fare', 'timestamp', 'travel_date')
+INSERT_BATCH_SIZE = 1000
+
+
+def load_journeys(
+    user_ids: Sequence[str],
+    from_zones: Sequence[str],
+    to_zones: Sequence[str],
+    fares: Sequence[int],
+    timestamps: Sequence[datetime.datetime],
+    travel_dates: Sequence[datetime.date],
+) -> int:
+    """
+    Store one chunk of journeys, given as equally long columns, with
+    their rollups and quota counters. Returns the number stored.
+
+    Timestamps must be aware; travel_dates must be their travel days
+    (fare.models.travel_date_of), which are not recomputed.
+    """
+    size = len(user_ids)
+    if not size:
+        return 0
+
+    quote = connection.ops.quote_name
+    staging = quote(STAGING_TABLE)
+    journeys = quote(Journey._meta.db_table)
+    rollups = quote(JourneyDailyRollup._meta.db_table)
+    counters = quote(DailyJourneyCount._meta.db_table)
+    columns = ', '.join(COLUMNS)
+    key = ', '.join(ROLLUP_KEY)
+    staged_key = 'user_id, travel_date, from_zone, to_zone'
+
+    with transaction.atomic():
+        # Rows for months without a partition would pile up in the
+        # default partition
+        ensure_partitions_for(set(travel_dates))
+
+        with connection.cursor() as cursor:
+            # An error rolls the CREATE back with the rest of the chunk. On
+            # PostgreSQL the table goes at commit; a table left by an
+            # earlier chunk in the same (outer) transaction is replaced.
+            # Elsewhere it is dropped once the chunk is stored.
+            on_commit_drop = connection.vendor == 'postgresql'
+            if on_commit_drop:
+                cursor.execute(f'DROP TABLE IF EXISTS {staging}')
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {staging} (user_id varchar(10), from_zone varchar(10), '
+                f'to_zone varchar(10), fare integer, timestamp timestamp with time zone, travel_date date)'
+                + (' ON COMMIT DROP' if on_commit_drop else '')
+            )
+            _stage(cursor, staging, columns, (user_ids, from_zones, to_zones, fares, timestamps, travel_dates))
+
+            cursor.execute(f'INSERT INTO {journeys} ({columns}) SELECT {columns} FROM {staging}')
+            # In key order, like fare.rollups.record_journeys, so
+            # concurrent writers lock rows in the same order
+            cursor.execute(
+                f'INSERT INTO {rollups} ({key}, journey_count, total_fare) '
+                f'SELECT {staged_key}, COUNT(*), SUM(fare) FROM {staging} WHERE true '
+                f'GROUP BY {staged_key} ORDER BY {staged_key} '
+                f'ON CONFLICT ({key}) DO UPDATE SET '
+                f'journey_count = {rollups}.journey_count + EXCLUDED.journey_count, '
+                f'total_fare = {rollups}.total_fare + EXCLUDED.total_fare'
+            )
+            cursor.execute(
+                f'INSERT INTO {counters} (user_id, day, count) '
+                f'SELECT user_id, travel_date, COUNT(*) FROM {staging} WHERE true '
+                f'GROUP BY user_id, travel_date ORDER BY user_id, travel_date '
+                f'ON CONFLICT (user_id, day) DO UPDATE SET count = {counters}.count + EXCLUDED.count'
+            )
+            if not on_commit_drop:
+                cursor.execute(f'DROP TABLE {staging}')
+    return size
+
+
+def _stage(cursor, staging, columns, values) -> None:
+    if connection.vendor == 'postgresql':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(zip(*values))
+        buffer.seek(0)
+        cursor.copy_expert(f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        return
+
+    ops = connection.ops
+    rows = list(zip(*values))
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[start:start + INSERT_BATCH_SIZE]
+        params = []
+        for user_id, from_zone, to_zone, fare, timestamp, travel_date in batch:
+            params += [
+                user_id, from_zone, to_zone, fare,
+                ops.adapt_datetimefield_value(timestamp), ops.adapt_datefield_value(travel_date),
+            ]
+        cursor.execute(
+            f'INSERT INTO {staging} ({columns}) VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))}',
+            params,
+        )
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from fare.partitions import ensure_partitions, expire_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        'Create upcoming monthly Journey partitions and detach + archive '
+        'expired ones (PostgreSQL; see fare.partitions). Safe to run repeatedly, e.g. daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=settings.JOURNEY_PARTITION_MONTHS_AHEAD,
+            help='months of partitions to keep created ahead of the current one',
+        )
+        parser.add_argument(
+            '--retain-months', type=int, default=settings.JOURNEY_RETENTION_MONTHS,
+            help='months of journeys to keep, including the current one (default: keep all)',
+        )
+        parser.add_argument('--archive-dir', help='write expired partitions here as .csv.gz, then drop them')
+        parser.add_argument(
+            '--archive-schema', default=settings.JOURNEY_ARCHIVE_SCHEMA,
+            help='otherwise move expired partitions into this schema',
+        )
+
+    def handle(self, *args, ahead, retain_months, archive_dir, archive_schema, **options):
+        if not is_partitioned():
+            self.stdout.write('Journey table is not partitioned on this database; nothing to do')
+            return
+
+        for month in ensure_partitions(ahead=ahead):
+            self.stdout.write(f'Created partition for {month:%Y-%m}')
+
+        if retain_months:
+            try:
+                expired = expire_partitions(retain_months, archive_dir=archive_dir, archive_schema=archive_schema)
+            except ValueError as e:
+                raise CommandError(str(e))
+            for month in expired:
+                where = archive_dir or f'schema {archive_schema}'
+                self.stdout.write(f'Detached partition for {month:%Y-%m} and archived it to {where}')
+        self.stdout.write(self.style.SUCCESS('Journey partitions are up to date'))
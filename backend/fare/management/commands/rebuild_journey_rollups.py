@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fare.models import Journey, JourneyDailyRollup
+from fare.rollups import rebuild_rollups
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'{value!r} is not a date in YYYY-MM-DD format')
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute journey rollups (fare.rollups) from raw journeys, one user '
+        'per transaction. Use after journeys were edited outside the API.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', help='only this user (repeatable)')
+        parser.add_argument('--date-from', type=_date, help='first travel day to rebuild (inclusive)')
+        parser.add_argument('--date-to', type=_date, help='last travel day to rebuild (inclusive)')
+
+    def handle(self, *args, users=None, date_from=None, date_to=None, **options):
+        if users is None:
+            # Users with rollups but no journeys left get their rollups cleared
+            users = sorted(
+                set(Journey.objects.order_by().values_list('user_id', flat=True).distinct())
+                | set(JourneyDailyRollup.objects.order_by().values_list('user_id', flat=True).distinct())
+            )
+
+        rebuilt = rows = 0
+        for user_id in users:
+            rows += rebuild_rollups(user_id, date_from, date_to)
+            rebuilt += 1
+            if rebuilt % 1000 == 0:
+                self.stdout.write(f'{rebuilt} users rebuilt')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows for {rebuilt} users'))
@@ -0,0 +1,136 @@
+import datetime
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from fare.loading import load_journeys
+from fare.models import operator_timezone
+from fare.quota import MAX_JOURNEYS_PER_DAY, travel_day
+from fare.rules import bump_rule_version, get_rule_snapshot, rule_zones
+from zones.models import Zone
+
+USER_ID_MAX_LENGTH = 10
+
+# Share of journeys in the morning and evening peaks, centred on these
+# local hours with this spread; the rest fall between FIRST_HOUR and
+# midnight
+PEAKS = ((0.35, 8.0, 1.0), (0.35, 17.5, 1.25))
+FIRST_HOUR = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed synthetic riders and journeys for load testing, through fare.loading '
+        '(COPY on PostgreSQL). Riders are named <prefix><n>, n from 0; some '
+        'travel much more than others, mostly at peak hours, and never over '
+        'the daily journey limit.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journeys', type=int, default=1_000_000)
+        parser.add_argument('--riders', type=int, default=10_000)
+        parser.add_argument('--days', type=int, default=90, help='spread journeys over this many travel days up to today')
+        parser.add_argument('--prefix', default='r', help='user id prefix (default: r)')
+        parser.add_argument('--chunk-size', type=int, default=100_000, help='journeys per transaction')
+        parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+    def handle(self, *args, journeys, riders, days, prefix, chunk_size, seed, **options):
+        if min(journeys, riders, days, chunk_size) < 1:
+            raise CommandError('--journeys, --riders, --days and --chunk-size must be positive')
+        if len(f'{prefix}{riders - 1}') > USER_ID_MAX_LENGTH:
+            raise CommandError(f'User ids would be longer than {USER_ID_MAX_LENGTH} characters')
+        if journeys > riders * days * MAX_JOURNEYS_PER_DAY:
+            raise CommandError(
+                f'{riders} riders can make at most {riders * days * MAX_JOURNEYS_PER_DAY} journeys in {days} days'
+            )
+
+        self.ensure_zones()
+        zones = np.array(get_rule_snapshot().matrix.zones)
+
+        rng = np.random.default_rng(seed)
+        # Exponentially distributed: many occasional riders, some commuters
+        activity = rng.exponential(size=riders)
+        activity /= activity.sum()
+        today = travel_day()
+        first_day = today - datetime.timedelta(days=days - 1)
+        # UTC offset of each travel day, taken at noon; peaks are far
+        # enough from the small-hours DST changes
+        tz = operator_timezone()
+        offsets = np.array([
+            int(datetime.datetime.combine(first_day + datetime.timedelta(days=n), datetime.time(12), tz).utcoffset().total_seconds())
+            for n in range(days)
+        ])
+        latest = int(timezone.now().timestamp())
+        today_start = int(datetime.datetime.combine(today, datetime.time(), tz).timestamp())
+        used = np.zeros(riders * days, dtype=np.uint8)
+
+        stored, started = 0, time.perf_counter()
+        while stored < journeys:
+            size = min(chunk_size, journeys - stored)
+            users = rng.choice(riders, size=size, p=activity)
+            day = rng.integers(days, size=size)
+            keep = self.within_limit(users * days + day, used)
+            users, day = users[keep], day[keep]
+            size = len(users)
+            if not size:
+                continue
+
+            local = (np.datetime64(first_day, 's') + day * 86400).astype(np.int64) + self.seconds_of_day(rng, size)
+            epoch = local - offsets[day]
+            # Today's journeys have all been made by now
+            future = epoch > latest
+            epoch[future] = rng.integers(today_start, latest + 1, size=int(future.sum()))
+            from_zones, to_zones = rng.choice(zones, size=size), rng.choice(zones, size=size)
+            fares, _ = get_rule_snapshot().matrix.price_arrays(from_zones, to_zones)
+
+            stored += load_journeys(
+                [f'{prefix}{n}' for n in users.tolist()],
+                from_zones.tolist(),
+                to_zones.tolist(),
+                fares.tolist(),
+                [moment.replace(tzinfo=datetime.timezone.utc) for moment in epoch.astype('datetime64[s]').tolist()],
+                (np.datetime64(first_day, 'D') + day).tolist(),
+            )
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{stored} journeys ({stored / elapsed:,.0f}/s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {stored} journeys for {riders} riders over {days} days in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def ensure_zones(self):
+        '''Create a Zone for every zone the fare rules price.'''
+        existing = set(Zone.objects.values_list('zone_number', flat=True))
+        missing = [zone for zone in rule_zones() if zone not in existing]
+        if missing:
+            Zone.objects.bulk_create([Zone(zone_number=zone, name=f'Zone {zone}') for zone in missing])
+            # bulk_create skips the signals that normally bump the version
+            bump_rule_version()
+            self.stdout.write(f'Created zones {", ".join(missing)}')
+
+    def within_limit(self, keys, used):
+        '''
+        Mask of the journeys that fit under the daily limit, given `used`
+        journeys per (rider, day) key so far; counts the kept ones in `used`.
+        '''
+        order = np.argsort(keys, kind='stable')
+        ordered = keys[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        rank = np.empty(len(keys), dtype=np.int64)
+        rank[order] = np.arange(len(keys)) - np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+        keep = used[keys].astype(np.int64) + rank < MAX_JOURNEYS_PER_DAY
+        np.add.at(used, keys[keep], 1)
+        return keep
+
+    def seconds_of_day(self, rng, size):
+        '''Local seconds after midnight: peaks, then the rest of the day.'''
+        hours = rng.uniform(FIRST_HOUR, 24, size=size)
+        pick = rng.random(size)
+        threshold = 0.0
+        for share, centre, spread in PEAKS:
+            peak = (pick >= threshold) & (pick < threshold + share)
+            hours[peak] = rng.normal(centre, spread, size=int(peak.sum()))
+            threshold += share
+        return (np.clip(hours, FIRST_HOUR, 24 - 1 / 3600) * 3600).astype(np.int64)
@@ -0,0 +1,94 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:03
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyJourneyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(help_text='user id', max_length=10)),
+                ('day', models.DateField(help_text='Travel day the journeys count against')),
+                ('count', models.PositiveIntegerField(default=0, help_text='Journeys reserved for this user on this day')),
+            ],
+            options={
+                'verbose_name': 'Daily journey count',
+                'verbose_name_plural': 'Daily journey counts',
+            },
+        ),
+        migrations.CreateModel(
+            name='FareRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_zone', models.CharField(help_text='Zone at one end of the journey', max_length=10)),
+                ('to_zone', models.CharField(help_text='Zone at the other end of the journey', max_length=10)),
+                ('fare', models.IntegerField(help_text='Fare amount (stored as integer)', validators=[django.core.validators.MinValueValidator(0)])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Fare rule',
+                'verbose_name_plural': 'Fare rules',
+                'ordering': ['from_zone', 'to_zone'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FareRuleSetVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Fare rule set version',
+            },
+        ),
+        migrations.CreateModel(
+            name='Journey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(help_text='user id', max_length=10)),
+                ('from_zone', models.CharField(help_text='Starting zone number', max_length=10)),
+                ('to_zone', models.CharField(help_text='Destination zone number', max_length=10)),
+                ('fare', models.IntegerField(help_text='Calculated fare amount (stored as integer)', validators=[django.core.validators.MinValueValidator(0)])),
+                ('timestamp', models.DateTimeField(auto_now_add=True, help_text='When the journey was calculated')),
+            ],
+            options={
+                'verbose_name': 'Journey',
+                'verbose_name_plural': 'Journeys',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyjourneycount',
+            constraint=models.UniqueConstraint(fields=('user_id', 'day'), name='unique_daily_journey_count'),
+        ),
+        migrations.AddConstraint(
+            model_name='farerule',
+            constraint=models.UniqueConstraint(fields=('from_zone', 'to_zone'), name='unique_fare_rule_zones'),
+        ),
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['-timestamp', 'id'], name='fare_journe_timesta_675990_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['fare', '-timestamp', 'id'], name='fare_journe_fare_68265c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['from_zone', 'to_zone', '-timestamp', 'id'], name='fare_journe_from_zo_a40033_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['to_zone', '-timestamp', 'id'], name='fare_journe_to_zone_7a878b_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+import fare.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Add Journey.travel_date as nullable first; 0003 backfills it in
+    batches and 0004 makes it required and indexes it.
+    """
+
+    dependencies = [
+        ('fare', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journey',
+            name='travel_date',
+            field=fare.models.TravelDateField(null=True, help_text="Travel day in the operator's time zone (FARE_OPERATOR_TIME_ZONE)"),
+        ),
+    ]
@@ -0,0 +1,47 @@
+import zoneinfo
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 10_000
+
+
+def backfill_travel_date(apps, schema_editor):
+    """
+    Fill travel_date for existing journeys, BATCH_SIZE rows at a time.
+
+    Walks the primary key so each batch is an index range scan, and
+    commits per batch (the migration is non-atomic) so a large table
+    never holds one long transaction.
+    """
+    Journey = apps.get_model('fare', 'Journey')
+    operator_tz = zoneinfo.ZoneInfo(settings.FARE_OPERATOR_TIME_ZONE)
+    db_alias = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        batch = list(
+            Journey.objects.using(db_alias)
+            .filter(id__gt=last_id, travel_date__isnull=True)
+            .order_by('id')
+            .only('id', 'timestamp')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for journey in batch:
+            journey.travel_date = journey.timestamp.astimezone(operator_tz).date()
+        Journey.objects.using(db_alias).bulk_update(batch, ['travel_date'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('fare', '0002_journey_travel_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_travel_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:05
+
+import fare.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fare', '0003_backfill_journey_travel_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='journey',
+            name='travel_date',
+            field=fare.models.TravelDateField(help_text="Travel day in the operator's time zone (FARE_OPERATOR_TIME_ZONE)"),
+        ),
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['user_id', 'travel_date'], include=('fare', 'from_zone', 'to_zone'), name='journey_user_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['user_id', '-timestamp', 'id'], name='journey_user_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fare', '0004_journey_travel_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JourneyDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(help_text='user id', max_length=10)),
+                ('day', models.DateField(help_text='Travel day (Journey.travel_date)')),
+                ('from_zone', models.CharField(help_text='Starting zone number', max_length=10)),
+                ('to_zone', models.CharField(help_text='Destination zone number', max_length=10)),
+                ('journey_count', models.PositiveIntegerField(default=0, help_text='Journeys made')),
+                ('total_fare', models.PositiveBigIntegerField(default=0, help_text='Sum of their fares')),
+            ],
+            options={
+                'verbose_name': 'Journey daily rollup',
+                'verbose_name_plural': 'Journey daily rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='journeydailyrollup',
+            constraint=models.UniqueConstraint(fields=('user_id', 'day', 'from_zone', 'to_zone'), name='unique_journey_daily_rollup'),
+        ),
+    ]
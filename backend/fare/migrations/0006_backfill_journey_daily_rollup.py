@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Aggregate existing journeys into the new rollup table with one
+    INSERT ... SELECT, so no rows travel through Python.
+    """
+    Journey = apps.get_model('fare', 'Journey')
+    JourneyDailyRollup = apps.get_model('fare', 'JourneyDailyRollup')
+    quote = schema_editor.quote_name
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(JourneyDailyRollup._meta.db_table)} '
+            f'(user_id, day, from_zone, to_zone, journey_count, total_fare) '
+            f'SELECT user_id, travel_date, from_zone, to_zone, COUNT(*), SUM(fare) '
+            f'FROM {quote(Journey._meta.db_table)} '
+            f'GROUP BY user_id, travel_date, from_zone, to_zone'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fare', '0005_journey_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
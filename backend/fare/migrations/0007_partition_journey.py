@@ -0,0 +1,113 @@
+import datetime
+import zoneinfo
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+def _months(first, last):
+    month = first.replace(day=1)
+    while month <= last:
+        yield month
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_journeys(apps, schema_editor):
+    """
+    Rebuild fare_journey as a table partitioned by month of travel_date.
+
+    PostgreSQL only; elsewhere Journey stays a plain table. Existing rows
+    are copied into the new table inside this migration's transaction,
+    which holds the table locked for the duration: on a large table, run
+    it in a maintenance window.
+
+    Partitioned tables need the partition key in their primary key, so it
+    becomes (id, travel_date); ids still come from a single sequence and
+    stay unique.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Journey = apps.get_model('fare', 'Journey')
+    quote = schema_editor.quote_name
+    table = Journey._meta.db_table
+    old = f'{table}_unpartitioned'
+    sequence = f'{table}_partitioned_id_seq'
+    columns = ', '.join(quote(field.column) for field in Journey._meta.local_concrete_fields)
+
+    # Move the old table and its index names out of the way
+    schema_editor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+    schema_editor.execute(f'ALTER TABLE {quote(old)} RENAME CONSTRAINT {quote(table + "_pkey")} TO {quote(old + "_pkey")}')
+    for index in Journey._meta.indexes:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {quote(index.name)}')
+
+    schema_editor.execute(
+        f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS) PARTITION BY RANGE (travel_date)'
+    )
+    schema_editor.execute(f'CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id')
+    schema_editor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+    schema_editor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY (id, travel_date)')
+    for index in Journey._meta.indexes:
+        schema_editor.add_index(Journey, index)
+
+    # One partition per month holding data, through the months ahead
+    operator_tz = zoneinfo.ZoneInfo(settings.FARE_OPERATOR_TIME_ZONE)
+    today = timezone.now().astimezone(operator_tz).date()
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT min(travel_date), max(travel_date), max(id) FROM {quote(old)}')
+        first, last, max_id = cursor.fetchone()
+    last = _add_months(max(last or today, today), getattr(settings, 'JOURNEY_PARTITION_MONTHS_AHEAD', 3))
+    for month in _months(first or today, last):
+        schema_editor.execute(
+            f'CREATE TABLE {quote(f"{table}_p{month:%Y_%m}")} PARTITION OF {quote(table)} '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [month, _add_months(month, 1)],
+        )
+    schema_editor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+
+    schema_editor.execute(f'INSERT INTO {quote(table)} ({columns}) SELECT {columns} FROM {quote(old)}')
+    schema_editor.execute(f"SELECT setval('{sequence}', %s, false)", [(max_id or 0) + 1])
+    schema_editor.execute(f'DROP TABLE {quote(old)}')
+
+
+def unpartition_journeys(apps, schema_editor):
+    """Copy the partitions back into a plain fare_journey table."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Journey = apps.get_model('fare', 'Journey')
+    quote = schema_editor.quote_name
+    table = Journey._meta.db_table
+    partitioned = f'{table}_partitioned'
+    columns = ', '.join(quote(field.column) for field in Journey._meta.local_concrete_fields)
+
+    schema_editor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(partitioned)}')
+    schema_editor.execute(
+        f'ALTER TABLE {quote(partitioned)} RENAME CONSTRAINT {quote(table + "_pkey")} TO {quote(partitioned + "_pkey")}'
+    )
+    for index in Journey._meta.indexes:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {quote(index.name)}')
+
+    schema_editor.create_model(Journey)
+    schema_editor.execute(f'INSERT INTO {quote(table)} ({columns}) SELECT {columns} FROM {quote(partitioned)}')
+    schema_editor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(max(id), 0) + 1, false) FROM {quote(table)}"
+    )
+    schema_editor.execute(f'DROP TABLE {quote(partitioned)} CASCADE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fare', '0006_backfill_journey_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_journeys, unpartition_journeys),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fare', '0007_partition_journey'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='journey',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='When the journey was made'),
+        ),
+    ]
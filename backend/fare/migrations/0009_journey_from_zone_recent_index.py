@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fare', '0008_journey_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['from_zone', '-timestamp', 'id'], name='journey_from_zone_recent_idx'),
+        ),
+    ]
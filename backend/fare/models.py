@@ -1,7 +1,36 @@
+import datetime
+import zoneinfo
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+def operator_timezone() -> zoneinfo.ZoneInfo:
+    """The time zone the operator's travel day is defined in."""
+    return zoneinfo.ZoneInfo(settings.FARE_OPERATOR_TIME_ZONE)
+
+
+def travel_date_of(timestamp: datetime.datetime) -> datetime.date:
+    """The operator's travel day for an aware timestamp."""
+    return timestamp.astimezone(operator_timezone()).date()
+
+
+class TravelDateField(models.DateField):
+    """
+    Date column derived from the model's `timestamp` whenever it is saved,
+    including through bulk_create.
+    """
+
+    def pre_save(self, model_instance, add):
+        if model_instance.timestamp is not None:
+            value = travel_date_of(model_instance.timestamp)
+            setattr(model_instance, self.attname, value)
+            return value
+        return super().pre_save(model_instance, add)
+
+
 class Journey(models.Model):
     """
     Model to store journey history and calculated fares.
@@ -29,18 +58,195 @@ class Journey(models.Model):
         help_text="Calculated fare amount (stored as integer)"
     )
     
+    # A default rather than auto_now_add, so bulk ingestion can record
+    # the time the gate reported
     timestamp = models.DateTimeField(
-        auto_now_add=True,
-        help_text="When the journey was calculated"
+        default=timezone.now,
+        editable=False,
+        help_text="When the journey was made"
+    )
+
+    # Denormalised from timestamp so daily lookups hit a plain date index
+    # instead of casting every timestamp
+    travel_date = TravelDateField(
+        help_text="Travel day in the operator's time zone (FARE_OPERATOR_TIME_ZONE)"
     )
     class Meta:
         ordering = ['-timestamp']  # Most recent first
         verbose_name = "Journey"
         verbose_name_plural = "Journeys"
+        # Each index ends in the keyset ordering used by api.filters, so
+        # filtered history pages are index range scans with no sort. Each
+        # descending ordering is the exact reverse of its ascending one and
+        # is read with a backward scan of the same index.
         indexes = [
-            models.Index(fields=['-timestamp']),
-            models.Index(fields=['from_zone', 'to_zone']),
+            # Global history, newest first (and oldest first, backwards)
+            models.Index(fields=['-timestamp', 'id']),
+            # Fare comparisons (fare=>30) and ordering=fare / -fare
+            models.Index(fields=['fare', '-timestamp', 'id']),
+            # Zone filters, and ordering=from_zone / to_zone (and reversed)
+            models.Index(fields=['from_zone', 'to_zone', '-timestamp', 'id']),
+            models.Index(fields=['from_zone', '-timestamp', 'id'], name='journey_from_zone_recent_idx'),
+            models.Index(fields=['to_zone', '-timestamp', 'id']),
+            # Quota seeding and daily counts; fare and zones are included so
+            # daily totals can be answered from the index alone (Postgres)
+            models.Index(
+                fields=['user_id', 'travel_date'],
+                include=['fare', 'from_zone', 'to_zone'],
+                name='journey_user_day_idx',
+            ),
+            # Per-user history, newest first
+            models.Index(fields=['user_id', '-timestamp', 'id'], name='journey_user_recent_idx'),
         ]
+
+    def save(self, *args, **kwargs):
+        # Keep travel_date in step when only the timestamp is being updated
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'timestamp' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'travel_date'}
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Journey {self.id}: Zone {self.from_zone} → Zone {self.to_zone} (£{self.fare/100:.2f}) at {self.timestamp}"
+
+
+class FareRule(models.Model):
+    """
+    Fare between two zones. Rules are bidirectional, so each pair is
+    stored once with the zones in sorted order; from_zone == to_zone
+    is the same-zone fare.
+    """
+
+    from_zone = models.CharField(
+        max_length=10,
+        help_text="Zone at one end of the journey"
+    )
+
+    to_zone = models.CharField(
+        max_length=10,
+        help_text="Zone at the other end of the journey"
+    )
+
+    fare = models.IntegerField(
+        validators=[MinValueValidator(0)],
+        help_text="Fare amount (stored as integer)"
+    )
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['from_zone', 'to_zone']
+        verbose_name = "Fare rule"
+        verbose_name_plural = "Fare rules"
+        constraints = [
+            models.UniqueConstraint(fields=['from_zone', 'to_zone'], name='unique_fare_rule_zones'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Normalise the pair the same way SimpleFareCalculator.DIFFERENT_ZONE_FARES does
+        self.from_zone, self.to_zone = sorted([str(self.from_zone), str(self.to_zone)])
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Zone {self.from_zone} ↔ Zone {self.to_zone}: {self.fare}"
+
+
+class FareRuleSetVersion(models.Model):
+    """
+    Single-row table holding the rule-set version.
+    Bumped whenever a FareRule or Zone changes; see fare.rules.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Fare rule set version"
+
+    def __str__(self):
+        return f"Fare rules v{self.version}"
+
+
+class DailyJourneyCount(models.Model):
+    """
+    Journeys recorded per user per day.
+    Reserved with a conditional UPDATE before journeys are written,
+    so the daily limit holds under concurrent requests; see fare.quota.
+    """
+
+    user_id = models.CharField(
+        max_length=10,
+        help_text="user id"
+    )
+
+    day = models.DateField(
+        help_text="Travel day the journeys count against"
+    )
+
+    count = models.PositiveIntegerField(
+        default=0,
+        help_text="Journeys reserved for this user on this day"
+    )
+
+    class Meta:
+        verbose_name = "Daily journey count"
+        verbose_name_plural = "Daily journey counts"
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'day'], name='unique_daily_journey_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} on {self.day}: {self.count} journeys"
+
+
+class JourneyDailyRollup(models.Model):
+    """
+    Journey count and fare total per user, travel day and zone pair.
+    Upserted in the same transaction as the journeys it counts; see
+    fare.rollups. Rebuild from Journey with the rebuild_journey_rollups
+    command after editing journeys by other means.
+    """
+
+    user_id = models.CharField(
+        max_length=10,
+        help_text="user id"
+    )
+
+    day = models.DateField(
+        help_text="Travel day (Journey.travel_date)"
+    )
+
+    from_zone = models.CharField(
+        max_length=10,
+        help_text="Starting zone number"
+    )
+
+    to_zone = models.CharField(
+        max_length=10,
+        help_text="Destination zone number"
+    )
+
+    journey_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Journeys made"
+    )
+
+    total_fare = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Sum of their fares"
+    )
+
+    class Meta:
+        verbose_name = "Journey daily rollup"
+        verbose_name_plural = "Journey daily rollups"
+        constraints = [
+            # Also the index behind per-user date range reads
+            models.UniqueConstraint(
+                fields=['user_id', 'day', 'from_zone', 'to_zone'],
+                name='unique_journey_daily_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} on {self.day}, {self.from_zone}→{self.to_zone}: {self.journey_count} journeys, {self.total_fare}"
@@ -0,0 +1,238 @@
+"""
+Monthly partitions of the Journey table (PostgreSQL).
+
+Migration 0007 turns fare_journey into a table partitioned by RANGE on
+travel_date, one partition per calendar month (fare_journey_pYYYY_MM),
+plus a default partition that catches rows for months nobody created.
+Queries that filter on travel_date (date_from/date_to, daily quotas,
+rollup rebuilds) only touch the months they ask for.
+
+The manage_journey_partitions command, run daily (the journey-partitions
+service in docker-compose.yml):
+  * creates partitions JOURNEY_PARTITION_MONTHS_AHEAD months ahead, and
+    for any month with rows in the default partition, moving those rows;
+  * detaches partitions older than JOURNEY_RETENTION_MONTHS and archives
+    them, instead of deleting rows one by one. Expired rows found in the
+    default partition get a partition first, so they are archived too.
+
+Code that inserts journeys calls ensure_partitions_for() first, so rows
+still get a partition of their own if the command has not run.
+
+Everything here is a no-op on other databases, where Journey stays a
+plain table.
+"""
+import datetime
+import gzip
+import os
+import re
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import Journey, travel_date_of
+
+DEFAULT_PARTITION_SUFFIX = 'default'
+PARTITION_NAME = re.compile(r'_p(\d{4})_(\d{2})$')
+
+# Months this process has already made sure have a partition
+_known_months = set()
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f'{Journey._meta.db_table}_p{month:%Y_%m}'
+
+
+def default_partition_name() -> str:
+    return f'{Journey._meta.db_table}_{DEFAULT_PARTITION_SUFFIX}'
+
+
+def is_partitioned() -> bool:
+    """Whether the Journey table is a partitioned table on this database."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())",
+            [Journey._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions() -> List[datetime.date]:
+    """Months that have a partition, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND p.relnamespace = to_regnamespace(current_schema())",
+            [Journey._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = PARTITION_NAME.search(name)
+        if match:
+            months.append(datetime.date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(month: datetime.date) -> bool:
+    """
+    Create the partition for `month`; returns False if it already exists.
+
+    Rows for that month already sitting in the default partition are moved
+    into the new partition in the same transaction, since Postgres refuses
+    to attach a range the default partition has rows for.
+    """
+    quote = connection.ops.quote_name
+    table, default = quote(Journey._meta.db_table), quote(default_partition_name())
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {default} WHERE travel_date >= %s AND travel_date < %s)',
+            [start, end],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f'CREATE TABLE {quote(name)} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+            return True
+
+        cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {default} WHERE travel_date >= %s AND travel_date < %s RETURNING *) '
+            f'INSERT INTO {quote(name)} SELECT * FROM moved',
+            [start, end],
+        )
+        cursor.execute(
+            f'ALTER TABLE {table} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+    return True
+
+
+def default_partition_months(before: Optional[datetime.date] = None) -> List[datetime.date]:
+    """Months with rows in the default partition (before `before`, if given), oldest first."""
+    default = connection.ops.quote_name(default_partition_name())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', travel_date)::date FROM {default}"
+            + (' WHERE travel_date < %s' if before else '')
+            + ' ORDER BY 1',
+            [before] if before else [],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partitions(today: Optional[datetime.date] = None, ahead: Optional[int] = None) -> List[datetime.date]:
+    """
+    Create missing partitions from this month to `ahead` months on, and
+    for months with rows in the default partition; returns those created.
+    """
+    if not is_partitioned():
+        return []
+    ahead = settings.JOURNEY_PARTITION_MONTHS_AHEAD if ahead is None else ahead
+    this_month = month_start(today or travel_date_of(timezone.now()))
+    months = {add_months(this_month, offset) for offset in range(ahead + 1)}
+    months.update(default_partition_months())
+    return [month for month in sorted(months) if create_partition(month)]
+
+
+def ensure_partitions_for(days: Iterable[datetime.date]) -> None:
+    """
+    Make sure the months of `days` have partitions before rows for them
+    are inserted. Each month is checked once per process.
+    """
+    months = {month_start(day) for day in days} - _known_months
+    if not months:
+        return
+    if is_partitioned():
+        for month in sorted(months):
+            try:
+                with transaction.atomic():
+                    create_partition(month)
+            except DatabaseError:
+                # Another process created it first
+                if month not in partitions():
+                    raise
+    _known_months.update(months)
+
+
+def retention_cutoff(today: datetime.date, retain_months: int) -> datetime.date:
+    """
+    First month still retained. Partitions for earlier months are expired;
+    the current month always counts as one of the retained months.
+    """
+    return add_months(month_start(today), -(retain_months - 1))
+
+
+def expire_partitions(
+    retain_months: int,
+    today: Optional[datetime.date] = None,
+    archive_dir: Optional[str] = None,
+    archive_schema: Optional[str] = None,
+) -> List[datetime.date]:
+    """
+    Detach partitions for months before the retention window.
+
+    Each detached partition is either written to archive_dir as gzipped
+    CSV (with a header row) and dropped, or moved into archive_schema
+    where it stays queryable. A failed archive leaves the partition
+    detached but intact. Returns the months expired.
+
+    Rollups (fare.rollups) and quota counters are kept, so totals for
+    expired months stay available.
+    """
+    if not is_partitioned() or retain_months < 1:
+        return []
+    if not archive_dir and not archive_schema:
+        raise ValueError('expiring partitions needs an archive_dir or an archive_schema')
+
+    quote = connection.ops.quote_name
+    table = quote(Journey._meta.db_table)
+    cutoff = retention_cutoff(today or travel_date_of(timezone.now()), retain_months)
+    expired = []
+
+    # Expired rows that landed in the default partition are moved into
+    # partitions of their own, and expired with the rest
+    for month in default_partition_months(before=cutoff):
+        create_partition(month)
+
+    for month in partitions():
+        if month >= cutoff:
+            break
+        name = quote(partition_name(month))
+        with connection.cursor() as cursor:
+            # DETACH alone holds a lock on the parent table; run it as its
+            # own statement so the archiving below does not extend it
+            cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+            if archive_dir:
+                os.makedirs(archive_dir, exist_ok=True)
+                path = os.path.join(archive_dir, f'{partition_name(month)}.csv.gz')
+                with gzip.open(path, 'wt', newline='') as archive:
+                    cursor.copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+                cursor.execute(f'DROP TABLE {name}')
+            else:
+                cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {quote(archive_schema)}')
+                cursor.execute(f'ALTER TABLE {name} SET SCHEMA {quote(archive_schema)}')
+        expired.append(month)
+    return expired
@@ -0,0 +1,166 @@
+"""
+Daily journey quota.
+
+Each (user, day) has a DailyJourneyCount row. Journeys are reserved with
+a single conditional UPDATE (count = count + n WHERE count + n <= limit),
+which the database serialises per row, so two concurrent requests can
+never both squeeze past the limit. Reads are a unique-key lookup instead
+of counting the user's journeys.
+"""
+from typing import Dict, Optional, Tuple
+import datetime
+
+from django.db import connection
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import DailyJourneyCount, Journey, travel_date_of
+
+MAX_JOURNEYS_PER_DAY = 20
+
+
+class QuotaExceeded(Exception):
+    """Raised when a reservation would take a user past the daily limit."""
+
+    def __init__(self, used: int, limit: int):
+        self.used = used
+        self.limit = limit
+        super().__init__(f"Maximum {limit} journeys per day exceeded ({used} used)")
+
+
+def travel_day() -> datetime.date:
+    """The day journeys made now count against, in the operator's time zone."""
+    return travel_date_of(timezone.now())
+
+
+def reserve_journeys(
+    user_id: str,
+    count: int,
+    day: Optional[datetime.date] = None,
+    limit: int = MAX_JOURNEYS_PER_DAY,
+) -> None:
+    """
+    Reserve `count` journeys for the user, or raise QuotaExceeded.
+
+    Call this inside the transaction that writes the journeys: if the
+    transaction rolls back, the reservation is released with it.
+    """
+    day = day or travel_day()
+    counter = DailyJourneyCount.objects.filter(user_id=user_id, day=day)
+
+    if counter.filter(count__lte=limit - count).update(count=F('count') + count):
+        return
+
+    # Either this is the user's first reservation today or the limit is
+    # reached. Create the row if needed and try once more.
+    DailyJourneyCount.objects.get_or_create(
+        user_id=user_id,
+        day=day,
+        defaults={'count': _recorded_journeys(user_id, day)},
+    )
+    if counter.filter(count__lte=limit - count).update(count=F('count') + count):
+        return
+
+    raise QuotaExceeded(used=counter.values_list('count', flat=True).first() or 0, limit=limit)
+
+
+def reserve_available(
+    requested: Dict[Tuple[str, datetime.date], int],
+    limit: int = MAX_JOURNEYS_PER_DAY,
+) -> Dict[Tuple[str, datetime.date], int]:
+    """
+    Reserve journeys for many (user_id, day) pairs at once, granting each
+    as many as its remaining quota allows.
+
+    Missing counters are seeded in bulk and all counters involved then
+    locked, both in (user_id, day) order, the same order for every
+    caller whatever the order of `requested`, and written back with
+    batched upserts. As with reserve_journeys(), call
+    this inside the transaction that writes the journeys.
+
+    Returns:
+        {(user_id, day): journeys granted}, possibly 0
+    """
+    if not requested:
+        return {}
+    users = {user_id for user_id, _ in requested}
+    days = {day for _, day in requested}
+    counters = DailyJourneyCount.objects.filter(user_id__in=users, day__in=days)
+
+    existing = set(counters.values_list('user_id', 'day'))
+    # Sorted: inserting takes unique index locks in row order
+    missing = sorted(key for key in requested if key not in existing)
+    if missing:
+        recorded = {
+            (row['user_id'], row['travel_date']): row['journeys']
+            for row in Journey.objects.filter(
+                user_id__in={user_id for user_id, _ in missing},
+                travel_date__in={day for _, day in missing},
+            ).order_by().values('user_id', 'travel_date').annotate(journeys=Count('id'))
+        }
+        # A concurrent caller may create the same counters first
+        DailyJourneyCount.objects.bulk_create(
+            [DailyJourneyCount(user_id=user_id, day=day, count=recorded.get((user_id, day), 0)) for user_id, day in missing],
+            ignore_conflicts=True,
+        )
+
+    locked = {
+        (user_id, day): count
+        for user_id, day, count in counters.select_for_update()
+        .order_by('user_id', 'day').values_list('user_id', 'day', 'count')
+    }
+    granted, changed = {}, []
+    for key, count in requested.items():
+        granted[key] = max(0, min(count, limit - locked[key]))
+        if granted[key]:
+            changed.append((*key, locked[key] + granted[key]))
+    _write_counts(changed)
+    return granted
+
+
+def journeys_on(user_id: str, day: Optional[datetime.date] = None) -> int:
+    """Number of journeys the user has recorded on `day` (default today)."""
+    day = day or travel_day()
+    used = DailyJourneyCount.objects.filter(user_id=user_id, day=day).values_list('count', flat=True).first()
+    if used is None:
+        # No reservation yet today; journeys may still exist from before
+        # the counter was introduced
+        return _recorded_journeys(user_id, day)
+    return used
+
+
+async def ajourneys_on(user_id: str, day: Optional[datetime.date] = None) -> int:
+    """Async version of journeys_on(), using the async ORM."""
+    day = day or travel_day()
+    used = await DailyJourneyCount.objects.filter(user_id=user_id, day=day).values_list('count', flat=True).afirst()
+    if used is None:
+        return await Journey.objects.filter(user_id=user_id, travel_date=day).acount()
+    return used
+
+
+def _write_counts(counts, batch_size=1000) -> None:
+    """
+    Store new (user_id, day, count) values for counters this transaction
+    has locked.
+
+    One INSERT ... ON CONFLICT DO UPDATE per batch; unlike bulk_update()'s
+    CASE expression, its cost stays linear in the number of counters.
+    """
+    ops = connection.ops
+    table = ops.quote_name(DailyJourneyCount._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(counts), batch_size):
+            batch = counts[start:start + batch_size]
+            params = []
+            for user_id, day, count in batch:
+                params += [user_id, ops.adapt_datefield_value(day), count]
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, day, count) VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT (user_id, day) DO UPDATE SET count = EXCLUDED.count',
+                params,
+            )
+
+
+def _recorded_journeys(user_id: str, day: datetime.date) -> int:
+    """Count stored journeys directly. Only used to seed a new counter."""
+    return Journey.objects.filter(user_id=user_id, travel_date=day).count()
@@ -0,0 +1,140 @@
+"""
+Per-user journey totals, maintained incrementally.
+
+JourneyDailyRollup holds one row per (user, travel day, zone pair).
+record_journeys() upserts the rows for newly written journeys inside the
+writing transaction, so totals always agree with Journey. Reads then cost
+one row per day and zone pair instead of one per journey.
+"""
+import datetime
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from .models import DailyJourneyCount, Journey, JourneyDailyRollup
+
+ROLLUP_KEY = ('user_id', 'day', 'from_zone', 'to_zone')
+UPSERT_BATCH_SIZE = 1000
+
+
+def record_journeys(journeys: Iterable[Journey]) -> None:
+    """
+    Add saved journeys to their rollups.
+
+    Call in the transaction that wrote the journeys. Rows are upserted
+    with INSERT ... ON CONFLICT, in key order so concurrent writers
+    lock rows in the same order.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for journey in journeys:
+        counts = totals[(journey.user_id, journey.travel_date, journey.from_zone, journey.to_zone)]
+        counts[0] += 1
+        counts[1] += journey.fare
+    if not totals:
+        return
+
+    ops = connection.ops
+    table = ops.quote_name(JourneyDailyRollup._meta.db_table)
+    rows = sorted(totals.items())
+    with connection.cursor() as cursor:
+        # Large ingests are split so no statement exceeds the database's
+        # bind parameter limit
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            params = []
+            for (user_id, day, from_zone, to_zone), (count, fare) in batch:
+                params += [user_id, ops.adapt_datefield_value(day), from_zone, to_zone, count, fare]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(ROLLUP_KEY)}, journey_count, total_fare) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT ({", ".join(ROLLUP_KEY)}) DO UPDATE SET '
+                f'journey_count = {table}.journey_count + EXCLUDED.journey_count, '
+                f'total_fare = {table}.total_fare + EXCLUDED.total_fare',
+                params,
+            )
+
+
+def daily_totals(user_id: str, **day_filters) -> List[Dict]:
+    """
+    A user's totals per travel day, oldest first, each with a per zone
+    pair breakdown. day_filters are day__gte / day__lte lookups.
+    """
+    return _summarise(_rollup_rows(user_id, day_filters), 'day', lambda day: day.isoformat())
+
+
+def monthly_totals(user_id: str, **day_filters) -> List[Dict]:
+    """As daily_totals(), per calendar month ('YYYY-MM')."""
+    return _summarise(_rollup_rows(user_id, day_filters), 'month', lambda day: day.strftime('%Y-%m'))
+
+
+def rebuild_rollups(user_id: str, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None) -> int:
+    """
+    Recompute one user's rollups from their journeys; returns rows written.
+
+    The user's daily quota counters for the range are locked first.
+    Journey writers take the same lock before inserting, so none of the
+    user's journeys can land halfway through the rebuild.
+    """
+    day_filters = {}
+    if date_from:
+        day_filters['day__gte'] = date_from
+    if date_to:
+        day_filters['day__lte'] = date_to
+    journey_filters = {key.replace('day', 'travel_date', 1): value for key, value in day_filters.items()}
+
+    with transaction.atomic():
+        list(
+            DailyJourneyCount.objects.select_for_update()
+            .filter(user_id=user_id, **day_filters)
+            .values_list('pk', flat=True)
+        )
+        JourneyDailyRollup.objects.filter(user_id=user_id, **day_filters).delete()
+        rows = [
+            JourneyDailyRollup(
+                user_id=user_id,
+                day=row['travel_date'],
+                from_zone=row['from_zone'],
+                to_zone=row['to_zone'],
+                journey_count=row['journey_count'],
+                total_fare=row['total_fare'],
+            )
+            for row in (
+                Journey.objects.filter(user_id=user_id, **journey_filters)
+                .order_by()
+                .values('travel_date', 'from_zone', 'to_zone')
+                .annotate(journey_count=Count('id'), total_fare=Sum('fare'))
+            )
+        ]
+        JourneyDailyRollup.objects.bulk_create(rows, batch_size=5000)
+    return len(rows)
+
+
+def _rollup_rows(user_id, day_filters):
+    return (
+        JourneyDailyRollup.objects.filter(user_id=user_id, **day_filters)
+        .order_by('day', 'from_zone', 'to_zone')
+        .values_list('day', 'from_zone', 'to_zone', 'journey_count', 'total_fare')
+    )
+
+
+def _summarise(rows, label, period_of) -> List[Dict]:
+    periods = {}
+    for day, from_zone, to_zone, count, fare in rows:
+        period = period_of(day)
+        summary = periods.get(period)
+        if summary is None:
+            summary = periods[period] = {label: period, 'journey_count': 0, 'total_fare': 0, 'zone_pairs': {}}
+        summary['journey_count'] += count
+        summary['total_fare'] += fare
+        pair = summary['zone_pairs'].setdefault(
+            (from_zone, to_zone),
+            {'from_zone': from_zone, 'to_zone': to_zone, 'journey_count': 0, 'total_fare': 0},
+        )
+        pair['journey_count'] += count
+        pair['total_fare'] += fare
+
+    for summary in periods.values():
+        summary['zone_pairs'] = sorted(summary['zone_pairs'].values(), key=lambda pair: (pair['from_zone'], pair['to_zone']))
+    return list(periods.values())
@@ -0,0 +1,193 @@
+"""
+Versioned, in-memory snapshots of the fare rules.
+
+Fare rules (fare.models.FareRule) and zones (zones.models.Zone) live in
+the database. Each worker compiles them once into an immutable
+FareRuleSnapshot and reuses it across requests. Saving a rule or a zone
+bumps FareRuleSetVersion; workers notice through a version number kept
+in the shared cache, so the hot path is a cache read, not a query. The
+rows a snapshot is compiled from are shared through the cache too,
+stamped with their version, so only the first worker to see a new
+version queries them.
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+
+from .cache import CacheNamespace
+from .fare_calculator import FareMatrix, SimpleFareCalculator
+from .models import FareRule, FareRuleSetVersion
+
+# How long a worker trusts the cached version. Only matters when the cache
+# is per-process; with a shared cache, bumps are seen immediately.
+VERSION_CACHE_TIMEOUT = getattr(settings, 'FARE_RULE_VERSION_TIMEOUT', 60)
+
+RULES_CACHE = CacheNamespace('fare')
+VERSION_KEY = 'rule_set_version'
+
+
+@dataclass(frozen=True)
+class FareRuleSnapshot:
+    """
+    Everything the fare and zone endpoints need, compiled for one version.
+    """
+    version: int
+    matrix: FareMatrix
+    # Active zones in ZoneSerializer layout, ordered by zone_number
+    zones: Tuple[Dict, ...]
+    # Fare rules in SimpleFareCalculator.get_all_fare_rules layout
+    rules: Tuple[Dict, ...]
+    # Values derived from this snapshot, e.g. pre-rendered response bodies
+    _derived: Dict[str, Any] = field(default_factory=dict, compare=False, repr=False)
+
+    def derived(self, name: str, build: Callable[['FareRuleSnapshot'], Any]) -> Any:
+        """
+        Return build(self), computed once per snapshot and name.
+
+        Derived values are dropped with the snapshot when the rules change.
+        """
+        try:
+            return self._derived[name]
+        except KeyError:
+            value = self._derived[name] = build(self)
+            return value
+
+
+_snapshot: Optional[FareRuleSnapshot] = None
+_lock = threading.Lock()
+
+
+def get_rule_snapshot() -> FareRuleSnapshot:
+    """
+    Return the current snapshot, rebuilding it only when the version changed.
+    """
+    snapshot = _snapshot
+    version = RULES_CACHE.get(VERSION_KEY)
+    if snapshot is not None and version == snapshot.version:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if version is None:
+            # Cache miss: fall back to the database once and re-publish.
+            # add(), not set(): a bump that committed after our read has
+            # published a newer version, which must not be overwritten
+            version = current_rule_version()
+            RULES_CACHE.add(VERSION_KEY, version, VERSION_CACHE_TIMEOUT)
+        if snapshot is None or snapshot.version != version:
+            snapshot = compile_rule_snapshot(version)
+            _set_snapshot(snapshot)
+    return snapshot
+
+
+def current_rule_version() -> int:
+    """Read the rule-set version from the primary database."""
+    version = FareRuleSetVersion.objects.using(DEFAULT_DB_ALIAS).values_list('version', flat=True).first()
+    return version or 0
+
+
+def compile_rule_snapshot(version: int) -> FareRuleSnapshot:
+    """
+    Compile zones and fare rules into a snapshot labelled with `version`.
+
+    The version must be read before the rules: a snapshot may then be newer
+    than its label (and get rebuilt once more), but never older.
+    """
+    rows = RULES_CACHE.get_many(['zones', 'fares'], version=version)
+    if len(rows) < 2:
+        rows = _load_rule_rows()
+        # Only share rows once they are committed: inside a transaction
+        # that later rolls back they may belong to a version number that
+        # gets reused
+        transaction.on_commit(lambda: RULES_CACHE.set_many(rows, version=version))
+    zones, fares = rows['zones'], _configured_fares(rows['fares'])
+
+    if zones:
+        # Only active zones are priced once any zone exists, so fare rules
+        # for deactivated, deleted or never created zones do not apply
+        active = {zone['zone_number'] for zone in zones if zone['is_active']}
+        fares = {
+            pair: fare for pair, fare in fares.items()
+            if pair[0] in active and pair[1] in active
+        }
+    matrix = FareMatrix({zone for pair in fares for zone in pair}, fares)
+
+    return FareRuleSnapshot(
+        version=version,
+        matrix=matrix,
+        zones=tuple(zone for zone in zones if zone['is_active']),
+        rules=tuple(matrix.rules()),
+    )
+
+
+def rule_zones() -> List[str]:
+    """
+    Zones the fare rules (or the built-in defaults) price, whether or not
+    they have a Zone row, sorted.
+    """
+    fares = _configured_fares(dict(
+        ((rule['from_zone'], rule['to_zone']), rule['fare'])
+        for rule in FareRule.objects.using(DEFAULT_DB_ALIAS).values('from_zone', 'to_zone', 'fare')
+    ))
+    return sorted({zone for pair in fares for zone in pair}, key=lambda zone: (len(zone), zone))
+
+
+def _configured_fares(fares: Dict) -> Dict:
+    if not fares:
+        # Nothing configured yet: use the built-in defaults
+        fares = {(zone, zone): fare for zone, fare in SimpleFareCalculator.SAME_ZONE_FARES.items()}
+        fares.update(SimpleFareCalculator.DIFFERENT_ZONE_FARES)
+    return dict(fares)
+
+
+def _load_rule_rows() -> Dict:
+    # Always from the primary, like the version: rows read from a lagging
+    # replica would be compiled and shared under the new version, and
+    # every worker would price with them until the next change
+    from zones.models import Zone
+
+    return {
+        'zones': list(
+            Zone.objects.using(DEFAULT_DB_ALIAS).order_by('zone_number')
+            .values('zone_number', 'name', 'description', 'is_active')
+        ),
+        'fares': {
+            (rule['from_zone'], rule['to_zone']): rule['fare']
+            for rule in FareRule.objects.using(DEFAULT_DB_ALIAS).values('from_zone', 'to_zone', 'fare')
+        },
+    }
+
+
+def bump_rule_version() -> None:
+    """
+    Advance the rule-set version after a FareRule or Zone change.
+
+    The new version is published to the cache only once the transaction
+    commits, this worker included, so no worker compiles uncommitted rules
+    or re-caches the old version after the new one is published.
+    """
+    with transaction.atomic():
+        updated = FareRuleSetVersion.objects.filter(pk=1).update(version=F('version') + 1)
+        if not updated:
+            _, created = FareRuleSetVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+            if not created:
+                # Lost the race to create the row; bump the winner's version
+                FareRuleSetVersion.objects.filter(pk=1).update(version=F('version') + 1)
+        version = current_rule_version()
+
+    invalidate_rule_snapshot()
+    transaction.on_commit(lambda: RULES_CACHE.set(VERSION_KEY, version, VERSION_CACHE_TIMEOUT))
+
+
+def invalidate_rule_snapshot() -> None:
+    """Drop this worker's snapshot; the next request recompiles it."""
+    _set_snapshot(None)
+
+
+def _set_snapshot(snapshot: Optional[FareRuleSnapshot]) -> None:
+    global _snapshot
+    _snapshot = snapshot
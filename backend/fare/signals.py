@@ -0,0 +1,19 @@
+"""
+Keep fare rule snapshots in step with the database.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from zones.models import Zone
+
+from .models import FareRule
+from .rules import bump_rule_version
+
+
+@receiver(post_save, sender=FareRule)
+@receiver(post_delete, sender=FareRule)
+@receiver(post_save, sender=Zone)
+@receiver(post_delete, sender=Zone)
+def fare_rules_changed(sender, **kwargs):
+    """A rule or zone changed - publish a new rule-set version."""
+    bump_rule_version()
@@ -0,0 +1,773 @@
+import datetime
+import io
+import os
+import signal
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from fare import FareMatrix, SimpleFareCalculator
+from fare.loading import load_journeys
+from fare.models import DailyJourneyCount, FareRule, Journey, JourneyDailyRollup, travel_date_of
+from fare.partitions import (
+    add_months, create_partition, default_partition_months, ensure_partitions, ensure_partitions_for, expire_partitions,
+    is_partitioned, month_start, partition_name, partitions, retention_cutoff,
+)
+from fare.quota import MAX_JOURNEYS_PER_DAY, QuotaExceeded, journeys_on, reserve_available, reserve_journeys, travel_day
+from fare.cache import CacheNamespace, reset_stats, stats
+from fare.rollups import record_journeys
+from fare.rules import RULES_CACHE, VERSION_KEY, get_rule_snapshot, invalidate_rule_snapshot, rule_zones
+from fare.write_behind import JourneyWriter
+from zones.models import Zone
+
+
+class TestFareMatrix:
+    '''Tests for the compiled fare matrix.'''
+
+    def test_matches_rule_tables(self):
+        '''Every rule in the tables is returned in both directions.'''
+        matrix = SimpleFareCalculator.compiled()
+        for zone, fare in SimpleFareCalculator.SAME_ZONE_FARES.items():
+            assert matrix.fare(zone, zone) == fare
+        for (from_zone, to_zone), fare in SimpleFareCalculator.DIFFERENT_ZONE_FARES.items():
+            assert matrix.fare(from_zone, to_zone) == fare
+            assert matrix.fare(to_zone, from_zone) == fare
+
+    def test_compiled_once(self):
+        '''The matrix is built once and reused.'''
+        assert SimpleFareCalculator.compiled() is SimpleFareCalculator.compiled()
+
+    @pytest.mark.parametrize('from_zone,to_zone', [('1', '5'), ('0', '1'), (1, 2), (None, '1')])
+    def test_invalid_zone(self, from_zone, to_zone):
+        '''Unknown zones raise ValueError.'''
+        with pytest.raises(ValueError):
+            SimpleFareCalculator.calculate_single_fare(from_zone, to_zone)
+
+    def test_missing_pair(self):
+        '''Known zones without a rule between them raise ValueError.'''
+        matrix = FareMatrix.from_tables({'1': 40, '2': 35, '3': 30}, {('1', '2'): 55})
+        with pytest.raises(ValueError, match='No fare rule'):
+            matrix.fare('1', '3')
+
+    def test_many_zones(self):
+        '''Zones are ordered numerically and fares stay symmetric.'''
+        zones = [str(n) for n in range(1, 51)]
+        different = {(a, b): int(a) + int(b) for a in zones for b in zones if int(a) < int(b)}
+        matrix = FareMatrix.from_tables({z: 10 for z in zones}, different)
+
+        assert matrix.zones[:3] == ('1', '2', '3')
+        assert matrix.zones[-1] == '50'
+        assert matrix.fare('10', '2') == matrix.fare('2', '10') == 12
+        assert matrix.fare('50', '50') == 10
+        assert len(matrix.pairs()) == 50 * 50
+
+        fares, errors = matrix.price_arrays(np.array(['1', '10', '50', '51']), np.array(['2', '1', '5', '1']))
+        assert fares.tolist() == [3, 11, 55, 0]
+        assert errors.tolist() == [False, False, False, True]
+
+    def test_subclass_tables(self):
+        '''Subclasses with their own tables get their own matrix.'''
+        class FourZoneCalculator(SimpleFareCalculator):
+            VALID_ZONES = {'1', '2', '3', '4'}
+            SAME_ZONE_FARES = {**SimpleFareCalculator.SAME_ZONE_FARES, '4': 25}
+            DIFFERENT_ZONE_FARES = {**SimpleFareCalculator.DIFFERENT_ZONE_FARES, ('3', '4'): 35}
+
+        assert FourZoneCalculator.calculate_single_fare('4', '3') == 35
+        with pytest.raises(ValueError):
+            SimpleFareCalculator.calculate_single_fare('4', '3')
+
+
+class TestBatchPricing:
+    '''Tests for the vectorized batch pricing path.'''
+
+    def test_fare_arrays(self):
+        '''Columns are priced in one call with an error mask.'''
+        fares, errors = SimpleFareCalculator.calculate_fare_arrays(
+            ['1', '2', '3', '1', '9'],
+            ['2', '3', '3', '1', '1'],
+        )
+        assert fares.tolist() == [55, 45, 30, 40, 0]
+        assert errors.tolist() == [False, False, False, False, True]
+
+    def test_fare_arrays_mixed_input(self):
+        '''Missing and non-string zones are flagged, not raised.'''
+        fares, errors = SimpleFareCalculator.calculate_fare_arrays(['1', None, 2], ['3', '1', '2'])
+        assert fares.tolist() == [65, 0, 0]
+        assert errors.tolist() == [False, True, True]
+
+    def test_int_zone_next_to_strings(self):
+        '''An int zone is not priced as its string form, whatever the rest of the batch holds.'''
+        fares, errors = SimpleFareCalculator.calculate_fare_arrays(['1', 2], ['2', '2'])
+        assert fares.tolist() == [55, 0]
+        assert errors.tolist() == [False, True]
+
+        result = SimpleFareCalculator.calculate_batch_fares([
+            {'from_zone': '1', 'to_zone': '2'},
+            {'from_zone': 2, 'to_zone': '2'},
+        ])
+        assert [journey['status'] for journey in result['journeys']] == ['success', 'error']
+        assert result['total_fare'] == 55
+
+    def test_unhashable_zone(self):
+        '''A list or dict as a zone fails only its own journey.'''
+        fares, errors = SimpleFareCalculator.calculate_fare_arrays(['1', ['1'], '2'], ['2', '2', {'zone': '2'}])
+        assert fares.tolist() == [55, 0, 0]
+        assert errors.tolist() == [False, True, True]
+
+        result = SimpleFareCalculator.calculate_batch_fares([
+            {'from_zone': '1', 'to_zone': '2'},
+            {'from_zone': ['1'], 'to_zone': '2'},
+        ])
+        assert [journey['status'] for journey in result['journeys']] == ['success', 'error']
+        assert result['journeys'][1]['error_message'].startswith('Invalid from_zone')
+        assert result['total_fare'] == 55
+
+    def test_fare_arrays_length_mismatch(self):
+        '''Columns must line up.'''
+        with pytest.raises(ValueError):
+            SimpleFareCalculator.calculate_fare_arrays(['1', '2'], ['1'])
+
+    def test_batch_fares_wrapper(self):
+        '''The dict-in/dict-out API keeps its shape and error messages.'''
+        result = SimpleFareCalculator.calculate_batch_fares([
+            {'from_zone': '1', 'to_zone': '2'},
+            {'from_zone': '1', 'to_zone': '7'},
+            {'from_zone': '3'},
+        ])
+        assert result['total_fare'] == 55
+        assert result['journey_count'] == 3
+        assert result['journeys'][0] == {
+            'journey_number': 1, 'from_zone': '1', 'to_zone': '2', 'fare': 55, 'status': 'success',
+        }
+        assert result['journeys'][1]['status'] == 'error'
+        assert 'Invalid to_zone: 7' in result['journeys'][1]['error_message']
+        assert result['journeys'][2]['error_message'] == 'Missing from_zone or to_zone'
+
+    def test_batch_fares_limit(self):
+        '''The dict API still caps a batch at 20 journeys.'''
+        result = SimpleFareCalculator.calculate_batch_fares([{'from_zone': '1', 'to_zone': '1'}] * 25)
+        assert result['journey_count'] == 20
+        assert result['total_fare'] == 800
+
+
+@pytest.mark.django_db
+class TestFareRuleSnapshot:
+    '''Tests for database-backed fare rules and their snapshots.'''
+
+    def test_defaults_without_rules(self):
+        '''With no FareRule rows the built-in fares apply.'''
+        snapshot = get_rule_snapshot()
+        assert snapshot.matrix.fare('1', '2') == 55
+        assert snapshot.rules == tuple(SimpleFareCalculator.get_all_fare_rules())
+
+    def test_snapshot_reused_without_queries(self, django_assert_num_queries):
+        '''Once compiled, the snapshot is served without touching the database.'''
+        snapshot = get_rule_snapshot()
+        with django_assert_num_queries(0):
+            assert get_rule_snapshot() is snapshot
+
+    def test_rule_change_invalidates_snapshot(self, django_capture_on_commit_callbacks):
+        '''Saving a rule publishes a new version and recompiles.'''
+        before = get_rule_snapshot()
+        with django_capture_on_commit_callbacks(execute=True):
+            FareRule.objects.create(from_zone='2', to_zone='1', fare=60)
+            FareRule.objects.create(from_zone='1', to_zone='1', fare=40)
+
+        after = get_rule_snapshot()
+        assert after.version > before.version
+        assert after.matrix.fare('1', '2') == 60
+        # Only configured rules are priced once any rule exists
+        with pytest.raises(ValueError):
+            after.matrix.fare('3', '3')
+
+    def test_version_published_on_commit(self, django_capture_on_commit_callbacks):
+        '''Until the change commits, every worker keeps the old version.'''
+        before = get_rule_snapshot()
+        with django_capture_on_commit_callbacks() as callbacks:
+            FareRule.objects.create(from_zone='1', to_zone='2', fare=60)
+            assert RULES_CACHE.get(VERSION_KEY) == before.version
+        for callback in callbacks:
+            callback()
+        assert RULES_CACHE.get(VERSION_KEY) > before.version
+
+    def test_bulk_delete_publishes_version(self, django_capture_on_commit_callbacks):
+        '''QuerySet.delete() (the admin's bulk delete) sends post_delete, so it bumps the version.'''
+        FareRule.objects.create(from_zone='1', to_zone='2', fare=60)
+        Zone.objects.create(zone_number='1', name='Central')
+        before = get_rule_snapshot()
+        with django_capture_on_commit_callbacks(execute=True):
+            FareRule.objects.all().delete()
+        assert get_rule_snapshot().version > before.version
+
+        before = get_rule_snapshot()
+        with django_capture_on_commit_callbacks(execute=True):
+            Zone.objects.all().delete()
+        assert get_rule_snapshot().version > before.version
+
+    def test_cache_fill_keeps_newer_version(self, monkeypatch):
+        '''A worker refilling the version never overwrites one published meanwhile.'''
+        from fare import rules
+
+        def read_before_bump():
+            RULES_CACHE.set(VERSION_KEY, 5)  # a bump commits after our read
+            return 4
+
+        RULES_CACHE.delete(VERSION_KEY)
+        monkeypatch.setattr(rules, 'current_rule_version', read_before_bump)
+        get_rule_snapshot()
+        assert RULES_CACHE.get(VERSION_KEY) == 5
+
+    def test_rule_pairs_are_normalised(self):
+        '''Rules are stored once per pair, in sorted zone order.'''
+        rule = FareRule.objects.create(from_zone='3', to_zone='1', fare=65)
+        assert (rule.from_zone, rule.to_zone) == ('1', '3')
+
+    def test_inactive_zone_not_priced(self):
+        '''Deactivating a zone removes it from pricing and listings.'''
+        Zone.objects.create(zone_number='1', name='Central')
+        Zone.objects.create(zone_number='2', name='Inner')
+        Zone.objects.create(zone_number='3', name='Outer', is_active=False)
+
+        snapshot = get_rule_snapshot()
+        assert [zone['zone_number'] for zone in snapshot.zones] == ['1', '2']
+        assert snapshot.matrix.fare('1', '2') == 55
+        with pytest.raises(ValueError):
+            snapshot.matrix.fare('1', '3')
+
+    def test_zone_without_row_not_priced(self):
+        '''Once zones are configured, fare rules for zones without a Zone row do not apply.'''
+        assert get_rule_snapshot().matrix.fare('1', '2') == 55
+
+        Zone.objects.create(zone_number='1', name='Central')
+        snapshot = get_rule_snapshot()
+        assert snapshot.matrix.fare('1', '1') == 40
+        with pytest.raises(ValueError):
+            snapshot.matrix.fare('1', '2')
+        assert rule_zones() == ['1', '2', '3']
+
+    def test_rule_rows_shared_through_cache(self, django_assert_num_queries, django_capture_on_commit_callbacks):
+        '''A worker compiling a version another worker compiled runs no queries.'''
+        FareRule.objects.create(from_zone='1', to_zone='2', fare=70)
+        with django_capture_on_commit_callbacks(execute=True):
+            first = get_rule_snapshot()
+
+        invalidate_rule_snapshot()  # as seen by another worker
+        with django_assert_num_queries(0):
+            second = get_rule_snapshot()
+        assert second.version == first.version
+        assert second.matrix.fare('1', '2') == 70
+
+    def test_uncommitted_rule_rows_not_shared(self):
+        '''Rows read inside an open transaction stay out of the shared cache.'''
+        get_rule_snapshot()
+        assert RULES_CACHE.get_many(['zones', 'fares'], version=get_rule_snapshot().version) == {}
+
+    def test_zone_endpoints_use_snapshot(self):
+        '''Both zone listings reflect zone changes.'''
+        client = APIClient()
+        assert client.get('/api/zones/').json()['count'] == 0
+
+        Zone.objects.create(zone_number='2', name='Inner')
+        assert client.get('/api/zones/').json()['zones'][0]['zone_number'] == '2'
+        assert client.get('/zones/').json()['count'] == 1
+
+
+class TestCacheNamespace:
+    '''Tests for the namespaced shared cache layer.'''
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        reset_stats()
+        self.ns = CacheNamespace('test')
+
+    def test_namespaces_and_versions_are_separate(self):
+        '''The same key in another namespace or version is a different entry.'''
+        self.ns.set('k', 1)
+        self.ns.set('k', 2, version=3)
+        CacheNamespace('other').set('k', 4)
+
+        assert self.ns.get('k') == 1
+        assert self.ns.get('k', version=3) == 2
+        assert self.ns.get('k', version=4) is None
+        assert cache.get('test:v3:k') == 2
+
+    def test_bulk_get_and_set(self):
+        '''get_many returns only the keys that are cached.'''
+        self.ns.set_many({'a': 1, 'b': [2]}, version=1)
+        assert self.ns.get_many(['a', 'b', 'c'], version=1) == {'a': 1, 'b': [2]}
+        assert stats()['test'] == {'hits': 2, 'misses': 1}
+
+    def test_get_or_set(self):
+        '''get_or_set builds once and caches falsy values too.'''
+        calls = []
+        for _ in range(2):
+            assert self.ns.get_or_set('k', lambda: calls.append(1) or 0) == 0
+        assert len(calls) == 1
+        assert stats()['test'] == {'hits': 1, 'misses': 1}
+
+    def test_generations(self):
+        '''Bumping a scope's generation orphans entries stamped with it.'''
+        generation = self.ns.generation('user1')
+        assert self.ns.generation('user1') == generation
+        self.ns.set('page', 'old', version=generation)
+
+        self.ns.bump_generation('user1')
+        assert self.ns.generation('user1') != generation
+        assert self.ns.get('page', version=self.ns.generation('user1')) is None
+        assert self.ns.generation('user2') != self.ns.generation('user1')
+
+    def test_generation_age(self):
+        '''Generations started by a bump are dated; others are not.'''
+        assert self.ns.generation_age(self.ns.generation('user1')) == float('inf')
+
+        self.ns.bump_generations(['user1', 'user2'])
+        assert 0 <= self.ns.generation_age(self.ns.generation('user1')) < 5
+        self.ns.bump_generation('user2')
+        assert 0 <= self.ns.generation_age(self.ns.generation('user2')) < 5
+
+
+@pytest.mark.django_db
+class TestDailyQuota:
+    '''Tests for the atomic daily journey counter.'''
+
+    def test_reserve_up_to_limit(self):
+        '''Reservations succeed until the limit and then fail.'''
+        reserve_journeys('u1', 15)
+        reserve_journeys('u1', 5)
+        with pytest.raises(QuotaExceeded) as exc_info:
+            reserve_journeys('u1', 1)
+
+        assert exc_info.value.used == MAX_JOURNEYS_PER_DAY
+        assert journeys_on('u1') == MAX_JOURNEYS_PER_DAY
+
+    def test_rejected_reservation_changes_nothing(self):
+        '''A batch that does not fit is rejected whole.'''
+        reserve_journeys('u1', 15)
+        with pytest.raises(QuotaExceeded):
+            reserve_journeys('u1', 6)
+        assert journeys_on('u1') == 15
+
+    def test_rollback_releases_reservation(self):
+        '''Reservations roll back with the surrounding transaction.'''
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                reserve_journeys('u1', 10)
+                raise RuntimeError('insert failed')
+        assert journeys_on('u1') == 0
+
+    def test_counter_seeded_from_existing_journeys(self):
+        '''Journeys stored before the counter existed still count.'''
+        for _ in range(18):
+            Journey.objects.create(user_id='u1', from_zone='1', to_zone='1', fare=40)
+
+        assert journeys_on('u1') == 18
+        with pytest.raises(QuotaExceeded):
+            reserve_journeys('u1', 3)
+        reserve_journeys('u1', 2)
+        assert journeys_on('u1') == 20
+
+    def test_bulk_reservation_seeds_counters_in_key_order(self):
+        '''Counters are created in (user_id, day) order whatever the request order, so concurrent callers cannot deadlock.'''
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        today = travel_day()
+        requested = {('u2', today): 1, ('u1', today): 2, ('u1', today - datetime.timedelta(days=1)): 3}
+        with CaptureQueriesContext(connection) as context:
+            assert reserve_available(requested) == requested
+
+        # The first INSERT seeds the counters (INSERT OR IGNORE on SQLite)
+        table = f'INTO "{DailyJourneyCount._meta.db_table}"'
+        insert = next(
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('INSERT') and table in query['sql']
+        )
+        positions = [insert.index(f"'{user_id}', '{day}'") for user_id, day in sorted(requested)]
+        assert positions == sorted(positions)
+
+    def test_days_are_independent(self):
+        '''Yesterday's journeys do not count against today.'''
+        yesterday = travel_day() - datetime.timedelta(days=1)
+        reserve_journeys('u1', 20, day=yesterday)
+        reserve_journeys('u1', 20)
+        assert journeys_on('u1', day=yesterday) == journeys_on('u1') == 20
+
+
+@pytest.mark.django_db
+class TestJourneyTravelDate:
+    '''Tests for the stored travel_date column.'''
+
+    def test_set_on_create_and_bulk_create(self):
+        '''travel_date follows timestamp on both insert paths.'''
+        single = Journey.objects.create(user_id='u1', from_zone='1', to_zone='1', fare=40)
+        [bulk] = Journey.objects.bulk_create([Journey(user_id='u1', from_zone='1', to_zone='2', fare=55)])
+
+        single.refresh_from_db()
+        assert single.travel_date == travel_date_of(single.timestamp)
+        assert Journey.objects.get(pk=bulk.pk).travel_date == travel_day()
+
+    def test_operator_time_zone(self, settings):
+        '''The travel day is taken in FARE_OPERATOR_TIME_ZONE, not UTC.'''
+        settings.FARE_OPERATOR_TIME_ZONE = 'Asia/Singapore'
+        journey = Journey.objects.create(user_id='u1', from_zone='1', to_zone='1', fare=40)
+        journey.timestamp = datetime.datetime(2025, 3, 1, 23, 30, tzinfo=datetime.timezone.utc)
+        journey.save(update_fields=['timestamp'])
+
+        journey.refresh_from_db()
+        assert journey.travel_date == datetime.date(2025, 3, 2)
+        assert journeys_on('u1', day=datetime.date(2025, 3, 2)) == 1
+
+
+@pytest.mark.django_db
+class TestJourneyRollups:
+    '''Tests for the incrementally maintained journey rollups.'''
+
+    def journeys(self, user_id, *legs):
+        return Journey.objects.bulk_create([
+            Journey(user_id=user_id, from_zone=f, to_zone=t, fare=fare) for f, t, fare in legs
+        ])
+
+    def rollups(self):
+        return set(JourneyDailyRollup.objects.values_list(
+            'user_id', 'day', 'from_zone', 'to_zone', 'journey_count', 'total_fare'
+        ))
+
+    def test_record_accumulates(self):
+        '''Repeated writes add to the existing rows.'''
+        record_journeys(self.journeys('u1', ('1', '2', 55), ('1', '2', 55), ('3', '3', 30)))
+        record_journeys(self.journeys('u1', ('1', '2', 55)))
+        record_journeys([])
+
+        today = travel_day()
+        assert self.rollups() == {('u1', today, '1', '2', 3, 165), ('u1', today, '3', '3', 1, 30)}
+
+    def test_rebuild_matches_incremental(self):
+        '''Rebuilding from journeys gives the same rows, and fixes drift.'''
+        record_journeys(self.journeys('u1', ('1', '2', 55), ('2', '2', 35)))
+        record_journeys(self.journeys('u2', ('1', '1', 40)))
+        expected = self.rollups()
+
+        JourneyDailyRollup.objects.filter(user_id='u1', from_zone='1').update(journey_count=99)
+        JourneyDailyRollup.objects.create(user_id='gone', day=travel_day(), from_zone='1', to_zone='1', journey_count=1, total_fare=40)
+        call_command('rebuild_journey_rollups', stdout=io.StringIO())
+        assert self.rollups() == expected
+
+    def test_rebuild_one_user_and_range(self):
+        '''--user and the date range limit what is rebuilt.'''
+        record_journeys(self.journeys('u1', ('1', '2', 55)))
+        record_journeys(self.journeys('u2', ('1', '2', 55)))
+        JourneyDailyRollup.objects.update(journey_count=7)
+
+        yesterday = (travel_day() - datetime.timedelta(days=1)).isoformat()
+        call_command('rebuild_journey_rollups', '--user', 'u1', '--date-to', yesterday, stdout=io.StringIO())
+        assert set(JourneyDailyRollup.objects.values_list('journey_count', flat=True)) == {7}
+
+        call_command('rebuild_journey_rollups', '--user', 'u1', stdout=io.StringIO())
+        assert dict(JourneyDailyRollup.objects.values_list('user_id', 'journey_count')) == {'u1': 1, 'u2': 7}
+
+
+class TestJourneyPartitions:
+    '''Tests for the monthly partition helpers.'''
+
+    def test_month_arithmetic(self):
+        '''add_months crosses year boundaries both ways.'''
+        assert add_months(datetime.date(2024, 11, 1), 3) == datetime.date(2025, 2, 1)
+        assert add_months(datetime.date(2024, 1, 1), -1) == datetime.date(2023, 12, 1)
+        assert partition_name(datetime.date(2024, 3, 1)) == 'fare_journey_p2024_03'
+
+    def test_retention_cutoff(self):
+        '''The current month counts as one of the retained months.'''
+        assert retention_cutoff(datetime.date(2024, 3, 15), 1) == datetime.date(2024, 3, 1)
+        assert retention_cutoff(datetime.date(2024, 3, 15), 12) == datetime.date(2023, 4, 1)
+
+    @pytest.mark.django_db
+    def test_noop_without_partitioning(self):
+        '''On a plain Journey table nothing is created or expired.'''
+        if is_partitioned():
+            pytest.skip('Journey is partitioned on this database')
+        Journey.objects.create(user_id='u1', from_zone='1', to_zone='1', fare=40)
+        assert ensure_partitions() == []
+        assert expire_partitions(1, archive_schema='journey_archive') == []
+
+        out = io.StringIO()
+        call_command('manage_journey_partitions', '--retain-months', '1', stdout=out)
+        assert 'nothing to do' in out.getvalue()
+        assert Journey.objects.count() == 1
+
+    @pytest.mark.django_db
+    def test_create_and_expire_partitions(self):
+        '''Months are created ahead; expired months leave the table for the archive schema.'''
+        from django.db import connection
+
+        if not is_partitioned():
+            pytest.skip('Journey is not partitioned on this database')
+        today = travel_day()
+        old = add_months(month_start(today), -24)
+        assert create_partition(old)
+        assert not create_partition(old)
+        made_then = datetime.datetime.combine(old + datetime.timedelta(days=14), datetime.time(12), datetime.timezone.utc)
+        Journey.objects.create(user_id='u1', from_zone='1', to_zone='1', fare=40, timestamp=made_then)
+        Journey.objects.create(user_id='u1', from_zone='1', to_zone='1', fare=40)
+
+        ensure_partitions(today, ahead=2)
+        assert add_months(month_start(today), 2) in partitions()
+
+        assert old in expire_partitions(1, today=today, archive_schema='journey_archive_test')
+        assert old not in partitions()
+        assert Journey.objects.count() == 1
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM journey_archive_test.{partition_name(old)}')
+            assert cursor.fetchone()[0] == 1
+
+    def journey_in(self, month):
+        '''A journey made mid-month, stored without making a partition.'''
+        made_then = datetime.datetime.combine(month + datetime.timedelta(days=14), datetime.time(12), datetime.timezone.utc)
+        Journey.objects.create(user_id='u1', from_zone='1', to_zone='1', fare=40, timestamp=made_then)
+
+    @pytest.mark.django_db
+    def test_inserts_create_missing_partition(self, monkeypatch):
+        '''A month nobody created a partition for gets one before its rows are inserted.'''
+        from fare import partitions as partitioning
+
+        if not is_partitioned():
+            pytest.skip('Journey is not partitioned on this database')
+        monkeypatch.setattr(partitioning, '_known_months', set())
+        later = add_months(month_start(travel_day()), 30)
+        assert later not in partitions()
+
+        ensure_partitions_for([later + datetime.timedelta(days=3)])
+        assert later in partitions()
+        monkeypatch.setattr(partitioning, 'create_partition', lambda month: 1 / 0)
+        ensure_partitions_for([later])  # remembered, not checked again
+
+    @pytest.mark.django_db
+    def test_default_partition_rows(self):
+        '''Rows in the default partition are given a partition, and expire with it.'''
+        if not is_partitioned():
+            pytest.skip('Journey is not partitioned on this database')
+        today = travel_day()
+        old, older = add_months(month_start(today), -30), add_months(month_start(today), -31)
+        self.journey_in(older)
+        assert default_partition_months() == [older]
+        assert older in ensure_partitions(today, ahead=0)
+        assert default_partition_months() == []
+
+        self.journey_in(old)
+        assert default_partition_months() == [old]
+        expired = expire_partitions(1, today=today, archive_schema='journey_archive_test')
+        assert {older, old} <= set(expired)
+        assert default_partition_months() == []
+        assert Journey.objects.count() == 0
+
+
+@pytest.mark.django_db
+class TestJourneyWriter:
+    '''Tests for the write-behind journey buffer, flushed in the test thread.'''
+
+    def writer(self, **options):
+        self.flushed = []
+        options = {'max_size': 10, 'batch_size': 2, 'flush_interval': 0.1, **options}
+        return JourneyWriter(on_flush=self.flushed.append, background=False, **options)
+
+    def journeys(self, count, user_id='u1'):
+        return [Journey(user_id=user_id, from_zone='1', to_zone='2', fare=55) for _ in range(count)]
+
+    def test_flush_stores_batches(self):
+        '''Queued journeys are stored in batches, with their rollups.'''
+        writer = self.writer()
+        writer.put(self.journeys(3))
+        assert len(writer) == 3
+        assert Journey.objects.count() == 0
+
+        writer.flush()
+        assert len(writer) == 0
+        assert Journey.objects.count() == 3
+        assert JourneyDailyRollup.objects.get(user_id='u1').journey_count == 3
+        assert self.flushed == [{'u1'}, {'u1'}]
+
+    def test_back_pressure(self):
+        '''A full queue has no room until it is flushed.'''
+        writer = self.writer(max_size=2)
+        writer.put(self.journeys(2))
+        assert not writer.wait_for_room(1, timeout=0.01)
+
+        writer.flush()
+        assert writer.wait_for_room(2, timeout=0.01)
+
+    def test_failed_batch_is_kept(self, monkeypatch):
+        '''A batch that fails to store stays queued, in order.'''
+        from fare import write_behind
+
+        writer = self.writer()
+        writer.put(self.journeys(1, 'u1') + self.journeys(1, 'u2'))
+        store = write_behind._store
+        monkeypatch.setattr(write_behind, '_store', lambda batch: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            writer.flush()
+        assert len(writer) == 2
+
+        monkeypatch.setattr(write_behind, '_store', store)
+        writer.flush()
+        assert list(Journey.objects.order_by('id').values_list('user_id', flat=True)) == ['u1', 'u2']
+
+    def test_close_flushes(self):
+        '''Closing stores what is queued and refuses more.'''
+        writer = self.writer()
+        writer.put(self.journeys(3))
+        writer.close()
+        assert Journey.objects.count() == 3
+        assert not writer.wait_for_room(1, timeout=0)
+        with pytest.raises(RuntimeError):
+            writer.put(self.journeys(1))
+
+
+
+# Queues journeys in a fresh process, then sends it SIGTERM before the
+# writer's thread would store them
+QUEUE_AND_TERMINATE = """
+import os, signal, sys, time
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = sys.argv[1]
+settings.JOURNEY_WRITE_BEHIND = True
+settings.JOURNEY_WRITE_BEHIND_FLUSH_INTERVAL = 60
+import django
+django.setup()
+from fare.models import Journey
+from fare.write_behind import journey_writer
+writer = journey_writer()
+writer.put([Journey(user_id='sigterm', from_zone='1', to_zone='2', fare=55) for _ in range(3)])
+assert len(writer) == 3
+os.kill(os.getpid(), signal.SIGTERM)
+time.sleep(30)
+"""
+
+
+class TestWriteBehindShutdown:
+    '''Tests that queued journeys survive the process being stopped.'''
+
+    def test_sigterm_flushes_queue(self, transactional_db):
+        '''A process told to stop with journeys still queued stores them first.'''
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            pytest.skip('the test database is not shared with other processes')
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')}
+        env.pop('RUN_MAIN', None)
+        result = subprocess.run(
+            [sys.executable, '-c', QUEUE_AND_TERMINATE, connection.settings_dict['NAME']],
+            env=env, capture_output=True, timeout=60,
+        )
+        assert result.returncode == 128 + signal.SIGTERM, result.stderr.decode()
+        assert Journey.objects.filter(user_id='sigterm').count() == 3
+
+    def test_refused_under_autoreloader(self, settings, monkeypatch):
+        '''runserver's autoreloader would kill the queue's process without a signal.'''
+        from django.apps import apps
+        from django.core.exceptions import ImproperlyConfigured
+
+        settings.JOURNEY_WRITE_BEHIND = True
+        monkeypatch.setenv('RUN_MAIN', 'true')
+        with pytest.raises(ImproperlyConfigured):
+            apps.get_app_config('fare').ready()
+
+
+@pytest.mark.django_db
+class TestSeedJourneys:
+    '''Tests for bulk loading and the seed_journeys command.'''
+
+    def test_load_adds_rollups_and_counters(self):
+        '''Loaded journeys count towards existing rollups and quota counters.'''
+        reserve_journeys('u1', 1)
+        Journey.objects.create(user_id='u1', from_zone='1', to_zone='2', fare=55)
+        record_journeys(Journey.objects.all())
+
+        timestamp = timezone.now()
+        day = travel_date_of(timestamp)
+        assert load_journeys(['u1', 'u1', 'u2'], ['1', '1', '2'], ['2', '2', '2'], [55, 55, 30], [timestamp] * 3, [day] * 3) == 3
+
+        assert Journey.objects.count() == 4
+        assert Journey.objects.filter(user_id='u2').get().timestamp == timestamp
+        rollup = JourneyDailyRollup.objects.get(user_id='u1', day=day)
+        assert (rollup.journey_count, rollup.total_fare) == (3, 165)
+        assert journeys_on('u1', day) == 3
+        assert journeys_on('u2', day) == 1
+
+    def test_failed_load_raises_its_own_error(self):
+        '''A chunk that cannot be stored raises its error, and the next chunk still loads.'''
+        from django.db import IntegrityError
+
+        timestamp = timezone.now()
+        day = travel_date_of(timestamp)
+        with pytest.raises(IntegrityError):
+            load_journeys(['u1'], ['1'], ['2'], [None], [timestamp], [day])
+
+        assert load_journeys(['u1'], ['1'], ['2'], [55], [timestamp], [day]) == 1
+        assert load_journeys(['u2'], ['1'], ['2'], [55], [timestamp], [day]) == 1
+        assert Journey.objects.count() == 2
+
+    def test_seed(self):
+        '''Riders stay under the daily limit and their totals agree with their journeys.'''
+        out = io.StringIO()
+        call_command('seed_journeys', '--journeys', '1000', '--riders', '5', '--days', '10', stdout=out)
+        assert 'Seeded 1000 journeys' in out.getvalue()
+
+        assert Journey.objects.count() == 1000
+        assert set(Zone.objects.values_list('zone_number', flat=True)) == {'1', '2', '3'}
+        assert DailyJourneyCount.objects.aggregate(Max('count'))['count__max'] <= MAX_JOURNEYS_PER_DAY
+        assert DailyJourneyCount.objects.aggregate(Sum('count'))['count__sum'] == 1000
+        assert JourneyDailyRollup.objects.aggregate(Sum('total_fare'))['total_fare__sum'] == Journey.objects.aggregate(Sum('fare'))['fare__sum']
+        for journey in Journey.objects.all()[:100]:
+            assert journey.travel_date == travel_date_of(journey.timestamp)
+            assert journey.timestamp <= timezone.now()
+
+    def test_more_than_the_limit_allows(self):
+        '''Asking for more journeys than riders may make is an error.'''
+        with pytest.raises(CommandError, match='at most 40 journeys'):
+            call_command('seed_journeys', '--journeys', '41', '--riders', '2', '--days', '1')
+
+
+class TestFareEngineBenchmarks:
+    '''Tests for the benchmark suite in benchmarks/fare_engine.py (not its timings).'''
+
+    def test_every_case_has_a_baseline(self):
+        '''New cases need a baseline: run the suite with --update.'''
+        from benchmarks.fare_engine import build_cases, load_baselines
+
+        assert set(load_baselines()) == set(build_cases())
+
+    def test_cases_price_correctly(self):
+        '''The synthetic calculators agree with a direct matrix lookup.'''
+        from benchmarks.fare_engine import calculator_for
+
+        calculator = calculator_for(50)
+        assert calculator.calculate_single_fare('1', '50') == calculator.compiled().fare('50', '1')
+        assert len(calculator.get_all_fare_rules()) == 50 * 50
+
+    def test_compare(self):
+        '''Cases are judged by their rate relative to the calibration loop.'''
+        from benchmarks.fare_engine import compare
+
+        baselines = {'a': {'relative': 2.0}, 'b': {'relative': 2.0}}
+        results = {
+            'a': {'ops_per_sec': 100, 'relative': 1.9},
+            'b': {'ops_per_sec': 100, 'relative': 1.0},
+            'c': {'ops_per_sec': 100, 'relative': 1.0},
+        }
+        rows, regressed = compare(results, baselines, tolerance=0.25)
+        assert regressed == ['b']
+        assert rows[2] == ('c', 100, None)
+
+    def test_run(self):
+        '''Each case gets a rate, a relative rate and allocation figures.'''
+        from benchmarks.fare_engine import run
+
+        results = run({'sum': lambda: sum(range(100))}, repeat=1, min_time=0.001, warmup=0)
+        assert results['sum']['ops_per_sec'] > 0
+        assert results['sum']['relative'] > 0
+        assert results['sum']['peak_bytes'] >= 0
@@ -0,0 +1,235 @@
+"""
+Write-behind storage for priced journeys.
+
+With settings.JOURNEY_WRITE_BEHIND on, a request reserves its journeys
+against the daily quota synchronously, as before, but hands the Journey
+rows to a JourneyWriter instead of inserting them. A background thread
+inserts them in batches of JOURNEY_WRITE_BEHIND_BATCH_SIZE, or whatever
+is waiting every JOURNEY_WRITE_BEHIND_FLUSH_INTERVAL seconds.
+
+  * Quota stays exact: DailyJourneyCount is reserved and committed before
+    a journey is queued, so it already counts journeys still waiting.
+  * The queue is bounded (JOURNEY_WRITE_BEHIND_QUEUE_SIZE journeys).
+    Callers check wait_for_room() before reserving and are turned away
+    if no room appears within JOURNEY_WRITE_BEHIND_PUT_TIMEOUT seconds.
+  * Queued journeys are flushed when the process exits normally
+    (atexit), e.g. on a graceful gunicorn or uvicorn shutdown. SIGTERM
+    would otherwise kill a process nobody else handles it for (manage.py
+    runserver), so exit_on_sigterm() turns it into a normal exit. A crash
+    or SIGKILL loses them, leaving their quota reserved.
+  * runserver's autoreloader cannot drain: the reloader process gets the
+    signal and the worker holding the queue is killed without one, so
+    write-behind refuses to start there (use --noreload).
+"""
+import atexit
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import DailyJourneyCount, Journey, travel_date_of
+from .partitions import ensure_partitions_for
+from .rollups import record_journeys
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts after a failed flush
+RETRY_DELAY = 1.0
+
+
+class JourneyWriter:
+    """
+    Bounded buffer of unsaved journeys, drained by a background thread.
+
+    Args:
+        max_size: journeys that may wait at once
+        batch_size: journeys per INSERT
+        flush_interval: seconds a journey may wait for a full batch
+        on_flush: called with the user ids of each stored batch
+        background: start the flusher thread on first use; without it,
+            journeys are only stored by flush()
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        batch_size: int,
+        flush_interval: float,
+        on_flush: Optional[Callable[[Iterable[str]], None]] = None,
+        background: bool = True,
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.background = background
+        self._pending = deque()
+        self._in_flight = 0
+        self._changed = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        """Journeys queued or being written."""
+        with self._changed:
+            return len(self._pending) + self._in_flight
+
+    def wait_for_room(self, count: int, timeout: float) -> bool:
+        """Wait up to `timeout` seconds until `count` more journeys fit."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while len(self._pending) + count > self.max_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return not self._closed
+
+    def put(self, journeys: List[Journey]) -> None:
+        """
+        Queue journeys whose quota is already reserved and committed.
+
+        Never drops them: if callers raced past wait_for_room(), the
+        queue briefly runs over max_size instead.
+        """
+        if self.background:
+            self._start()
+        with self._changed:
+            if self._closed:
+                raise RuntimeError('JourneyWriter is closed')
+            self._pending.extend(journeys)
+            if len(self._pending) >= self.batch_size:
+                self._changed.notify_all()
+
+    def flush(self) -> None:
+        """Store everything queued so far, in the calling thread."""
+        while self._write_batch():
+            pass
+
+    def close(self) -> None:
+        """Stop accepting journeys, stop the thread and store what is left."""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def _start(self) -> None:
+        with self._changed:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='journey-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                if self._closed:
+                    return
+            try:
+                close_old_connections()
+                self._write_batch()
+            except Exception:
+                logger.exception('Storing queued journeys failed; retrying in %ss', RETRY_DELAY)
+                time.sleep(RETRY_DELAY)
+
+    def _write_batch(self) -> bool:
+        """Store up to one batch; returns False once nothing is queued."""
+        with self._flush_lock:
+            with self._changed:
+                if not self._pending:
+                    return False
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._in_flight = len(batch)
+            try:
+                _store(batch)
+            except Exception:
+                for journey in batch:
+                    journey.pk = None  # the ids went with the rollback
+                with self._changed:
+                    # Put the batch back, in order, for the next attempt
+                    self._pending.extendleft(reversed(batch))
+                    self._in_flight = 0
+                raise
+            with self._changed:
+                self._in_flight = 0
+                self._changed.notify_all()
+
+        if self.on_flush is not None:
+            self.on_flush({journey.user_id for journey in batch})
+        return True
+
+
+def _store(batch: List[Journey]) -> None:
+    with transaction.atomic():
+        # Lock the batch's quota counters in key order; rebuild_rollups()
+        # takes the same locks, so it cannot interleave with this batch
+        keys = sorted({(journey.user_id, travel_date_of(journey.timestamp)) for journey in batch})
+        list(
+            DailyJourneyCount.objects.select_for_update()
+            .filter(user_id__in={user_id for user_id, _ in keys}, day__in={day for _, day in keys})
+            .order_by('user_id', 'day')
+            .values_list('pk', flat=True)
+        )
+        ensure_partitions_for({day for _, day in keys})
+        created = Journey.objects.bulk_create(batch)
+        record_journeys(created)
+
+
+def exit_on_sigterm() -> None:
+    """
+    Make SIGTERM exit the process normally, running atexit handlers,
+    unless something else already handles it. Servers that install their
+    own handlers (gunicorn, uvicorn) shut down gracefully anyway.
+
+    Only possible from the main thread, e.g. in AppConfig.ready().
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit)
+
+
+def _exit(signum, frame) -> None:
+    sys.exit(128 + signum)
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def journey_writer(on_flush: Optional[Callable[[Iterable[str]], None]] = None) -> JourneyWriter:
+    """
+    This process's JourneyWriter, configured from settings. `on_flush`
+    applies when the writer is created.
+
+    A forked worker gets its own writer rather than the parent's.
+    """
+    global _writer, _writer_pid
+    with _writer_lock:
+        if _writer is None or _writer_pid != os.getpid():
+            _writer = JourneyWriter(
+                max_size=settings.JOURNEY_WRITE_BEHIND_QUEUE_SIZE,
+                batch_size=settings.JOURNEY_WRITE_BEHIND_BATCH_SIZE,
+                flush_interval=settings.JOURNEY_WRITE_BEHIND_FLUSH_INTERVAL,
+                on_flush=on_flush,
+            )
+            _writer_pid = os.getpid()
+        return _writer
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from zones.models import Zone
+from fare.rules import bump_rule_version
 
 # Method 1: Simple Registration
 # This gives you a basic admin interface with default settings
@@ -44,11 +45,14 @@ class ZoneAdmin(admin.ModelAdmin):
     def activate_zones(self, request, queryset):
         """Custom action to activate multiple zones at once."""
         updated = queryset.update(is_active=True)
+        # update() skips post_save, so publish the change to fare rules here
+        bump_rule_version()
         self.message_user(request, f'{updated} zones were activated.')
     activate_zones.short_description = 'Activate selected zones'
     
     def deactivate_zones(self, request, queryset):
         """Custom action to deactivate multiple zones at once."""
         updated = queryset.update(is_active=False)
+        bump_rule_version()
         self.message_user(request, f'{updated} zones were deactivated.')
-    deactivate_zones.short_description = 'Deactivate selected zones'
\ No newline at end of file
+    deactivate_zones.short_description = 'Deactivate selected zones'
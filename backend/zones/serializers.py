@@ -12,8 +12,8 @@ class ZoneSerializer(serializers.ModelSerializer):
         fields = ['zone_number', 'name', 'description', 'is_active']
     
     def validate_zone_number(self, value):
-        """Ensure zone_number is positive."""
-        zones = ["Zone 1", "Zone 2", "Zone 3"]
+        """Ensure zone_number is one of the configured zones."""
+        zones = [number for number, _ in Zone.ZONE_CHOICES]
         if value not in zones:
-            raise serializers.ValidationError("Zone number must be inbetween Zone 1 and Zone 2.")
+            raise serializers.ValidationError(f"Zone number must be between Zone {zones[0]} and Zone {zones[-1]}.")
         return value
\ No newline at end of file
@@ -5,7 +5,9 @@ Test Zone model with missing name using Django test database.
 import pytest
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from zones.models import Zone 
+from rest_framework.test import APIClient
+from zones.models import Zone
+from zones.serializers import ZoneSerializer
 
 
 @pytest.mark.django_db
@@ -106,3 +108,57 @@ class TestZoneMissingName:
         zone.delete()
 
 
+
+
+@pytest.mark.django_db
+class TestZoneNumberValidation:
+    """Test which zone numbers ZoneSerializer accepts."""
+
+    @pytest.mark.parametrize("zone_number", ["1", "2", "3"])
+    def test_configured_zone_numbers_accepted(self, zone_number):
+        """The zone numbers in Zone.ZONE_CHOICES are valid."""
+        serializer = ZoneSerializer(data={"zone_number": zone_number, "name": "Central"})
+        assert serializer.is_valid(), serializer.errors
+
+    @pytest.mark.parametrize("zone_number", ["Zone 1", "Zone 3", "4", "0", ""])
+    def test_other_zone_numbers_rejected(self, zone_number):
+        """Labels such as 'Zone 1' and unconfigured numbers are rejected."""
+        serializer = ZoneSerializer(data={"zone_number": zone_number, "name": "Central"})
+        assert not serializer.is_valid()
+        assert "zone_number" in serializer.errors
+
+
+# (scenario, zones seeded, method, body, expected status, max queries) for
+# the zone-list route; see also QUERY_BUDGETS in api/tests.py
+ZONE_QUERY_BUDGETS = [
+    ('list, no zones', 0, 'get', None, 200, 3),
+    ('list, all zones', 3, 'get', None, 200, 3),
+    ('create', 2, 'post', {'zone_number': '3', 'name': 'Zone 3'}, 201, 7),
+    ('create, invalid', 2, 'post', {'zone_number': 'Zone 3', 'name': 'Zone 3'}, 400, 0),
+    ('create, duplicate', 3, 'post', {'zone_number': '3', 'name': 'Zone 3'}, 400, 1),
+]
+
+
+@pytest.mark.django_db
+class TestZoneQueryBudgets:
+    """The zones endpoint stays within its declared number of SQL queries."""
+
+    @pytest.mark.parametrize(
+        "scenario,zones,method,body,expected_status,budget",
+        ZONE_QUERY_BUDGETS,
+        ids=[scenario for scenario, *_ in ZONE_QUERY_BUDGETS],
+    )
+    def test_query_budget(self, query_budget, scenario, zones, method, body, expected_status, budget):
+        """The request answers `expected_status` in at most `budget` queries."""
+        for number in range(1, zones + 1):
+            Zone.objects.create(zone_number=str(number), name=f"Zone {number}")
+        client = APIClient()
+        with query_budget(budget, f"zone-list ({scenario})"):
+            response = getattr(client, method)("/zones/", body, format="json")
+        assert response.status_code == expected_status
+
+    def test_every_url_has_a_budget(self):
+        """New routes in zones/urls.py need a budget here."""
+        from zones.urls import urlpatterns
+
+        assert {pattern.name for pattern in urlpatterns} == {"zone-list"}
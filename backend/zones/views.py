@@ -9,6 +9,7 @@ from rest_framework import viewsets
 from django.shortcuts import render, get_object_or_404
 from zones.models import Zone
 from zones.serializers import ZoneSerializer
+from api.conditional import reference_response, zones_body
 
 def index(request):
     return HttpResponse("Hello, world. You're at the polls index.")
@@ -24,14 +25,7 @@ class ZoneAPIView(APIView):
         Get all active zones for the fare calculator.
         Used by frontend to populate dropdown menus.
         """
-        zones = Zone.objects.filter(is_active=True).order_by('zone_number')
-        serializer = ZoneSerializer(zones, many=True)
-        
-        return Response({
-            'success': True,
-            'zones': serializer.data,
-            'count': zones.count()
-        })
+        return reference_response(request, 'zones', zones_body)
     
     def post(self, request):
         """
@@ -1,6 +1,6 @@
 // pages/JourneyHistoryPage.tsx
 
-import React, { useState, useEffect, useMemo, useCallback } from 'react';
+import React, { useState, useEffect, useMemo, useCallback, useRef } from 'react';
 import { apiService } from '../services/api';
 import '../styles/JourneyHistoryPage.css';
 
@@ -18,18 +18,32 @@ interface FilterConfig {
   value: string;
 }
 
+// Columns the server can order by (see api.filters.ORDERINGS)
+type SortKey = 'timestamp' | 'from_zone' | 'to_zone' | 'fare';
+
 interface SortConfig {
-  key: keyof JourneyRecord | null;
+  key: SortKey | null;
   direction: 'asc' | 'desc';
 }
 
+interface JourneyStatistics {
+  totalFare: number;
+  averageFare: number;
+  journeyCount: number;
+  mostCommonRoute: string;
+}
+
 interface JourneyHistoryPageProps {
   userId: string;
 }
 
 const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
+  // The current page of journeys, as filtered and ordered by the server
   const [journeys, setJourneys] = useState<JourneyRecord[]>([]);
+  const [matchingCount, setMatchingCount] = useState(0);
+  const [statistics, setStatistics] = useState<JourneyStatistics | null>(null);
   const [loading, setLoading] = useState(true);
+  const [fetching, setFetching] = useState(false);
   const [error, setError] = useState<string | null>(null);
   
   // Sorting state
@@ -51,29 +65,89 @@ const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
     toZone: ''
   });
   
-  // Pagination state
-  const [currentPage, setCurrentPage] = useState(1);
+  // Pagination state: cursors[i] fetches page i + 1, nextCursor the page
+  // after the current one (null on the last page)
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const currentPage = cursors.length;
   const itemsPerPage = 10;
-  // Load user journey count
+  const totalPages = Math.max(1, Math.ceil(matchingCount / itemsPerPage));
+  // Only the latest request may update the page
+  const latestRequest = useRef(0);
 
+  // Query parameters for the server; the fare filter needs a whole amount
+  const serverFilters = useMemo(() => {
+    const amount = priceFilter.value.trim();
+    return {
+      fare: priceFilter.operator && /^\d+$/.test(amount) ? `${priceFilter.operator}${amount}` : undefined,
+      from_zone: zoneFilter.fromZone || undefined,
+      to_zone: zoneFilter.toZone || undefined,
+      ordering: sortConfig.key
+        ? `${sortConfig.direction === 'desc' ? '-' : ''}${sortConfig.key}`
+        : undefined
+    };
+  }, [priceFilter, zoneFilter, sortConfig]);
 
-  const loadJourneyHistory = useCallback(async () => {
-    setLoading(true);
+  const loadPage = useCallback(async (pageCursors: (string | null)[]) => {
+    const request = ++latestRequest.current;
+    setFetching(true);
     setError(null);
     
     try {
-      const response = await apiService.getUserJourneyHistory(userId);
-      setJourneys(response.journeys || []);
+      const response = await apiService.getUserJourneyHistory(
+        userId,
+        serverFilters,
+        pageCursors[pageCursors.length - 1],
+        itemsPerPage
+      );
+      if (request !== latestRequest.current) {
+        return;
+      }
+      setJourneys(response.journeys);
+      setNextCursor(response.next_cursor);
+      setCursors(pageCursors);
+      // Only the first page carries the count
+      if (response.count !== undefined) {
+        setMatchingCount(response.count);
+      }
     } catch (err) {
-      setError('Failed to load journey history. Please try again.');
+      if (request === latestRequest.current) {
+        setError('Failed to load journey history. Please try again.');
+      }
       console.error('Error loading journey history:', err);
     } finally {
-      setLoading(false);
+      if (request === latestRequest.current) {
+        setFetching(false);
+        setLoading(false);
+      }
+    }
+  }, [userId, serverFilters]);
+
+  // Statistics cover the whole history, from the monthly totals
+  const loadStatistics = useCallback(async () => {
+    try {
+      const response = await apiService.getUserJourneyTotals(userId);
+      const routes: Record<string, number> = {};
+      response.totals.forEach(month => month.zone_pairs.forEach(pair => {
+        const route = `${pair.from_zone}-${pair.to_zone}`;
+        routes[route] = (routes[route] || 0) + pair.journey_count;
+      }));
+      const mostCommonRoute = Object.entries(routes)
+        .sort(([, a], [, b]) => b - a)[0];
+
+      setStatistics({
+        totalFare: response.total_fare,
+        averageFare: response.journey_count > 0 ? response.total_fare / response.journey_count : 0,
+        journeyCount: response.journey_count,
+        mostCommonRoute: mostCommonRoute ? mostCommonRoute[0] : 'N/A'
+      });
+    } catch (err) {
+      console.error('Error loading journey statistics:', err);
     }
   }, [userId]);
 
   // Sorting function
-  const handleSort = (key: keyof JourneyRecord) => {
+  const handleSort = (key: SortKey) => {
     setSortConfig({
       key,
       direction: 
@@ -83,88 +157,14 @@ const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
     });
   };
 
+  // Back to the first page whenever the filters or ordering change
   useEffect(() => {
-    const loadInitialData = async () => {
-      await loadJourneyHistory();
-    };
-    loadInitialData();
-  }, [loadJourneyHistory]);
-  // Apply filters and sorting
-  const processedJourneys = useMemo(() => {
-    let filtered = [...journeys];
-    
-    // Apply price filter
-    if (priceFilter.operator && priceFilter.value) {
-      const filterValue = parseFloat(priceFilter.value);
-      if (!isNaN(filterValue)) {
-        filtered = filtered.filter(journey => {
-          switch (priceFilter.operator) {
-            case '>':
-              return journey.fare > filterValue;
-            case '<':
-              return journey.fare < filterValue;
-            case '=':
-              return journey.fare === filterValue;
-            default:
-              return true;
-          }
-        });
-      }
-    }
-    
-    // Apply zone filters
-    if (zoneFilter.fromZone) {
-      filtered = filtered.filter(j => j.from_zone === zoneFilter.fromZone);
-    }
-    if (zoneFilter.toZone) {
-      filtered = filtered.filter(j => j.to_zone === zoneFilter.toZone);
-    }
-    
-    // Apply sorting
-    if (sortConfig.key) {
-      filtered.sort((a, b) => {
-        const aVal = a[sortConfig.key!];
-        const bVal = b[sortConfig.key!];
-        
-        if (aVal < bVal) return sortConfig.direction === 'asc' ? -1 : 1;
-        if (aVal > bVal) return sortConfig.direction === 'asc' ? 1 : -1;
-        return 0;
-      });
-    }
-    
-    return filtered;
-  }, [journeys, sortConfig, priceFilter, zoneFilter]);
-
-  // Pagination
-  const paginatedJourneys = useMemo(() => {
-    const startIndex = (currentPage - 1) * itemsPerPage;
-    const endIndex = startIndex + itemsPerPage;
-    return processedJourneys.slice(startIndex, endIndex);
-  }, [processedJourneys, currentPage]);
+    loadPage([null]);
+  }, [loadPage]);
 
-  const totalPages = Math.ceil(processedJourneys.length / itemsPerPage);
-
-  // Calculate statistics
-  const statistics = useMemo(() => {
-    const total = processedJourneys.reduce((sum, j) => sum + j.fare, 0);
-    const average = processedJourneys.length > 0 ? total / processedJourneys.length : 0;
-    
-    const zoneFrequency = processedJourneys.reduce((acc, j) => {
-      const route = `${j.from_zone}-${j.to_zone}`;
-      acc[route] = (acc[route] || 0) + 1;
-      return acc;
-    }, {} as Record<string, number>);
-    
-    const mostCommonRoute = Object.entries(zoneFrequency)
-      .sort(([, a], [, b]) => b - a)[0];
-    
-    return {
-      totalFare: total,
-      averageFare: average,
-      journeyCount: processedJourneys.length,
-      mostCommonRoute: mostCommonRoute ? mostCommonRoute[0] : 'N/A'
-    };
-  }, [processedJourneys]);
+  useEffect(() => {
+    loadStatistics();
+  }, [loadStatistics]);
 
   const formatDate = (timestamp: string) => {
     const date = new Date(timestamp);
@@ -182,24 +182,10 @@ const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
     setZoneFilter({ fromZone: '', toZone: '' });
   };
 
+  // The server streams the whole filtered history
   const exportToCSV = () => {
-    const headers = ['Date', 'From Zone', 'To Zone', 'Fare'];
-    const rows = processedJourneys.map(j => [
-      formatDate(j.timestamp),
-      `Zone ${j.from_zone}`,
-      `Zone ${j.to_zone}`,
-      `$${j.fare.toFixed(2)}`
-    ]);
-    
-    const csvContent = [
-      headers.join(','),
-      ...rows.map(row => row.join(','))
-    ].join('\n');
-    
-    const blob = new Blob([csvContent], { type: 'text/csv' });
-    const url = window.URL.createObjectURL(blob);
     const a = document.createElement('a');
-    a.href = url;
+    a.href = apiService.getUserJourneyExportUrl(userId, serverFilters);
     a.download = `journey-history-${new Date().toISOString().split('T')[0]}.csv`;
     a.click();
   };
@@ -217,7 +203,7 @@ const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
     return (
       <div className="error-container">
         <p className="error-message">{error}</p>
-        <button onClick={loadJourneyHistory} className="btn-retry">
+        <button onClick={() => loadPage(cursors)} className="btn-retry">
           Retry
         </button>
       </div>
@@ -237,28 +223,28 @@ const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
           <div className="stat-icon">📊</div>
           <div className="stat-content">
             <h4>Total Journeys</h4>
-            <p className="stat-value">{statistics.journeyCount}</p>
+            <p className="stat-value">{statistics ? statistics.journeyCount : '-'}</p>
           </div>
         </div>
         <div className="stat-card">
           <div className="stat-icon">💵</div>
           <div className="stat-content">
             <h4>Total Spent</h4>
-            <p className="stat-value">${statistics.totalFare.toFixed(2)}</p>
+            <p className="stat-value">{statistics ? `$${statistics.totalFare.toFixed(2)}` : '-'}</p>
           </div>
         </div>
         <div className="stat-card">
           <div className="stat-icon">📈</div>
           <div className="stat-content">
             <h4>Average Fare</h4>
-            <p className="stat-value">${statistics.averageFare.toFixed(2)}</p>
+            <p className="stat-value">{statistics ? `$${statistics.averageFare.toFixed(2)}` : '-'}</p>
           </div>
         </div>
         <div className="stat-card">
           <div className="stat-icon">🚇</div>
           <div className="stat-content">
             <h4>Most Common Route</h4>
-            <p className="stat-value">{statistics.mostCommonRoute}</p>
+            <p className="stat-value">{statistics ? statistics.mostCommonRoute : '-'}</p>
           </div>
         </div>
       </div>
@@ -342,7 +328,7 @@ const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
       {/* Table Actions */}
       <div className="table-actions">
         <div className="results-count">
-          Showing {paginatedJourneys.length} of {processedJourneys.length} journeys
+          Showing {journeys.length} of {matchingCount} journeys
         </div>
         <button onClick={exportToCSV} className="btn-export">
           📥 Export CSV
@@ -390,14 +376,14 @@ const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
             </tr>
           </thead>
           <tbody>
-            {paginatedJourneys.length === 0 ? (
+            {journeys.length === 0 ? (
               <tr>
                 <td colSpan={5} className="empty-message">
                   No journeys found matching your filters
                 </td>
               </tr>
             ) : (
-              paginatedJourneys.map((journey, index) => (
+              journeys.map((journey, index) => (
                 <tr key={`${journey.id}-${index}`}>
                   <td>{formatDate(journey.timestamp)}</td>
                   <td>
@@ -424,41 +410,25 @@ const JourneyHistoryPage: React.FC<JourneyHistoryPageProps> = ({ userId }) => {
       </div>
 
       {/* Pagination */}
-      {totalPages > 1 && (
+      {(currentPage > 1 || nextCursor) && (
         <div className="pagination">
           <button
-            onClick={() => setCurrentPage(p => Math.max(1, p - 1))}
-            disabled={currentPage === 1}
+            onClick={() => loadPage(cursors.slice(0, -1))}
+            disabled={currentPage === 1 || fetching}
             className="pagination-btn"
           >
             Previous
           </button>
           
           <div className="page-numbers">
-            {Array.from({ length: totalPages }, (_, i) => i + 1)
-              .filter(page => {
-                return page === 1 || 
-                       page === totalPages || 
-                       Math.abs(page - currentPage) <= 1;
-              })
-              .map((page, index, array) => (
-                <React.Fragment key={page}>
-                  {index > 0 && array[index - 1] < page - 1 && (
-                    <span className="page-ellipsis">...</span>
-                  )}
-                  <button
-                    onClick={() => setCurrentPage(page)}
-                    className={`page-number ${currentPage === page ? 'active' : ''}`}
-                  >
-                    {page}
-                  </button>
-                </React.Fragment>
-              ))}
+            <span className="page-number active">
+              Page {currentPage} of {totalPages}
+            </span>
           </div>
           
           <button
-            onClick={() => setCurrentPage(p => Math.min(totalPages, p + 1))}
-            disabled={currentPage === totalPages}
+            onClick={() => loadPage([...cursors, nextCursor])}
+            disabled={!nextCursor || fetching}
             className="pagination-btn"
           >
             Next
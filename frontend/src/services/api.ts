@@ -25,7 +25,35 @@ import {
     success: boolean;
     user_id: string;
     journeys: JourneyRecord[];
-    count: number;
+    next_cursor: string | null;
+    page_size: number;
+    count?: number;
+  }
+
+  // Server-side history filters, e.g. { fare: '>30', ordering: '-fare' }
+  interface JourneyHistoryFilters {
+    fare?: string;
+    from_zone?: string;
+    to_zone?: string;
+    date_from?: string;
+    date_to?: string;
+    ordering?: string;
+  }
+
+  interface ZonePairTotal {
+    from_zone: string;
+    to_zone: string;
+    journey_count: number;
+    total_fare: number;
+  }
+
+  interface JourneyTotalsResponse {
+    success: boolean;
+    user_id: string;
+    period: string;
+    totals: { month: string; journey_count: number; total_fare: number; zone_pairs: ZonePairTotal[] }[];
+    journey_count: number;
+    total_fare: number;
   }
   
   /**
@@ -107,13 +135,29 @@ import {
     }
   
     /**
-     * Get complete journey history for a specific user
-     * GET /api/users/{user_id}/journeys/
+     * Get one page of a user's journey history
+     * GET /api/users/{user_id}/journeys/?fare=>30&ordering=-fare&cursor=...
+     *
+     * Filters and ordering are applied by the server. Pass the previous
+     * page's next_cursor to get the page after it; the first page also
+     * carries the number of matching journeys.
      */
-    async getUserJourneyHistory(userId: string): Promise<JourneyHistoryResponse> {
+    async getUserJourneyHistory(
+      userId: string,
+      filters: JourneyHistoryFilters = {},
+      cursor: string | null = null,
+      pageSize: number = 10
+    ): Promise<JourneyHistoryResponse> {
       try {
+        const params = this.historyParams(filters);
+        params.set('page_size', String(pageSize));
+        if (cursor) {
+          params.set('cursor', cursor);
+        } else {
+          params.set('count', 'true');
+        }
         const response = await fetch(
-          `${this.baseURL}/users/${userId}/journeys/`,
+          `${this.baseURL}/users/${userId}/journeys/?${params.toString()}`,
           {
             method: 'GET',
             headers: {
@@ -121,13 +165,13 @@ import {
             },
           }
         );
-  
-        const data: JourneyHistoryResponse = await this.handleResponse(response);
-  
+
+        const data = await this.handleResponse<JourneyHistoryResponse>(response);
+
         if (!data.success) {
           throw new Error('Failed to fetch journey history from server');
         }
-  
+
         // Ensure journeys is always an array
         return {
           ...data,
@@ -138,20 +182,78 @@ import {
         throw error;
       }
     }
+
+    /**
+     * Get a user's journey count and spend per month, with a breakdown by
+     * zone pair
+     * GET /api/users/{user_id}/totals/monthly
+     */
+    async getUserJourneyTotals(userId: string): Promise<JourneyTotalsResponse> {
+      try {
+        const response = await fetch(`${this.baseURL}/users/${userId}/totals/monthly`, {
+          method: 'GET',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+        });
+
+        return await this.handleResponse<JourneyTotalsResponse>(response);
+      } catch (error) {
+        console.error('Error fetching journey totals:', error);
+        throw error;
+      }
+    }
+
+    /**
+     * URL of the streaming CSV export of a user's journeys, with the same
+     * filters as the history (ordering does not apply: rows come oldest first)
+     * GET /api/users/{user_id}/journeys/export.csv
+     */
+    getUserJourneyExportUrl(userId: string, filters: JourneyHistoryFilters = {}): string {
+      const params = this.historyParams({ ...filters, ordering: undefined });
+      const query = params.toString();
+      return `${this.baseURL}/users/${userId}/journeys/export.csv${query ? `?${query}` : ''}`;
+    }
+
+    private historyParams(filters: JourneyHistoryFilters): URLSearchParams {
+      const params = new URLSearchParams();
+      Object.entries(filters).forEach(([key, value]) => {
+        if (value) {
+          params.set(key, value);
+        }
+      });
+      return params;
+    }
   
     /**
      * Calculate fares for a batch of journeys
      * POST /api/calculate-fare/
+     *
+     * Network failures are retried once with the same Idempotency-Key.
      */
-    async calculateFares(request: FareCalculationRequest): Promise<FareCalculationResponse> {
+    async calculateFares(
+      request: FareCalculationRequest,
+      idempotencyKey: string = crypto.randomUUID()
+    ): Promise<FareCalculationResponse> {
       try {
-        const response = await fetch(`${this.baseURL}/calculate-fare/`, {
+        // Every attempt sends the same Idempotency-Key, so a retry after a
+        // lost response replays the first result instead of recording the
+        // journeys twice
+        const send = () => fetch(`${this.baseURL}/calculate-fare/`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey,
           },
           body: JSON.stringify(request),
         });
+
+        let response: Response;
+        try {
+          response = await send();
+        } catch {
+          response = await send();
+        }
   
         const data: FareCalculationResponse = await response.json();
   